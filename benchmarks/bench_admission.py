@@ -0,0 +1,142 @@
+"""
+Goodput and tail latency of /chat under overload, with and without admission control.
+
+The model is a stub with finite capacity, like a Vertex AI quota: a call takes
+LLM_LATENCY while at most LLM_CAPACITY calls are in flight, and proportionally
+longer beyond that (the calls share the capacity). Requests arrive open-loop
+(Poisson) over ASGI at multiples of what the model can serve, for DURATION
+seconds per row. A response is good if it is a 200 within CLIENT_TIMEOUT, the
+deadline the caller (or Cloud Run) gives up at. p99 is over the 200s.
+
+The second table has a "bulk" caller sending most of the overload and a "chat"
+caller sending a fraction of capacity, and reports each caller's good share.
+
+    PYTHONPATH=src python benchmarks/bench_admission.py
+"""
+
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+os.environ.setdefault("AUTH_TOKEN", "bench-token")
+
+import httpx
+from langgraph.checkpoint.memory import MemorySaver
+
+import main as app_module
+from admission import AdmissionController, AIMDLimit
+from agent_service import AgentService
+from db_pool import percentile
+from tests.fakes import FakeChatModel
+
+LLM_LATENCY = 0.2
+LLM_CAPACITY = 10
+CAPACITY = LLM_CAPACITY / LLM_LATENCY
+CLIENT_TIMEOUT = 2.0
+DURATION = 8.0
+
+
+# Model calls in flight, across all copies of the model
+inflight = 0
+
+
+class SaturatingChatModel(FakeChatModel):
+    """FakeChatModel whose calls slow down in proportion to how far past capacity the model is."""
+
+    base_latency: float = LLM_LATENCY
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        global inflight
+        inflight += 1
+        try:
+            await asyncio.sleep(self.base_latency * max(1.0, inflight / LLM_CAPACITY))
+            return await super()._agenerate(messages, stop, run_manager, **kwargs)
+        finally:
+            inflight -= 1
+
+
+def make_service(admission) -> AgentService:
+    llm = SaturatingChatModel()
+    service = AgentService(
+        project_id="bench", search_service_url="http://127.0.0.1:9", llm=llm, checkpointer=MemorySaver()
+    )
+    service.admission = admission
+    return service
+
+
+def make_admission() -> AdmissionController:
+    return AdmissionController(
+        AIMDLimit(initial=LLM_CAPACITY, latency_target=3 * LLM_LATENCY),
+        max_queue=2 * LLM_CAPACITY,
+        queue_timeout=CLIENT_TIMEOUT - 4 * LLM_LATENCY,
+    )
+
+
+async def drive(rates: dict) -> dict:
+    """Send requests for each caller at its rate (per second); returns caller -> [(status, seconds)]."""
+    results = {caller: [] for caller in rates}
+    transport = httpx.ASGITransport(app=app_module.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        async def one(caller: str, i: int) -> None:
+            started_at = time.perf_counter()
+            response = await client.post("/chat", json={"message": "Hello", "thread_id": f"{caller}:{i}"})
+            results[caller].append((response.status_code, time.perf_counter() - started_at))
+
+        async def arrivals(caller: str, rate: float, rng: random.Random) -> list:
+            tasks, i = [], 0
+            end = time.perf_counter() + DURATION
+            while time.perf_counter() < end:
+                tasks.append(asyncio.ensure_future(one(caller, i)))
+                i += 1
+                await asyncio.sleep(rng.expovariate(rate))
+            return tasks
+
+        task_lists = await asyncio.gather(*[
+            arrivals(caller, rate, random.Random(n)) for n, (caller, rate) in enumerate(rates.items())
+        ])
+        await asyncio.gather(*[t for tasks in task_lists for t in tasks])
+    return results
+
+
+def summarize(samples: list) -> dict:
+    ok = [seconds for status, seconds in samples if status == 200]
+    good = [seconds for seconds in ok if seconds <= CLIENT_TIMEOUT]
+    return {
+        "sent": len(samples),
+        "good": len(good),
+        "shed": sum(status in (429, 503) for status, _ in samples),
+        "p99": percentile(ok, 0.99) if ok else 0.0,
+    }
+
+
+def run(admission, rates: dict) -> dict:
+    app_module.agent_service = make_service(admission)
+    return {caller: summarize(samples) for caller, samples in asyncio.run(drive(rates)).items()}
+
+
+def main():
+    print(f"Model capacity {CAPACITY:.0f} turns/s ({LLM_CAPACITY} calls of {LLM_LATENCY * 1000:.0f} ms), "
+          f"client timeout {CLIENT_TIMEOUT:.0f}s, {DURATION:.0f}s per row")
+    print(f"{'load':>5} {'admission':<10} {'offered/s':>9} {'goodput/s':>9} {'good %':>7} {'shed':>6} {'p99 s':>7}")
+    for load in (0.5, 1.0, 2.0, 4.0):
+        for name, admission in (("off", None), ("on", make_admission())):
+            row = run(admission, {"caller": load * CAPACITY})["caller"]
+            limit = f" (limit {admission.limit.limit:.0f})" if admission else ""
+            print(f"{load:>4.1f}x {name:<10} {row['sent'] / DURATION:>9.1f} {row['good'] / DURATION:>9.1f} "
+                  f"{row['good'] / row['sent']:>7.0%} {row['shed']:>6} {row['p99']:>7.2f}{limit}")
+
+    rates = {"bulk": 3.0 * CAPACITY, "chat": 0.2 * CAPACITY}
+    print(f"\nTwo callers: bulk {rates['bulk']:.0f}/s, chat {rates['chat']:.0f}/s")
+    print(f"{'admission':<10} {'caller':<6} {'good %':>7} {'shed':>6} {'p99 s':>7}")
+    for name, admission in (("off", None), ("on", make_admission())):
+        for caller, row in run(admission, rates).items():
+            print(f"{name:<10} {caller:<6} {row['good'] / row['sent']:>7.0%} {row['shed']:>6} {row['p99']:>7.2f}")
+
+
+if __name__ == "__main__":
+    main()
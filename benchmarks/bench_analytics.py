@@ -0,0 +1,112 @@
+"""
+Chat latency with conversation analytics written inline vs through the batched pipeline.
+
+"inline" logs each turn the way `utilities.insert_rows` would: a new client, then
+one blocking insert, inside the turn. "pipeline" queues the event for
+`AnalyticsPipeline`, whose worker writes batches on one reused client. The fake
+BigQuery takes CLIENT_SETUP to make a client and INSERT_LATENCY (plus a little
+per row) per insert call. The "stalled" row makes every insert take STALL seconds
+with a small queue, to show events dropped rather than turns slowed.
+
+    PYTHONPATH=src python benchmarks/bench_analytics.py
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+os.environ.setdefault("AUTH_TOKEN", "bench-token")
+
+from analytics import AnalyticsPipeline, BigQuerySink
+from db_pool import percentile
+from tests.fakes import make_agent_service
+
+TURNS = 400
+CONCURRENCY = 16
+LLM_LATENCY = 0.02
+CLIENT_SETUP = 0.03
+INSERT_LATENCY = 0.08
+STALL = 2.0
+
+
+class FakeBigQuery:
+    """Blocking client with BigQuery-like round trips; counts what it was asked to do."""
+
+    created = 0
+    inserts = 0
+    rows = 0
+
+    def __init__(self, latency: float = INSERT_LATENCY):
+        time.sleep(CLIENT_SETUP)
+        FakeBigQuery.created += 1
+        self.latency = latency
+
+    def insert_rows_json(self, table, rows, row_ids=None):
+        time.sleep(self.latency + 0.0001 * len(rows))
+        FakeBigQuery.inserts += 1
+        FakeBigQuery.rows += len(rows)
+        return []
+
+    def close(self):
+        pass
+
+
+class InlineInserts:
+    """Per-turn `insert_rows`: a fresh client and a blocking insert in the request path."""
+
+    def emit(self, event: dict) -> bool:
+        BigQuerySink("project", "analytics", "chat_events", client_factory=FakeBigQuery).write([event])
+        return True
+
+
+async def run_turns(service) -> list:
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+    latencies = []
+
+    async def one(i: int) -> None:
+        async with semaphore:
+            started_at = time.perf_counter()
+            await service.achat(f"Hello {i}", f"thread-{i % 100}")
+            latencies.append(time.perf_counter() - started_at)
+
+    await asyncio.gather(*[one(i) for i in range(TURNS)])
+    return latencies
+
+
+def measure(name: str, analytics) -> None:
+    FakeBigQuery.created = FakeBigQuery.inserts = FakeBigQuery.rows = 0
+    service = make_agent_service(latency=LLM_LATENCY)
+    service.analytics = analytics
+    started_at = time.perf_counter()
+    latencies = asyncio.run(run_turns(service))
+    elapsed = time.perf_counter() - started_at
+    dropped = 0
+    if isinstance(analytics, AnalyticsPipeline):
+        analytics.close()
+        dropped = analytics.get_stats()["dropped"]
+    print(f"{name:<10} {1000 * percentile(latencies, 0.5):>7.1f} {1000 * percentile(latencies, 0.99):>7.1f} "
+          f"{TURNS / elapsed:>7.1f} {FakeBigQuery.created:>8} {FakeBigQuery.inserts:>8} {FakeBigQuery.rows:>6} {dropped:>8}")
+
+
+def main():
+    print(f"{TURNS} turns, {CONCURRENCY} at a time, model {LLM_LATENCY * 1000:.0f} ms, "
+          f"insert {INSERT_LATENCY * 1000:.0f} ms + client {CLIENT_SETUP * 1000:.0f} ms")
+    print(f"{'analytics':<10} {'p50 ms':>7} {'p99 ms':>7} {'turns/s':>7} {'clients':>8} {'inserts':>8} {'rows':>6} {'dropped':>8}")
+    measure("none", None)
+    measure("inline", InlineInserts())
+    measure("pipeline", AnalyticsPipeline(
+        BigQuerySink("project", "analytics", "chat_events", client_factory=FakeBigQuery),
+        batch_size=100, flush_interval=0.5,
+    ))
+    measure("stalled", AnalyticsPipeline(
+        BigQuerySink("project", "analytics", "chat_events", client_factory=lambda: FakeBigQuery(STALL)),
+        max_queue=50, batch_size=20, flush_interval=0.5, close_timeout=STALL + 1,
+    ))
+
+
+if __name__ == "__main__":
+    main()
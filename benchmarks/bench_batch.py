@@ -0,0 +1,97 @@
+"""
+Throughput of `/chat/batch` against sending the same conversations one `/chat` call at a time.
+
+Runs `main.app` over ASGI with the real graph, a fake LLM that searches for the user's
+message, an in-memory checkpointer and a local stub search server. The batch repeats
+a small set of topics, as evaluation and backfill batches do, so identical searches
+can be shared. The search cache is disabled to isolate the batch's own dedup.
+
+    PYTHONPATH=src python benchmarks/bench_batch.py
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+os.environ.setdefault("SEARCH_CACHE_ENABLED", "false")
+os.environ.setdefault("AUTH_TOKEN", "bench-token")
+
+import httpx
+from langgraph.checkpoint.memory import MemorySaver
+
+import main as app_module
+from agent_service import AgentService
+from tests.fakes import FakeChatModel, StubSearchServer
+
+LLM_LATENCY = 0.2
+SEARCH_LATENCY = 0.1
+CONVERSATIONS = 200
+TOPICS = 20
+
+
+async def one_by_one(client: httpx.AsyncClient, items: list) -> None:
+    for item in items:
+        response = await client.post("/chat", json=item)
+        response.raise_for_status()
+
+
+async def batch(client: httpx.AsyncClient, items: list, stream: bool) -> None:
+    if not stream:
+        response = await client.post("/chat/batch", json={"items": items})
+        response.raise_for_status()
+        assert len(response.json()["results"]) == len(items)
+        return
+
+    async with client.stream("POST", "/chat/batch", json={"items": items, "stream": True}) as response:
+        response.raise_for_status()
+        lines = [line async for line in response.aiter_lines() if line]
+    assert len(lines) == len(items)
+
+
+async def run(mode: str, server: StubSearchServer, conversations: int) -> tuple:
+    app_module.agent_service = AgentService(
+        project_id="bench",
+        search_service_url=server.url,
+        llm=FakeChatModel(latency=LLM_LATENCY, search_query="{message}"),
+        checkpointer=MemorySaver()
+    )
+    items = [
+        {"thread_id": f"{mode}-{i}", "message": f"Tell me about topic {i % TOPICS}"}
+        for i in range(conversations)
+    ]
+    searches_before = server.request_count
+
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app_module.app), base_url="http://bench", timeout=None
+    ) as client:
+        start = time.perf_counter()
+        if mode == "one-by-one /chat":
+            await one_by_one(client, items)
+        else:
+            await batch(client, items, stream=mode == "/chat/batch stream")
+        elapsed = time.perf_counter() - start
+
+    await app_module.agent_service.search_client.aclose()
+    return elapsed, server.request_count - searches_before
+
+
+def main():
+    print(f"{CONVERSATIONS} conversations over {TOPICS} topics, LLM latency {LLM_LATENCY}s, "
+          f"search latency {SEARCH_LATENCY}s, batch concurrency {os.getenv('CHAT_BATCH_CONCURRENCY', '16')}")
+    print(f"{'mode':<22} {'seconds':>9} {'conv/s':>9} {'searches':>9}")
+
+    with StubSearchServer(latency=SEARCH_LATENCY) as server:
+        for mode in ("one-by-one /chat", "/chat/batch", "/chat/batch stream"):
+            # One-by-one is slow; time a slice of it and scale its throughput
+            conversations = 20 if mode == "one-by-one /chat" else CONVERSATIONS
+            elapsed, searches = asyncio.run(run(mode, server, conversations))
+            print(f"{mode:<22} {elapsed:>9.2f} {conversations / elapsed:>9.1f} {searches:>9}"
+                  f"{f'  ({conversations} conversations)' if conversations != CONVERSATIONS else ''}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Checkpoint size and serialization time: LangGraph's default msgpack vs CompactSerializer,
+with and without DedupingCheckpointer's tool-result references.
+
+Runs 50-turn threads through the real graph with a fake LLM and a stub search
+service whose hits are drawn from a small corpus of book passages, so later
+searches return passages earlier ones did, as they do for a reader asking about
+one book. Every checkpoint the threads wrote is then encoded and decoded with each
+serializer. "+ refs" rows first replace tool results by references, as
+DedupingCheckpointer does, and count each payload's bytes once per thread on top
+of the rows ("payload KB"); their times include hashing and resolving the payloads.
+Context packing is off, so tool results stay in the history as the model saw them.
+
+    PYTHONPATH=src python benchmarks/bench_checkpoint_serde.py
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+os.environ.setdefault("AUTH_TOKEN", "bench-token")
+os.environ["CONTEXT_PACKING_ENABLED"] = "false"
+
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+from checkpoint_serde import CompactSerializer, externalize_payloads, payload_refs, resolve_payloads
+from db_pool import percentile
+from tests.fakes import StubSearchServer, make_agent_service
+
+CORPUS_SIZE = 60
+# search_knowledge asks for 3 hits
+HITS_PER_SEARCH = 3
+WORDS = ("attention practice habit craft noticing focus work creative silence routine "
+         "community source ideas patience editing discipline curiosity rest doubt play").split()
+
+
+def make_vocabulary(rng: random.Random, size: int = 3000) -> list:
+    # Made-up words of English-like lengths, so passages compress about as well as prose
+    letters = "etaoinshrdlcumwfgypbvkjxqz"
+    weights = [26 - i for i in range(26)]
+    return ["".join(rng.choices(letters, weights, k=rng.randint(2, 9))) for _ in range(size)]
+
+
+def make_corpus(seed: int = 7) -> list:
+    rng = random.Random(seed)
+    vocabulary = make_vocabulary(rng)
+    # Zipf-like word frequencies
+    weights = [1 / (rank + 1) for rank in range(len(vocabulary))]
+    return [
+        {
+            "book_id": rng.choice(["the-creative-act", "deep-work", "the-network-state"]),
+            "page_number": rng.randint(1, 300),
+            "content": " ".join(rng.choices(vocabulary, weights, k=rng.randint(80, 160))).capitalize() + ".",
+        }
+        for _ in range(CORPUS_SIZE)
+    ]
+
+
+def collect_checkpoints(threads: int, turns: int) -> list:
+    corpus = make_corpus()
+
+    def results(query: str) -> list:
+        # A thread keeps coming back to the same part of the corpus
+        rng = random.Random(query)
+        start = int(query.split()[-1]) * 7 % CORPUS_SIZE
+        return [corpus[(start + rng.randint(0, 14)) % CORPUS_SIZE] for _ in range(HITS_PER_SEARCH)]
+
+    checkpoints = []
+    with StubSearchServer(results=lambda q: results(q)) as server:
+        service = make_agent_service(
+            server.url, search_query="{message}", answer=" ".join(WORDS * 4).capitalize() + "."
+        )
+        for thread in range(threads):
+            for turn in range(turns):
+                service.chat(f"Question {turn} about part {thread}", f"bench-{thread}")
+            config = {"configurable": {"thread_id": f"bench-{thread}"}}
+            checkpoints += [(thread, saved.checkpoint) for saved in service._checkpointer.list(config)]
+    return checkpoints
+
+
+def measure(serde, checkpoints: list, min_size=None) -> dict:
+    """Sizes and times for `checkpoints`; with `min_size`, tool results that long are stored once per thread."""
+    sizes, encode, decode = [], [], []
+    # (thread, digest) -> payload, as a PayloadStore would hold them
+    payloads = {}
+    for thread, checkpoint in checkpoints:
+        started_at = time.perf_counter()
+        if min_size is not None:
+            checkpoint, new = externalize_payloads(checkpoint, min_size)
+            payloads.update({(thread, digest): content for digest, content in new.items()})
+        typed = serde.dumps_typed(checkpoint)
+        encode.append(time.perf_counter() - started_at)
+        started_at = time.perf_counter()
+        loaded = serde.loads_typed(typed)
+        if min_size is not None:
+            resolve_payloads(loaded, {d: payloads[(thread, d)] for d in payload_refs(loaded)})
+        decode.append(time.perf_counter() - started_at)
+        sizes.append(len(typed[1]))
+    payload_bytes = sum(len(content.encode()) for content in payloads.values())
+    return {
+        "mean_bytes": sum(sizes) / len(sizes),
+        "max_bytes": max(sizes),
+        "payload_bytes": payload_bytes,
+        "total_bytes": sum(sizes) + payload_bytes,
+        "encode_us": 1e6 * percentile(encode, 0.5),
+        "decode_us": 1e6 * percentile(decode, 0.5),
+        "encode_p95_us": 1e6 * percentile(encode, 0.95),
+    }
+
+
+def main(threads: int, turns: int):
+    checkpoints = collect_checkpoints(threads, turns)
+    print(f"{len(checkpoints)} checkpoints from {threads} threads x {turns} search turns, "
+          f"{HITS_PER_SEARCH} hits per search from {CORPUS_SIZE} passages")
+    print(f"{'':<16} {'mean B':>9} {'max B':>9} {'payload KB':>11} {'total KB':>9} {'ratio':>6} "
+          f"{'enc p50 us':>11} {'enc p95 us':>11} {'dec p50 us':>11}")
+
+    baseline = None
+    for name, serde, min_size in [
+        ("msgpack", JsonPlusSerializer(), None),
+        ("msgpack + refs", JsonPlusSerializer(), 512),
+        ("zstd 1", CompactSerializer(level=1), None),
+        ("zstd 3", CompactSerializer(level=3), None),
+        ("zstd 3 + refs", CompactSerializer(level=3), 512),
+        ("zstd 9", CompactSerializer(level=9), None),
+    ]:
+        row = measure(serde, checkpoints, min_size)
+        baseline = baseline or row["total_bytes"]
+        print(f"{name:<16} {row['mean_bytes']:>9.0f} {row['max_bytes']:>9} {row['payload_bytes'] / 1024:>11.0f} "
+              f"{row['total_bytes'] / 1024:>9.0f} {baseline / row['total_bytes']:>5.1f}x {row['encode_us']:>11.0f} "
+              f"{row['encode_p95_us']:>11.0f} {row['decode_us']:>11.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, default=3)
+    parser.add_argument("--turns", type=int, default=50)
+    args = parser.parse_args()
+    main(args.threads, args.turns)
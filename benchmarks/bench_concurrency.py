@@ -0,0 +1,72 @@
+"""
+Concurrency scaling of the chat path: sync `chat` behind the FastAPI threadpool vs `achat`.
+
+Runs the real AgentService graph with a fake LLM (fixed latency per call), an
+in-memory checkpointer and a local stub search server, so only the serving
+model is being measured.
+
+    PYTHONPATH=src python benchmarks/bench_concurrency.py
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+import anyio.to_thread
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from langgraph.checkpoint.memory import MemorySaver
+
+from agent_service import AgentService
+from tests.fakes import FakeChatModel, StubSearchServer
+
+LLM_LATENCY = 0.2
+SEARCH_LATENCY = 0.1
+CONCURRENCY_LEVELS = [1, 10, 50, 100, 200, 400]
+
+
+async def run_level(service: AgentService, concurrency: int, use_async: bool) -> float:
+    async def one(i: int) -> str:
+        thread_id = f"bench-{use_async}-{concurrency}-{i}"
+        if use_async:
+            return await service.achat("I'm feeling stuck on a project", thread_id)
+        # Same path a sync `def` FastAPI handler takes: starlette's threadpool
+        return await anyio.to_thread.run_sync(service.chat, "I'm feeling stuck on a project", thread_id)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[one(i) for i in range(concurrency)])
+    return time.perf_counter() - start
+
+
+def main():
+    os.environ.setdefault("AUTH_TOKEN", "bench-token")
+    # Measure the serving path, not the search cache
+    os.environ.setdefault("SEARCH_CACHE_ENABLED", "false")
+
+    with StubSearchServer(latency=SEARCH_LATENCY) as server:
+        scenarios = {
+            "plain turn (1 LLM call)": None,
+            "knowledge turn (2 LLM calls + search)": "creative blocks problem solving motivation",
+        }
+        for name, search_query in scenarios.items():
+            service = AgentService(
+                project_id="bench",
+                search_service_url=server.url,
+                llm=FakeChatModel(latency=LLM_LATENCY, search_query=search_query),
+                checkpointer=MemorySaver()
+            )
+
+            print(f"\n{name}: LLM latency {LLM_LATENCY}s, search latency {SEARCH_LATENCY}s")
+            print(f"{'concurrency':>12} {'sync s':>10} {'sync req/s':>12} {'async s':>10} {'async req/s':>12}")
+            for concurrency in CONCURRENCY_LEVELS:
+                sync_elapsed = asyncio.run(run_level(service, concurrency, use_async=False))
+                async_elapsed = asyncio.run(run_level(service, concurrency, use_async=True))
+                print(f"{concurrency:>12} {sync_elapsed:>10.2f} {concurrency / sync_elapsed:>12.1f} "
+                      f"{async_elapsed:>10.2f} {concurrency / async_elapsed:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
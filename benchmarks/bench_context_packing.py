@@ -0,0 +1,103 @@
+"""
+Prompt tokens and model latency per turn, with search results packed or passed through whole.
+
+A conversation of TURNS turns runs on the real graph, every turn asking a
+`search_knowledge` question whose stub search service returns HITS passages of
+prose from a synthetic corpus (some of them overlapping chunks of the same page).
+The fake model's latency grows with its prompt (LLM_LATENCY plus
+LATENCY_PER_TOKEN per prompt token), like Gemini's time to first token. "before"
+turns context packing off; history management is on in both.
+
+    PYTHONPATH=src python benchmarks/bench_context_packing.py
+"""
+
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+os.environ.setdefault("AUTH_TOKEN", "bench-token")
+os.environ.setdefault("SEARCH_CACHE_ENABLED", "false")
+
+from langchain_core.messages.utils import count_tokens_approximately
+
+from db_pool import percentile
+from tests.fakes import StubSearchServer, make_agent_service, passage_query, synthetic_corpus
+
+TURNS = 8
+CONVERSATIONS = 5
+HITS = 5
+LLM_LATENCY = 0.3
+LATENCY_PER_TOKEN = 0.0001
+
+
+def prose(passage: dict, rng: random.Random) -> dict:
+    """The passage's words as sentences of 8 to 20 words."""
+    words, sentences = passage["content"].split(), []
+    while words:
+        size = rng.randint(8, 20)
+        sentence, words = words[:size], words[size:]
+        sentences.append(" ".join(sentence).capitalize() + ".")
+    return dict(passage, content=" ".join(sentences))
+
+
+def make_search(corpus: list, rng: random.Random):
+    by_query = {}
+
+    def results(query: str) -> list:
+        if query not in by_query:
+            hits = [prose(p, rng) for p in rng.sample(corpus, HITS - 1)]
+            # The search index chunks pages with overlap: the same page comes back twice
+            overlap = dict(hits[0], content=hits[0]["content"][len(hits[0]["content"]) // 2:])
+            by_query[query] = hits[:2] + [overlap] + hits[2:]
+        return by_query[query]
+
+    return results
+
+
+def run(packing: bool, corpus: list, questions: list) -> dict:
+    os.environ["CONTEXT_PACKING_ENABLED"] = "true" if packing else "false"
+    prompt_tokens = {turn: [] for turn in range(TURNS)}
+    latencies, tool_tokens = [], []
+    with StubSearchServer(results=make_search(corpus, random.Random(1))) as server:
+        for conversation in range(CONVERSATIONS):
+            service = make_agent_service(
+                server.url, search_query="{message}", latency=LLM_LATENCY, latency_per_token=LATENCY_PER_TOKEN
+            )
+            for turn in range(TURNS):
+                calls_before = service.llm.call_count
+                started_at = time.perf_counter()
+                asyncio.run(service.achat(questions[conversation][turn], f"thread-{conversation}"))
+                latencies.append(time.perf_counter() - started_at)
+                calls = service.llm.calls[calls_before:]
+                prompt_tokens[turn].append(sum(count_tokens_approximately(messages) for messages in calls))
+                # The search results the answering call saw for this turn
+                tool_tokens.append(count_tokens_approximately(calls[-1][-1:]))
+    return {"prompt_tokens": prompt_tokens, "latencies": latencies, "tool_tokens": tool_tokens}
+
+
+def main():
+    corpus = synthetic_corpus(2000, seed=5)
+    rng = random.Random(2)
+    questions = [[passage_query(p, rng) for p in rng.sample(corpus, TURNS)] for _ in range(CONVERSATIONS)]
+
+    print(f"{CONVERSATIONS} conversations of {TURNS} turns, {HITS} hits per search, "
+          f"model {LLM_LATENCY * 1000:.0f} ms + {LATENCY_PER_TOKEN * 1e6:.0f} us per prompt token")
+    print(f"{'':<8} {'results tok':>11} {'turn 1 tok':>10} {'turn 8 tok':>10} {'mean tok':>9} "
+          f"{'mean ms':>8} {'p95 ms':>7}")
+    for name, packing in (("before", False), ("after", True)):
+        row = run(packing, corpus, questions)
+        tokens = row["prompt_tokens"]
+        mean = sum(sum(v) for v in tokens.values()) / sum(len(v) for v in tokens.values())
+        print(f"{name:<8} {sum(row['tool_tokens']) / len(row['tool_tokens']):>11.0f} "
+              f"{sum(tokens[0]) / len(tokens[0]):>10.0f} {sum(tokens[TURNS - 1]) / len(tokens[TURNS - 1]):>10.0f} "
+              f"{mean:>9.0f} {1000 * sum(row['latencies']) / len(row['latencies']):>8.0f} "
+              f"{1000 * percentile(row['latencies'], 0.95):>7.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Per-turn latency and model input size over a 200-turn synthetic thread, with and
+without the history manager.
+
+The fake LLM's latency grows with prompt size (LATENCY_PER_TOKEN), like Vertex's
+does, and every turn runs a knowledge search against the local stub server.
+
+    PYTHONPATH=src python benchmarks/bench_history.py
+"""
+
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from langchain_core.messages.utils import count_tokens_approximately
+
+from tests.fakes import StubSearchServer, make_agent_service
+
+TURNS = 200
+WINDOW = 50
+LATENCY = 0.005
+LATENCY_PER_TOKEN = 0.00001
+
+
+async def run_thread(service) -> list:
+    samples = []
+    for i in range(TURNS):
+        message = f"Turn {i}: I've been thinking about focus and creativity, " + "and what it means " * 5
+        start = time.perf_counter()
+        await service.achat(message, "bench-history")
+        elapsed = time.perf_counter() - start
+        samples.append((elapsed, count_tokens_approximately(service.llm.last_messages)))
+    return samples
+
+
+def main():
+    os.environ.setdefault("AUTH_TOKEN", "bench-token")
+    os.environ.setdefault("SEARCH_CACHE_ENABLED", "false")
+
+    results = {}
+    with StubSearchServer() as server:
+        for enabled in ("false", "true"):
+            os.environ["HISTORY_ENABLED"] = enabled
+            service = make_agent_service(
+                server.url,
+                latency=LATENCY,
+                latency_per_token=LATENCY_PER_TOKEN,
+                search_query="focus creativity",
+            )
+            results[enabled] = asyncio.run(run_thread(service))
+
+    print(f"{TURNS}-turn thread, LLM latency {LATENCY * 1000:.0f} ms + {LATENCY_PER_TOKEN * 1e6:.0f} ms per 1k prompt tokens")
+    print(f"{'turns':>10} {'no history mgr ms':>18} {'tokens':>8} {'history mgr ms':>16} {'tokens':>8}")
+    for start in range(0, TURNS, WINDOW):
+        row = []
+        for enabled in ("false", "true"):
+            window = results[enabled][start:start + WINDOW]
+            row.append(statistics.median(s[0] for s in window) * 1000)
+            row.append(max(s[1] for s in window))
+        print(f"{start + 1:>4}-{start + WINDOW:<5} {row[0]:>18.1f} {row[1]:>8} {row[2]:>16.1f} {row[3]:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Latency and recall of the local knowledge index against brute-force search of the full corpus.
+
+The first table times the vectorized top-k against scoring a snapshot's passages
+one at a time, and checks they agree. For the second, the "search service" is a
+stub that ranks the whole synthetic corpus exactly (the brute force) and answers
+after SEARCH_LATENCY, like the cross-service call. The local index holds a
+snapshot of the passages the service returned most often while warming up.
+Readers ask about popular passages far more than others (Zipf), with a few of
+each passage's words as the query. Recall@1 is how often a search returned the
+brute force's best passage, recall@3 the share of its top 3 returned; "local r@1"
+is recall@1 of the searches the index answered itself.
+
+    PYTHONPATH=src python benchmarks/bench_knowledge_index.py
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+os.environ.setdefault("AUTH_TOKEN", "bench-token")
+
+import numpy as np
+
+from db_pool import percentile
+from knowledge_index import HashingEmbedder, KnowledgeIndex, hit_key
+from tests.fakes import StubSearchServer, passage_query, synthetic_corpus
+from tool_search import SearchClient, fetch_results
+
+SEARCH_LATENCY = 0.08
+LIMIT = 3
+
+
+class BruteForce:
+    """Exact top-k over the full corpus: the search service's answers."""
+
+    def __init__(self, corpus: list):
+        self.corpus = corpus
+        self.embed = HashingEmbedder()
+        texts = [p["content"] for p in corpus]
+        self.weights = self.embed.idf(texts)
+        self.matrix = self.embed(texts, self.weights)
+
+    def __call__(self, query: str) -> list:
+        scores = self.matrix @ self.embed([query], self.weights)[0]
+        return [self.corpus[i] for i in np.argsort(scores)[::-1][:LIMIT]]
+
+
+def make_queries(corpus: list, count: int, seed: int) -> list:
+    rng = random.Random(seed)
+    popularity = [1 / (rank + 1) ** 1.1 for rank in range(len(corpus))]
+    return [passage_query(p, rng) for p in rng.choices(corpus, popularity, k=count)]
+
+
+def recall(results: list, expected: list) -> float:
+    found = {hit_key(hit) for hit in results}
+    return sum(hit_key(hit) in found for hit in expected) / len(expected)
+
+
+def scan(index: KnowledgeIndex, query: str) -> list:
+    """Brute force over the same snapshot: score passages one at a time, sort everything."""
+    snapshot = index._snapshot
+    query_vector = index.embed([query], snapshot.weights)[0]
+    scores = [float(np.dot(row, query_vector)) for row in snapshot.matrix]
+    ranked = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)
+    return [snapshot.passages[i] for i in ranked[:LIMIT]]
+
+
+def top_k_latency(corpus: list, queries: list, sizes: list) -> None:
+    print(f"\nTop-{LIMIT} over a snapshot: vectorized vs one passage at a time")
+    print(f"{'passages':>9} {'p50 us':>8} {'p99 us':>8} {'scan p50 us':>12} {'recall@3':>9}")
+    for size in sizes:
+        index = KnowledgeIndex(min_score=0.0, max_passages=size, load_rows=lambda: corpus[:size])
+        index.refresh()
+        latencies, scan_latencies, recalls = [], [], []
+        for query in queries:
+            started_at = time.perf_counter()
+            results = index.search(query, LIMIT)
+            latencies.append(time.perf_counter() - started_at)
+            started_at = time.perf_counter()
+            expected = scan(index, query)
+            scan_latencies.append(time.perf_counter() - started_at)
+            recalls.append(recall(results, expected))
+        print(f"{size:>9} {1e6 * percentile(latencies, 0.5):>8.0f} {1e6 * percentile(latencies, 0.99):>8.0f} "
+              f"{1e6 * percentile(scan_latencies, 0.5):>12.0f} {sum(recalls) / len(recalls):>9.3f}")
+
+
+async def end_to_end(brute_force: BruteForce, url: str, warmup: list, queries: list,
+                     snapshot_size: int, min_score) -> dict:
+    client = SearchClient(url)
+    index = None
+    if min_score is not None:
+        index = KnowledgeIndex(min_score=min_score, max_passages=snapshot_size, refresh_interval=3600)
+        for query in warmup:
+            index.record(brute_force(query))
+        index.refresh()
+
+    latencies, recalls, best, local_best = [], [], [], []
+    for query in queries:
+        local_hits = index.local_hits if index else 0
+        started_at = time.perf_counter()
+        results = await fetch_results(client, None, query, index)
+        latencies.append(time.perf_counter() - started_at)
+        expected = brute_force(query)
+        recalls.append(recall(results, expected))
+        best.append(recall(results, expected[:1]))
+        if index and index.local_hits > local_hits:
+            local_best.append(best[-1])
+    await client.aclose()
+    return {
+        "local": index.get_stats()["local_hits"] / len(queries) if index else 0.0,
+        "recall_1": sum(best) / len(best),
+        "local_recall_1": sum(local_best) / len(local_best) if local_best else float("nan"),
+        "recall": sum(recalls) / len(recalls),
+        "mean_ms": 1000 * sum(latencies) / len(latencies),
+        "p50_ms": 1000 * percentile(latencies, 0.5),
+        "p95_ms": 1000 * percentile(latencies, 0.95),
+    }
+
+
+def main(corpus_size: int, snapshot_size: int, queries: int):
+    corpus = synthetic_corpus(corpus_size, seed=11)
+    brute_force = BruteForce(corpus)
+    top_k_latency(corpus, make_queries(corpus, 100, seed=1),
+                  [size for size in (1000, 5000, 20000) if size <= corpus_size])
+
+    warmup, measured = make_queries(corpus, 3 * queries, seed=2), make_queries(corpus, queries, seed=3)
+    print(f"\n{queries} searches, search service {SEARCH_LATENCY * 1000:.0f} ms, "
+          f"snapshot of the {snapshot_size} most-hit passages")
+    print(f"{'min_score':<14} {'local':>6} {'local r@1':>9} {'recall@1':>9} {'recall@3':>9} "
+          f"{'mean ms':>8} {'p50 ms':>7} {'p95 ms':>7}")
+    with StubSearchServer(latency=SEARCH_LATENCY, results=brute_force) as server:
+        for min_score in (None, 0.8, 0.9, 0.95, 1.0):
+            row = asyncio.run(end_to_end(brute_force, server.url, warmup, measured, snapshot_size, min_score))
+            name = "remote only" if min_score is None else f"{min_score}"
+            print(f"{name:<14} {row['local']:>6.0%} {row['local_recall_1']:>9.3f} {row['recall_1']:>9.3f} "
+                  f"{row['recall']:>9.3f} {row['mean_ms']:>8.1f} {row['p50_ms']:>7.1f} {row['p95_ms']:>7.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", type=int, default=20000)
+    parser.add_argument("--snapshot", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=300)
+    args = parser.parse_args()
+    main(args.corpus, args.snapshot, args.queries)
@@ -0,0 +1,225 @@
+"""
+Offline load test of the chat path, for tracking throughput and latency across changes.
+
+Drives the real graph with a fake LLM and a local stub search server, either through
+`main.app` over ASGI (`--target http`, the default) or by calling `AgentService.achat`
+directly (`--target service`). Checkpoints go to an in-memory saver, or to a local
+Postgres with `--database-url postgresql+asyncpg://...`.
+
+Each concurrency level is a closed loop: `concurrency` workers send requests back to
+back until `--requests` (at least 4 per worker) have completed. Every scenario/level
+reports p50/p95/p99 latency and requests/sec.
+
+    PYTHONPATH=src python benchmarks/bench_load.py --output results/baseline.json
+    PYTHONPATH=src python benchmarks/bench_load.py --output results/new.json --compare results/baseline.json
+
+With `--compare`, exits non-zero if any row lost more than `--tolerance` of its
+throughput or grew its p95 by more than that.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+# Measure the serving path, not the search cache
+os.environ.setdefault("SEARCH_CACHE_ENABLED", "false")
+os.environ.setdefault("AUTH_TOKEN", "bench-token")
+
+import httpx
+from langgraph.checkpoint.memory import MemorySaver
+
+import main as app_module
+from agent_service import AgentService
+from db_pool import percentile
+from tests.fakes import FakeChatModel, StubSearchServer
+
+LLM_LATENCY = 0.2
+SEARCH_LATENCY = 0.1
+CONCURRENCY_LEVELS = [1, 10, 50, 100]
+
+SCENARIOS = {
+    # name: (search query the fake model asks for, turns sent to each thread)
+    "plain": (None, 1),
+    "knowledge": ("creative blocks problem solving motivation", 1),
+    "multi_turn": (None, 5),
+}
+
+
+async def make_checkpointer(database_url):
+    if not database_url:
+        return MemorySaver(), None
+
+    from langchain_google_cloud_sql_pg import PostgresEngine, PostgresSaver
+    engine = PostgresEngine.from_engine_args(database_url)
+    try:
+        await engine.ainit_checkpoint_table()
+    except Exception as e:
+        if "already exists" not in str(e):
+            raise
+    return await PostgresSaver.create(engine), engine
+
+
+def make_sender(target: str, service: AgentService):
+    if target == "service":
+        async def send(message: str, thread_id: str) -> bool:
+            response = await service.achat(message, thread_id)
+            return not response.startswith("I encountered an error")
+        return send, None
+
+    app_module.agent_service = service
+    client = httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app_module.app), base_url="http://bench", timeout=None
+    )
+
+    async def send(message: str, thread_id: str) -> bool:
+        response = await client.post("/chat", json={"message": message, "thread_id": thread_id})
+        return response.status_code == 200
+    return send, client
+
+
+async def run_level(send, concurrency: int, requests: int, turns: int) -> dict:
+    run_id = uuid.uuid4().hex[:8]
+    latencies = []
+    errors = 0
+    next_request = 0
+
+    async def worker(worker_id: int) -> None:
+        nonlocal errors, next_request
+        while next_request < requests:
+            i = next_request
+            next_request += 1
+            # Consecutive requests of a worker continue the same thread for `turns` turns
+            thread_id = f"bench-{run_id}-{worker_id}-{i // turns}"
+            started_at = time.perf_counter()
+            try:
+                ok = await send(f"Message {i} about my project", thread_id)
+            except Exception:
+                ok = False
+            latencies.append(time.perf_counter() - started_at)
+            errors += not ok
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker(w) for w in range(concurrency)])
+    elapsed = time.perf_counter() - start
+
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "rps": round(len(latencies) / elapsed, 2),
+        "p50_ms": round(1000 * percentile(latencies, 0.50), 1),
+        "p95_ms": round(1000 * percentile(latencies, 0.95), 1),
+        "p99_ms": round(1000 * percentile(latencies, 0.99), 1),
+    }
+
+
+async def run(args) -> list:
+    rows = []
+    with StubSearchServer(latency=args.search_latency) as server:
+        for scenario in args.scenarios:
+            search_query, turns = SCENARIOS[scenario]
+            checkpointer, engine = await make_checkpointer(args.database_url)
+            service = AgentService(
+                project_id="bench",
+                search_service_url=server.url,
+                llm=FakeChatModel(latency=args.llm_latency, search_query=search_query),
+                checkpointer=checkpointer,
+                engine=engine,
+            )
+            send, client = make_sender(args.target, service)
+            try:
+                for concurrency in args.concurrency:
+                    requests = max(args.requests, 4 * concurrency)
+                    row = {"scenario": scenario, **await run_level(send, concurrency, requests, turns)}
+                    rows.append(row)
+                    print(f"{scenario:<12} {row['concurrency']:>6} {row['requests']:>7} {row['errors']:>6} "
+                          f"{row['rps']:>9.1f} {row['p50_ms']:>9.1f} {row['p95_ms']:>9.1f} {row['p99_ms']:>9.1f}")
+            finally:
+                if client is not None:
+                    await client.aclose()
+                await service.search_client.aclose()
+                if engine is not None:
+                    await engine.close()
+    return rows
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return "unknown"
+
+
+def compare(rows: list, baseline_path: str, tolerance: float) -> bool:
+    with open(baseline_path) as f:
+        baseline = {(r["scenario"], r["concurrency"]): r for r in json.load(f)["results"]}
+
+    print(f"\nCompared with {baseline_path} (tolerance {tolerance:.0%})")
+    print(f"{'scenario':<12} {'conc':>6} {'req/s':>18} {'p95 ms':>20}")
+    ok = True
+    for row in rows:
+        before = baseline.get((row["scenario"], row["concurrency"]))
+        if before is None:
+            continue
+        rps_change = row["rps"] / before["rps"] - 1
+        p95_change = row["p95_ms"] / before["p95_ms"] - 1 if before["p95_ms"] else 0.0
+        regressed = rps_change < -tolerance or p95_change > tolerance
+        ok = ok and not regressed
+        print(f"{row['scenario']:<12} {row['concurrency']:>6} {before['rps']:>7.1f} → {row['rps']:>7.1f} "
+              f"{before['p95_ms']:>8.1f} → {row['p95_ms']:>8.1f}  {'REGRESSED' if regressed else ''}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test of the chat path")
+    parser.add_argument("--target", choices=["http", "service"], default="http")
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--concurrency", nargs="+", type=int, default=CONCURRENCY_LEVELS)
+    parser.add_argument("--requests", type=int, default=100, help="requests per level (at least 4 per worker)")
+    parser.add_argument("--llm-latency", type=float, default=LLM_LATENCY)
+    parser.add_argument("--search-latency", type=float, default=SEARCH_LATENCY)
+    parser.add_argument("--database-url", help="checkpoint to this postgresql+asyncpg:// URL instead of memory")
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10)
+    args = parser.parse_args()
+
+    print(f"target={args.target} checkpointer={'postgres' if args.database_url else 'memory'} "
+          f"llm_latency={args.llm_latency}s search_latency={args.search_latency}s")
+    print(f"{'scenario':<12} {'conc':>6} {'reqs':>7} {'errors':>6} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    rows = asyncio.run(run(args))
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump({
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "git_revision": git_revision(),
+                "python": platform.python_version(),
+                "config": {
+                    "target": args.target,
+                    "checkpointer": "postgres" if args.database_url else "memory",
+                    "llm_latency": args.llm_latency,
+                    "search_latency": args.search_latency,
+                },
+                "results": rows,
+            }, f, indent=2)
+        print(f"\nWrote {args.output}")
+
+    if args.compare and not compare(rows, args.compare, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
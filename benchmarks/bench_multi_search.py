@@ -0,0 +1,79 @@
+"""
+One multi-query search versus the same searches made one ReAct iteration at a time.
+
+Runs the real graph with a fake LLM that wants three searches per turn, either as one
+`search_knowledge(queries=[...])` call or as three sequential calls, against a local
+stub search server whose hits overlap between queries. Reports turn latency, model
+calls, and the size of the tool output sent back to the model.
+
+    PYTHONPATH=src python benchmarks/bench_multi_search.py
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+os.environ.setdefault("SEARCH_CACHE_ENABLED", "false")
+os.environ.setdefault("AUTH_TOKEN", "bench-token")
+
+from langchain_core.messages import ToolMessage
+from langchain_core.messages.utils import count_tokens_approximately
+from langgraph.checkpoint.memory import MemorySaver
+
+from agent_service import AgentService
+from tests.fakes import FakeChatModel, StubSearchServer
+
+LLM_LATENCY = 0.8
+SEARCH_LATENCY = 0.15
+QUERIES = ["focus and deep work", "building habits", "rest and recovery"]
+TURNS = 5
+
+
+def overlapping_hits(query: str) -> list:
+    # Every query shares two popular passages and has one of its own
+    return [
+        {"book_id": "deep-work", "page_number": 40, "content": "Focus is a skill that compounds. " * 8},
+        {"book_id": f"book-{len(query)}", "page_number": 7, "content": f"On {query}: " + "practice daily. " * 8},
+        {"book_id": "atomic-habits", "page_number": 12, "content": "Small changes add up over time. " * 8},
+    ]
+
+
+async def run(batch_searches: bool, server: StubSearchServer) -> tuple:
+    service = AgentService(
+        project_id="bench",
+        search_service_url=server.url,
+        llm=FakeChatModel(latency=LLM_LATENCY, search_queries=QUERIES, batch_searches=batch_searches),
+        checkpointer=MemorySaver()
+    )
+    latencies = []
+    for turn in range(TURNS):
+        thread_id = f"multi-{batch_searches}-{turn}"
+        start = time.perf_counter()
+        await service.achat("How do I get more done without burning out?", thread_id)
+        latencies.append(time.perf_counter() - start)
+
+    state = await service.agent.aget_state({"configurable": {"thread_id": thread_id}})
+    tool_messages = [m for m in state.values["messages"] if isinstance(m, ToolMessage)]
+    await service.search_client.aclose()
+    return (
+        sum(latencies) / len(latencies),
+        service.llm.call_count / TURNS,
+        count_tokens_approximately(tool_messages),
+    )
+
+
+def main():
+    print(f"{len(QUERIES)} searches per turn, LLM latency {LLM_LATENCY}s, search latency {SEARCH_LATENCY}s")
+    print(f"{'mode':<28} {'turn s':>8} {'LLM calls':>10} {'tool output tokens':>19}")
+    with StubSearchServer(latency=SEARCH_LATENCY, results=overlapping_hits) as server:
+        for name, batch_searches in (("sequential searches", False), ("one multi-query search", True)):
+            latency, llm_calls, tool_tokens = asyncio.run(run(batch_searches, server))
+            print(f"{name:<28} {latency:>8.2f} {llm_calls:>10.1f} {tool_tokens:>19}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Turn latency with and without speculative search prefetch.
+
+Runs the real graph with a fake LLM and a local stub search server for three kinds of
+turn: the model searches for (roughly) what the user said, the model rewrites the
+query into something unrelated, and the model answers without searching. With
+`SEARCH_PREFETCH=always` the raw message is searched alongside the first model
+call; the first kind should hide the search latency, the other two cost one wasted
+search each (cancelled if still running when the turn ends).
+
+    PYTHONPATH=src python benchmarks/bench_prefetch.py
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+os.environ.setdefault("SEARCH_CACHE_ENABLED", "false")
+os.environ.setdefault("AUTH_TOKEN", "bench-token")
+
+from langgraph.checkpoint.memory import MemorySaver
+
+from agent_service import AgentService
+from tests.fakes import FakeChatModel, StubSearchServer
+
+LLM_LATENCY = 0.6
+SEARCH_LATENCY = 0.4
+TURNS = 10
+
+TURN_KINDS = {
+    # name: the query the fake model asks for, if any
+    "model echoes message": "{message}",
+    "model rewrites query": "creative blocks problem solving motivation",
+    "model does not search": None,
+}
+
+
+async def run(mode: str, search_query, server: StubSearchServer) -> tuple:
+    os.environ["SEARCH_PREFETCH"] = mode
+    service = AgentService(
+        project_id="bench",
+        search_service_url=server.url,
+        llm=FakeChatModel(latency=LLM_LATENCY, search_query=search_query),
+        checkpointer=MemorySaver()
+    )
+    requests_before = server.request_count
+    latencies = []
+    for turn in range(TURNS):
+        start = time.perf_counter()
+        await service.achat(f"How do I get past a creative block on project {turn}?", f"prefetch-{mode}-{turn}")
+        latencies.append(time.perf_counter() - start)
+    await service.search_client.aclose()
+
+    stats = service.get_stats()["search_prefetch"] or {}
+    # The first turn pays for client setup
+    return (
+        sum(latencies[1:]) / (len(latencies) - 1),
+        (server.request_count - requests_before) / TURNS,
+        stats.get("hit_rate", 0.0),
+        stats.get("wasted", 0),
+    )
+
+
+def main():
+    print(f"LLM latency {LLM_LATENCY}s, search latency {SEARCH_LATENCY}s, {TURNS} turns per row")
+    print(f"{'turn kind':<24} {'prefetch':<9} {'turn s':>7} {'searches/turn':>14} {'hit rate':>9} {'wasted':>7}")
+    with StubSearchServer(latency=SEARCH_LATENCY) as server:
+        for kind, search_query in TURN_KINDS.items():
+            for mode in ("off", "always"):
+                latency, searches, hit_rate, wasted = asyncio.run(run(mode, search_query, server))
+                print(f"{kind:<24} {mode:<9} {latency:>7.2f} {searches:>14.1f} {hit_rate:>9.0%} {wasted:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Tail latency of knowledge searches against a degraded search service.
+
+A fault-injecting stub answers most searches in SEARCH_LATENCY, but a few
+take SLOW_LATENCY and some fail with a 503. "before" is a single attempt with
+the old 30s timeout; "after" is the default OutboundPolicy: per-attempt
+deadlines, jittered retries, hedged requests and the circuit breaker. The
+outage rows take the service down completely and report how long each search
+takes to give up.
+
+    PYTHONPATH=src python benchmarks/bench_resilience.py
+"""
+
+import asyncio
+import contextlib
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+os.environ.setdefault("AUTH_TOKEN", "bench-token")
+
+from db_pool import percentile
+from resilience import OutboundPolicy
+from tests.fakes import StubSearchServer
+from tool_search import SearchClient
+
+CALLS = 400
+CONCURRENCY = 8
+SEARCH_LATENCY = 0.05
+SLOW_LATENCY = 3.0
+SLOW_RATE = 0.03
+ERROR_RATE = 0.05
+
+
+def policies() -> dict:
+    return {
+        "before": OutboundPolicy("search", budget=30.0, attempt_timeout=30.0, max_attempts=1),
+        "after": OutboundPolicy.from_env("SEARCH", attempt_timeout=1.0, budget=2.0, hedge_after="auto"),
+    }
+
+
+async def run(client: SearchClient, calls: int) -> tuple:
+    latencies, failures = [], 0
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+
+    async def one(i: int) -> None:
+        nonlocal failures
+        async with semaphore:
+            started_at = time.perf_counter()
+            try:
+                await client.asearch(f"query {i}")
+            except Exception:
+                failures += 1
+            latencies.append(time.perf_counter() - started_at)
+
+    # Keep the per-retry log lines out of the table
+    with contextlib.redirect_stdout(io.StringIO()):
+        await asyncio.gather(*[one(i) for i in range(calls)])
+    await client.aclose()
+    return latencies, failures
+
+
+def report(name: str, latencies: list, failures: int, stats: dict) -> None:
+    print(f"{name:<16} {1000 * percentile(latencies, 0.5):>7.0f} {1000 * percentile(latencies, 0.95):>7.0f} "
+          f"{1000 * percentile(latencies, 0.99):>7.0f} {1000 * max(latencies):>7.0f} "
+          f"{100 * failures / len(latencies):>7.1f}% {stats['retries']:>8} {stats['hedges']:>7}")
+
+
+def main():
+    print(f"{CALLS} searches, {CONCURRENCY} at a time; {SEARCH_LATENCY * 1000:.0f} ms normally, "
+          f"{SLOW_RATE:.0%} take {SLOW_LATENCY:.0f}s, {ERROR_RATE:.0%} fail with 503")
+    print(f"{'':<16} {'p50 ms':>7} {'p95 ms':>7} {'p99 ms':>7} {'max ms':>7} {'failed':>8} {'retries':>8} {'hedges':>7}")
+
+    for name, policy in policies().items():
+        with StubSearchServer(latency=SEARCH_LATENCY, slow_rate=SLOW_RATE, slow_latency=SLOW_LATENCY,
+                              error_rate=ERROR_RATE, seed=7) as server:
+            client = SearchClient(server.url, policy=policy)
+            latencies, failures = asyncio.run(run(client, CALLS))
+        report(f"degraded {name}", latencies, failures, policy.get_stats())
+
+    for name, policy in policies().items():
+        with StubSearchServer(latency=SLOW_LATENCY, error_rate=1.0) as server:
+            client = SearchClient(server.url, policy=policy)
+            latencies, failures = asyncio.run(run(client, CALLS // 10))
+        report(f"outage {name}", latencies, failures, policy.get_stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Hit rate and latency saved by the first-turn response cache on a skewed stream of openers.
+
+New threads open with one of a handful of popular questions (Zipf-distributed, with
+varied casing and punctuation) or a unique one. Runs the real graph with a fake LLM
+that searches before answering, an in-memory checkpointer and a local stub search
+server, with the cache off and on.
+
+    PYTHONPATH=src python benchmarks/bench_response_cache.py
+"""
+
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+os.environ.setdefault("SEARCH_CACHE_ENABLED", "false")
+os.environ.setdefault("AUTH_TOKEN", "bench-token")
+
+from langgraph.checkpoint.memory import MemorySaver
+
+from agent_service import AgentService
+from db_pool import percentile
+from tests.fakes import FakeChatModel, StubSearchServer
+
+LLM_LATENCY = 0.5
+SEARCH_LATENCY = 0.1
+THREADS = 200
+UNIQUE_SHARE = 0.3
+OPENERS = [
+    "What is digital sovereignty?",
+    "How do I get out of a creative block?",
+    "What is a network state?",
+    "How can I focus better?",
+    "What makes a team work well together?",
+    "How do I start something new?",
+]
+
+
+def openers(seed: int = 7) -> list:
+    rng = random.Random(seed)
+    weights = [1 / (rank + 1) for rank in range(len(OPENERS))]
+    messages = []
+    for i in range(THREADS):
+        if rng.random() < UNIQUE_SHARE:
+            messages.append(f"Question number {i} about my own project")
+            continue
+        message = rng.choices(OPENERS, weights)[0]
+        messages.append(rng.choice([message, message.lower(), message.rstrip("?"), message.upper()]))
+    return messages
+
+
+async def run(enabled: bool, server: StubSearchServer) -> tuple:
+    os.environ["RESPONSE_CACHE_ENABLED"] = "true" if enabled else "false"
+    service = AgentService(
+        project_id="bench",
+        search_service_url=server.url,
+        llm=FakeChatModel(latency=LLM_LATENCY, search_query="{message}"),
+        checkpointer=MemorySaver()
+    )
+    latencies = []
+    start = time.perf_counter()
+    for i, message in enumerate(openers()):
+        started_at = time.perf_counter()
+        await service.achat(message, f"opener-{enabled}-{i}")
+        latencies.append(time.perf_counter() - started_at)
+    elapsed = time.perf_counter() - start
+    await service.search_client.aclose()
+    return latencies, elapsed, service.get_stats()["response_cache"]
+
+
+def main():
+    print(f"{THREADS} new threads, {len(OPENERS)} popular openers, {UNIQUE_SHARE:.0%} unique; "
+          f"LLM latency {LLM_LATENCY}s, search latency {SEARCH_LATENCY}s")
+    print(f"{'cache':<6} {'total s':>8} {'p50 ms':>8} {'p95 ms':>8} {'hit rate':>9} {'saved s':>8}")
+    with StubSearchServer(latency=SEARCH_LATENCY) as server:
+        for enabled in (False, True):
+            latencies, elapsed, stats = asyncio.run(run(enabled, server))
+            hit_rate = f"{stats['hit_rate']:.0%}" if stats else "-"
+            saved = f"{stats['saved_seconds']:.1f}" if stats else "-"
+            print(f"{'on' if enabled else 'off':<6} {elapsed:>8.1f} {1000 * percentile(latencies, 0.5):>8.0f} "
+                  f"{1000 * percentile(latencies, 0.95):>8.0f} {hit_rate:>9} {saved:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Per-call latency of search_knowledge against a local stub search server.
+
+"before" replays the old behaviour: a new httpx client (new TCP connection and
+SSL context) and a new ID token fetch on every call. "after" is SearchClient
+with its pooled keep-alive client and the cached IdTokenCache. The ID token
+fetch is simulated with a fixed metadata-server delay.
+
+    PYTHONPATH=src python benchmarks/bench_search_client.py
+"""
+
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from auth import IdTokenCache
+from tests.fakes import StubSearchServer
+from tool_search import SearchClient, format_results
+
+CALLS = 200
+TOKEN_FETCH_LATENCY = 0.02
+
+
+def fake_fetch_id_token(audience: str) -> str:
+    time.sleep(TOKEN_FETCH_LATENCY)
+    return "header.eyJleHAiOiA0MTAyNDQ0ODAwfQ.signature"
+
+
+def search_before(url: str, query: str) -> str:
+    id_token = fake_fetch_id_token(url)
+    with httpx.Client() as client:
+        response = client.post(f"{url}/search", json={"query": query, "limit": 3},
+                               headers={"Authorization": f"Bearer {id_token}"}, timeout=30.0)
+    response.raise_for_status()
+    return format_results(response.json().get("result", []))
+
+
+async def asearch_before(url: str, query: str) -> str:
+    id_token = await asyncio.to_thread(fake_fetch_id_token, url)
+    async with httpx.AsyncClient() as client:
+        response = await client.post(f"{url}/search", json={"query": query, "limit": 3},
+                                     headers={"Authorization": f"Bearer {id_token}"}, timeout=30.0)
+    response.raise_for_status()
+    return format_results(response.json().get("result", []))
+
+
+def report(name: str, samples: list) -> None:
+    samples_ms = sorted(s * 1000 for s in samples)
+    p95 = samples_ms[int(len(samples_ms) * 0.95) - 1]
+    print(f"{name:<14} mean {statistics.mean(samples_ms):7.2f} ms   p50 {statistics.median(samples_ms):7.2f} ms   p95 {p95:7.2f} ms")
+
+
+def time_sync(fn) -> list:
+    samples = []
+    for _ in range(CALLS):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+async def time_async(fn) -> list:
+    samples = []
+    for _ in range(CALLS):
+        start = time.perf_counter()
+        await fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def main():
+    os.environ.pop("AUTH_TOKEN", None)
+
+    with StubSearchServer() as server:
+        client = SearchClient(server.url, token_cache=IdTokenCache(fetch=fake_fetch_id_token))
+        query = "creative blocks problem solving motivation"
+
+        print(f"{CALLS} sequential calls, simulated ID token fetch {TOKEN_FETCH_LATENCY * 1000:.0f} ms")
+        report("sync before", time_sync(lambda: search_before(server.url, query)))
+        report("sync after", time_sync(lambda: format_results(client.search(query))))
+        report("async before", asyncio.run(time_async(lambda: asearch_before(server.url, query))))
+
+        async def asearch_after():
+            return format_results(await client.asearch(query))
+
+        report("async after", asyncio.run(time_async(asearch_after)))
+        print(f"stub server saw {len(server.connections)} distinct connections for {server.request_count} requests")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+Cold-start breakdown for the service.
+
+1. Import cost per phase, in the order the service pays for it (each number is the
+   marginal cost on top of the previous phases), the modules with the highest
+   `-X importtime` self time, and what `import main` costs now that the stack is deferred.
+2. Time from process spawn to the first healthy `/` and to the first ready `/ready`,
+   with STARTUP_MODE=blocking and STARTUP_MODE=background. The service is the real
+   graph with a fake LLM; Cloud SQL engine creation is simulated with ENGINE_LATENCY.
+
+    PYTHONPATH=src python benchmarks/bench_startup.py
+"""
+
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+SRC = os.path.join(ROOT, 'src')
+ENGINE_LATENCY = 1.0
+
+SERVER_CODE = """
+import asyncio, importlib, sys, time
+sys.path[:0] = [{root!r}, {src!r}]
+import uvicorn
+import main
+from startup import ServiceLoader
+
+async def factory(loader):
+    started_at = time.perf_counter()
+    await asyncio.to_thread(importlib.import_module, "agent_service")
+    await asyncio.to_thread(importlib.import_module, "langchain_google_vertexai")
+    loader.record("import", started_at)
+
+    started_at = time.perf_counter()
+    await asyncio.sleep({engine_latency})
+    loader.record("engine", started_at)
+
+    from tests.fakes import make_agent_service
+    return make_agent_service()
+
+main.service_loader = ServiceLoader(factory)
+uvicorn.run(main.app, host="127.0.0.1", port={port}, log_level="warning")
+"""
+
+
+IMPORT_PHASES = [
+    ("web (fastapi, pydantic, uvicorn)", ["fastapi", "pydantic", "uvicorn"]),
+    ("langchain_core", ["langchain_core.messages", "langchain_core.tools"]),
+    ("langgraph", ["langgraph.prebuilt"]),
+    ("cloud sql (asyncpg, sqlalchemy, connector)", ["langchain_google_cloud_sql_pg"]),
+    ("vertex ai (aiplatform, grpc, protobuf)", ["langchain_google_vertexai"]),
+    ("service modules", ["agent_service", "tool_search", "history", "search_cache"]),
+]
+
+PHASE_CODE = """
+import importlib, json, time
+phases = {phases!r}
+timings = []
+for name, modules in phases:
+    started_at = time.perf_counter()
+    for module in modules:
+        importlib.import_module(module)
+    timings.append((name, time.perf_counter() - started_at))
+print(json.dumps(timings))
+"""
+
+
+def import_phases() -> list:
+    output = subprocess.check_output(
+        [sys.executable, "-c", PHASE_CODE.format(phases=IMPORT_PHASES)], cwd=SRC, text=True
+    )
+    return json.loads(output)
+
+
+def import_self_times(statement: str) -> list:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        cwd=SRC, capture_output=True, text=True
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, _, name = [part.strip() for part in line[len("import time:"):].split("|")]
+        rows.append((int(self_us), name))
+    return sorted(rows, reverse=True)
+
+
+def import_total(statement: str) -> float:
+    code = f"import time; started_at = time.perf_counter(); {statement}; print(time.perf_counter() - started_at)"
+    return float(subprocess.check_output([sys.executable, "-c", code], cwd=SRC, text=True))
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def time_to_ready(mode: str) -> tuple:
+    port = free_port()
+    env = dict(os.environ, STARTUP_MODE=mode)
+    code = SERVER_CODE.format(root=ROOT, src=SRC, port=port, engine_latency=ENGINE_LATENCY)
+
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, "-c", code], cwd=SRC, env=env)
+    healthy_at = ready_at = None
+    try:
+        while ready_at is None and time.perf_counter() - start < 60:
+            try:
+                if healthy_at is None and httpx.get(f"http://127.0.0.1:{port}/", timeout=1).status_code == 200:
+                    healthy_at = time.perf_counter() - start
+                if httpx.get(f"http://127.0.0.1:{port}/ready", timeout=1).status_code == 200:
+                    ready_at = time.perf_counter() - start
+                    phases = httpx.get(f"http://127.0.0.1:{port}/").json()["phases"]
+            except httpx.TransportError:
+                pass
+            time.sleep(0.02)
+    finally:
+        process.terminate()
+        process.wait()
+    return healthy_at, ready_at, phases
+
+
+def main():
+    print("Import cost per phase (marginal, s)")
+    for name, seconds in import_phases():
+        print(f"  {name:<45} {seconds:>7.2f}")
+
+    print("\nHighest -X importtime self time for the full stack (ms)")
+    for self_us, name in import_self_times("import agent_service, langchain_google_vertexai, langchain_google_cloud_sql_pg")[:10]:
+        print(f"  {name:<45} {self_us / 1000:>7.1f}")
+
+    print(f"\nimport main now: {import_total('import main'):.2f}s "
+          f"(full stack before: {import_total('import main, agent_service, langchain_google_vertexai, langchain_google_cloud_sql_pg'):.2f}s)")
+
+    print(f"\nTime to first response (s), engine creation simulated at {ENGINE_LATENCY}s")
+    print(f"{'mode':<12} {'first healthy /':>16} {'first ready /ready':>20}   phases")
+    for mode in ("blocking", "background"):
+        healthy_at, ready_at, phases = time_to_ready(mode)
+        print(f"{mode:<12} {healthy_at:>16.2f} {ready_at:>20.2f}   {phases}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+Throughput of the API as serve.py goes from 1 to N uvicorn workers.
+
+Starts `serve.py --app worker_app:app` (the real graph on a fake LLM, see worker_app.py)
+against a local stub search server that returns large hits, so each request spends
+real CPU on JSON parsing, result formatting, graph bookkeeping and pydantic
+validation. Load comes from several client processes so the load generator is not
+the bottleneck. Scaling tops out at the machine's vCPUs, shared with the clients.
+
+    PYTHONPATH=src python benchmarks/bench_workers.py
+    PYTHONPATH=src python benchmarks/bench_workers.py --workers 1 2 4 8 --concurrency 128
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import time
+import uuid
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+
+import httpx
+
+from db_pool import percentile
+from serve import available_cpus
+from tests.fakes import StubSearchServer
+
+LLM_LATENCY = 0.05
+SEARCH_LATENCY = 0.02
+
+
+def large_hits(query: str) -> list:
+    return [
+        {"book_id": f"book-{i}", "page_number": i, "content": f"{query}: " + "a passage worth reading " * 80}
+        for i in range(10)
+    ]
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(workers: int, port: int, search_url: str, llm_latency: float) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "PYTHONPATH": os.pathsep.join([os.path.join(ROOT, "benchmarks"), os.path.join(ROOT, "src"), ROOT]),
+        "SEARCH_SERVICE_URL": search_url,
+        "SEARCH_MAX_RESULTS": "10",
+        "BENCH_LLM_LATENCY": str(llm_latency),
+    }
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "src", "serve.py"), "--app", "worker_app:app",
+         "--host", "127.0.0.1", "--port", str(port), "--workers", str(workers)],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/ready", timeout=1).status_code == 200:
+                break
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    else:
+        process.terminate()
+        raise RuntimeError(f"server with {workers} workers did not become ready")
+    # Let the remaining workers finish importing before measuring
+    time.sleep(2 + workers)
+    return process
+
+
+def client_process(args: tuple) -> list:
+    url, concurrency, duration = args
+
+    async def run() -> list:
+        latencies = []
+        deadline = time.perf_counter() + duration
+        async with httpx.AsyncClient(base_url=url, timeout=60, limits=httpx.Limits(max_connections=concurrency)) as client:
+            async def worker() -> None:
+                while time.perf_counter() < deadline:
+                    started_at = time.perf_counter()
+                    response = await client.post("/chat", json={
+                        "message": "How do I get past a creative block?",
+                        "thread_id": uuid.uuid4().hex,
+                    })
+                    if response.status_code == 200:
+                        latencies.append(time.perf_counter() - started_at)
+
+            await asyncio.gather(*[worker() for _ in range(concurrency)])
+        return latencies
+
+    return asyncio.run(run())
+
+
+def measure(url: str, concurrency: int, duration: float, clients: int) -> list:
+    per_client = max(1, concurrency // clients)
+    with multiprocessing.get_context("spawn").Pool(clients) as pool:
+        # Warm every worker's graph and connections
+        pool.map(client_process, [(url, per_client, 1.0)] * clients)
+        results = pool.map(client_process, [(url, per_client, duration)] * clients)
+    return [latency for latencies in results for latency in latencies]
+
+
+def main():
+    cpus = available_cpus()
+    parser = argparse.ArgumentParser(description="API throughput by number of workers")
+    parser.add_argument("--workers", nargs="+", type=int,
+                        default=sorted({1, *[n for n in (2, 4, 8) if n <= cpus], cpus}))
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--clients", type=int, default=max(2, cpus // 2), help="load generator processes")
+    parser.add_argument("--llm-latency", type=float, default=LLM_LATENCY)
+    args = parser.parse_args()
+
+    print(f"{cpus} vCPUs, concurrency {args.concurrency} from {args.clients} client processes, "
+          f"LLM latency {args.llm_latency}s, {args.duration}s per row")
+    print(f"{'workers':>7} {'requests':>9} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'scaling':>8}")
+
+    baseline = None
+    with StubSearchServer(latency=SEARCH_LATENCY, results=large_hits) as search:
+        for workers in args.workers:
+            port = free_port()
+            process = start_server(workers, port, search.url, args.llm_latency)
+            try:
+                latencies = measure(f"http://127.0.0.1:{port}", args.concurrency, args.duration, args.clients)
+            finally:
+                process.terminate()
+                process.wait(timeout=30)
+
+            rps = len(latencies) / args.duration
+            baseline = baseline or rps
+            print(f"{workers:>7} {len(latencies):>9} {rps:>8.1f} {1000 * percentile(latencies, 0.5):>8.0f} "
+                  f"{1000 * percentile(latencies, 0.95):>8.0f} {rps / baseline:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Offline evaluation of the search gate against a labeled message set.
+
+Each line of the data file is `{"message": ..., "needs_search": true|false}`. Reports
+the gate's precision and recall at skipping the tools (a skipped turn that needed a
+search is a quality loss; a trivial turn that still runs the full graph is a missed
+saving), how precise its prefetches are, and the LLM calls per turn with the gate
+off and on. The call counts run the real graph with a fake model that searches on
+every turn it has tools for, the worst case of the "proactive" system prompt, so the
+saving is an upper bound for a model that sometimes answers small talk directly.
+
+The cues and thresholds were tuned on data/search_gate_tuning.jsonl, so its figures
+flatter the gate; the reported ones come from data/search_gate_heldout.jsonl, which was
+written separately and is not for tuning. Tune against the tuning set with `--data`,
+then report the held-out run. Topic cues for this corpus come from
+SEARCH_GATE_TOPIC_CUES, as in the service, or `--topic-cues`.
+
+    PYTHONPATH=src python benchmarks/eval_search_gate.py
+    PYTHONPATH=src python benchmarks/eval_search_gate.py --skip-below 0.3 --prefetch-above 0.5
+    PYTHONPATH=src python benchmarks/eval_search_gate.py --data benchmarks/data/search_gate_tuning.jsonl
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+os.environ.setdefault("SEARCH_CACHE_ENABLED", "false")
+os.environ.setdefault("AUTH_TOKEN", "bench-token")
+
+from search_gate import DIRECT, PREFETCH, SearchGate
+from tests.fakes import StubSearchServer, make_agent_service
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+TUNING_FILE = os.path.join(DATA_DIR, "search_gate_tuning.jsonl")
+HELDOUT_FILE = os.path.join(DATA_DIR, "search_gate_heldout.jsonl")
+# The knowledge base's subjects, for a deployment that sets no SEARCH_GATE_TOPIC_CUES
+CORPUS_TOPIC_CUES = "sovereignty network state society history philosophy"
+
+
+def load(path: str) -> list:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def ratio(numerator: int, denominator: int) -> float:
+    return numerator / denominator if denominator else 0.0
+
+
+async def llm_calls_per_turn(examples: list, gated: bool, server: StubSearchServer) -> float:
+    os.environ["SEARCH_GATE_ENABLED"] = "true" if gated else "false"
+    service = make_agent_service(server.url, search_query="{message}")
+    for i, example in enumerate(examples):
+        await service.achat(example["message"], f"eval-{gated}-{i}")
+    await service.search_client.aclose()
+    return service.llm.call_count / len(examples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precision/recall of the search gate")
+    parser.add_argument("--data", default=HELDOUT_FILE)
+    parser.add_argument("--skip-below", type=float, default=float(os.getenv("SEARCH_GATE_SKIP_BELOW", "0.2")))
+    parser.add_argument("--prefetch-above", type=float, default=float(os.getenv("SEARCH_GATE_PREFETCH_ABOVE", "0.6")))
+    parser.add_argument("--topic-cues", default=os.getenv("SEARCH_GATE_TOPIC_CUES", CORPUS_TOPIC_CUES))
+    args = parser.parse_args()
+
+    os.environ["SEARCH_GATE_SKIP_BELOW"] = str(args.skip_below)
+    os.environ["SEARCH_GATE_PREFETCH_ABOVE"] = str(args.prefetch_above)
+    os.environ["SEARCH_GATE_TOPIC_CUES"] = args.topic_cues
+    examples = load(args.data)
+    gate = SearchGate(
+        skip_below=args.skip_below,
+        prefetch_above=args.prefetch_above,
+        topic_cues=args.topic_cues.replace(",", " ").split(),
+    )
+
+    skipped_right = skipped_wrong = kept_trivial = prefetched_right = prefetched = 0
+    mistakes = []
+    for example in examples:
+        route = gate.route(example["message"])
+        if route == DIRECT:
+            if example["needs_search"]:
+                skipped_wrong += 1
+                mistakes.append(("skipped, needed search", example["message"]))
+            else:
+                skipped_right += 1
+        elif not example["needs_search"]:
+            kept_trivial += 1
+            mistakes.append((f"{route}, did not need search", example["message"]))
+        if route == PREFETCH:
+            prefetched += 1
+            prefetched_right += example["needs_search"]
+
+    trivial = sum(not e["needs_search"] for e in examples)
+    split = "tuning" if os.path.samefile(args.data, TUNING_FILE) else "held-out"
+    print(f"{len(examples)} {split} messages ({trivial} trivial), skip below {args.skip_below}, "
+          f"prefetch at {args.prefetch_above}")
+    print(f"skip precision   {ratio(skipped_right, skipped_right + skipped_wrong):.2f}  "
+          f"(skipped turns that needed no search)")
+    print(f"skip recall      {ratio(skipped_right, trivial):.2f}  (trivial turns skipped)")
+    print(f"search recall    {ratio(len(examples) - trivial - skipped_wrong, len(examples) - trivial):.2f}  "
+          f"(turns needing search that kept the tools)")
+    print(f"prefetch precision {ratio(prefetched_right, prefetched):.2f}  ({prefetched} prefetched)")
+    for reason, message in mistakes:
+        print(f"  {reason}: {message!r}")
+
+    with StubSearchServer() as server:
+        ungated = asyncio.run(llm_calls_per_turn(examples, False, server))
+        gated = asyncio.run(llm_calls_per_turn(examples, True, server))
+    print(f"\nLLM calls per turn: {ungated:.2f} without the gate, {gated:.2f} with it "
+          f"({ungated - gated:.2f} saved per turn)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+"""
+`main.app` with an offline AgentService, for running under serve.py in benchmarks.
+
+Each uvicorn worker imports this module and builds its own service: the real graph on
+a fake LLM (latency from BENCH_LLM_LATENCY), an in-memory checkpointer and the stub
+search server at SEARCH_SERVICE_URL.
+
+    SEARCH_SERVICE_URL=http://127.0.0.1:9000 python src/serve.py --app worker_app:app
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+os.environ.setdefault("SEARCH_CACHE_ENABLED", "false")
+os.environ.setdefault("AUTH_TOKEN", "bench-token")
+
+from langgraph.checkpoint.memory import MemorySaver
+
+import main
+from agent_service import AgentService
+from tests.fakes import FakeChatModel
+
+main.agent_service = AgentService(
+    project_id="bench",
+    search_service_url=os.environ["SEARCH_SERVICE_URL"],
+    llm=FakeChatModel(
+        latency=float(os.getenv("BENCH_LLM_LATENCY", "0.05")),
+        search_query="{message}",
+    ),
+    checkpointer=MemorySaver()
+)
+app = main.app
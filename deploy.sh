@@ -101,6 +101,15 @@ IMAGE="${IMAGE_NAME}@${DIGEST}"
 
 echo "Using image: $IMAGE"
 
+# Create database tables once per deploy; instances boot with CHECKPOINT_TABLE_INIT=false
+if [ "$PLAN_ONLY" != "yes" ]; then
+  echo "Initializing database tables..."
+  if ! POSTGRES_USER="$POSTGRES_USER" POSTGRES_PASSWORD="$POSTGRES_PASSWORD" PYTHONPATH=src python src/init_db.py; then
+    echo "Error: Database initialization failed."
+    exit 1
+  fi
+fi
+
 # ------------------------------------------------------------------------------
 # Terraform Actions
 # ------------------------------------------------------------------------------
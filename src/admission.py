@@ -0,0 +1,251 @@
+"""
+Admission control for chat turns: an adaptive concurrency limit in front of the agent.
+
+At most `limit` turns run at once. The limit adapts AIMD-style: it grows by about one
+per limit's worth of turns that finish within `latency_target`, and shrinks by
+`backoff` when a turn is slower than that or fails because a dependency is
+overloaded (Vertex AI quota, the Postgres pool, a deadline), at most once per round
+of turns. Turns over the limit wait in per-tenant queues served round-robin, so one
+caller's burst can't starve the others, for at most `queue_timeout` seconds.
+
+Requests that can't be served in time are turned away at once with a Retry-After
+instead of piling up until the platform times them out:
+
+- 429 when the caller's own queue is full, or its queued request was evicted so a
+  quieter caller could queue (the longest queue gives way when the queue is full)
+- 503 when every caller's requests fill the queue, or a request waited `queue_timeout`
+"""
+
+import asyncio
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, Optional
+
+from resilience import DeadlineExceeded, is_retryable
+
+
+class AdmissionRejected(Exception):
+    """The turn was not admitted: the service, or this caller's share of it, is over capacity."""
+
+    def __init__(self, reason: str, status_code: int, retry_after: float):
+        super().__init__(f"Over capacity: {reason}")
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+def tenant_key(thread_id: str, separator: str = ":") -> str:
+    """The caller a thread belongs to: its id up to `separator` (e.g. "app:user-42" -> "app"), or the whole id."""
+    return thread_id.split(separator, 1)[0]
+
+
+def is_overload(error: BaseException) -> bool:
+    """Whether a failed turn says the service is doing too much, rather than that the turn was bad."""
+    return isinstance(error, DeadlineExceeded) or is_retryable(error)
+
+
+class AIMDLimit:
+    """Concurrency limit: additive increase while turns are fast, multiplicative decrease when they're not."""
+
+    def __init__(
+        self,
+        initial: int = 32,
+        min_limit: int = 1,
+        max_limit: int = 256,
+        latency_target: float = 30.0,
+        backoff: float = 0.75,
+    ):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target = latency_target
+        self.backoff = backoff
+        self._decreased_at = 0.0
+        self.decreases = 0
+
+    def update(self, started_at: float, latency: float, overloaded: bool, inflight: int) -> None:
+        if overloaded or latency > self.latency_target:
+            # Turns that started before the last decrease ran under the old limit: count them once
+            if started_at >= self._decreased_at:
+                self.limit = max(float(self.min_limit), self.limit * self.backoff)
+                self._decreased_at = time.monotonic()
+                self.decreases += 1
+        elif inflight + 1 >= self.limit / 2:
+            # Grow only while the limit is what holds turns back, not while traffic is light
+            self.limit = min(float(self.max_limit), self.limit + 1 / self.limit)
+
+
+class AdmissionController:
+    """Admits turns up to the adaptive limit; the rest wait in fair per-tenant queues or are rejected."""
+
+    def __init__(
+        self,
+        limit: Optional[AIMDLimit] = None,
+        max_queue: int = 128,
+        max_queue_per_tenant: int = 32,
+        queue_timeout: float = 10.0,
+        tenant_separator: str = ":",
+    ):
+        self.limit = limit or AIMDLimit()
+        self.tenant_separator = tenant_separator
+        self.max_queue = max_queue
+        self.max_queue_per_tenant = max_queue_per_tenant
+        self.queue_timeout = queue_timeout
+        self.inflight = 0
+        # tenant -> waiting futures, oldest first; tenants are served in this order, then moved to the end
+        self._queues: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+        self._queued = 0
+        # Smoothed turn latency, for Retry-After
+        self._latency = 1.0
+        self.admitted = 0
+        self.queued_total = 0
+        self.rejected_tenant = 0
+        self.rejected_full = 0
+        self.timed_out = 0
+        self.evicted = 0
+
+    @classmethod
+    def from_env(cls) -> Optional["AdmissionController"]:
+        if os.getenv("ADMISSION_ENABLED", "true").lower() != "true":
+            return None
+        return cls(
+            limit=AIMDLimit(
+                initial=int(os.getenv("ADMISSION_INITIAL_LIMIT", "32")),
+                min_limit=int(os.getenv("ADMISSION_MIN_LIMIT", "1")),
+                max_limit=int(os.getenv("ADMISSION_MAX_LIMIT", "256")),
+                latency_target=float(os.getenv("ADMISSION_LATENCY_TARGET", "30")),
+                backoff=float(os.getenv("ADMISSION_BACKOFF", "0.75")),
+            ),
+            max_queue=int(os.getenv("ADMISSION_MAX_QUEUE", "128")),
+            max_queue_per_tenant=int(os.getenv("ADMISSION_MAX_QUEUE_PER_TENANT", "32")),
+            queue_timeout=float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "10")),
+            tenant_separator=os.getenv("ADMISSION_TENANT_SEPARATOR", ":"),
+        )
+
+    def tenant(self, thread_id: str) -> str:
+        return tenant_key(thread_id, self.tenant_separator)
+
+    def _retry_after(self) -> float:
+        # About when a slot is expected to free up for the requests already queued
+        return max(1.0, self._latency * (self._queued + 1) / max(self.limit.limit, 1.0))
+
+    def _reject(self, reason: str, status_code: int) -> AdmissionRejected:
+        return AdmissionRejected(reason, status_code, self._retry_after())
+
+    async def acquire(self, tenant: str) -> None:
+        """Wait for a slot. Raises AdmissionRejected when over capacity; pair with `release`."""
+        if self.inflight < self.limit.limit and not self._queued:
+            self.inflight += 1
+            self.admitted += 1
+            return
+
+        queue = self._queues.get(tenant)
+        if queue is not None and len(queue) >= self.max_queue_per_tenant:
+            self.rejected_tenant += 1
+            raise self._reject(f"too many requests queued for {tenant}", 429)
+        if self._queued >= self.max_queue:
+            self._evict_for(tenant)
+
+        waiter = asyncio.get_running_loop().create_future()
+        if queue is None:
+            queue = self._queues[tenant] = deque()
+        queue.append(waiter)
+        self._queued += 1
+        self.queued_total += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+        except asyncio.TimeoutError:
+            if not waiter.done():
+                self._remove(tenant, waiter)
+                waiter.cancel()
+                self.timed_out += 1
+                raise self._reject(f"waited {self.queue_timeout:.0f}s for a slot", 503)
+        except asyncio.CancelledError:
+            # The client went away: give up the place in the queue, or the slot granted meanwhile
+            if not waiter.done():
+                self._remove(tenant, waiter)
+                waiter.cancel()
+            elif not waiter.cancelled() and waiter.exception() is None:
+                self.inflight -= 1
+                self._dispatch()
+            raise
+        # Granted by `_dispatch`, or evicted with AdmissionRejected
+        waiter.result()
+        self.admitted += 1
+
+    def _evict_for(self, tenant: str) -> None:
+        """Make room in a full queue by turning away the newest request of the longest tenant queue."""
+        longest = max(self._queues, key=lambda t: len(self._queues[t]))
+        own = len(self._queues.get(tenant, ()))
+        if own + 1 >= len(self._queues[longest]):
+            # The newcomer's caller already has the most queued (or all are equal)
+            if own:
+                self.rejected_tenant += 1
+                raise self._reject(f"too many requests queued for {tenant}", 429)
+            self.rejected_full += 1
+            raise self._reject("the queue is full", 503)
+        victim = self._queues[longest].pop()
+        self._queued -= 1
+        self.evicted += 1
+        victim.set_exception(self._reject(f"too many requests queued for {longest}", 429))
+
+    def _remove(self, tenant: str, waiter: asyncio.Future) -> None:
+        queue = self._queues.get(tenant)
+        if queue is not None and waiter in queue:
+            queue.remove(waiter)
+            self._queued -= 1
+            if not queue:
+                del self._queues[tenant]
+
+    def _dispatch(self) -> None:
+        """Hand free slots to queued turns, one tenant after another."""
+        while self._queued and self.inflight < self.limit.limit:
+            tenant, queue = next(iter(self._queues.items()))
+            waiter = queue.popleft()
+            self._queued -= 1
+            if queue:
+                self._queues.move_to_end(tenant)
+            else:
+                del self._queues[tenant]
+            if not waiter.done():
+                self.inflight += 1
+                waiter.set_result(True)
+
+    def release(self, started_at: float, error: Optional[BaseException] = None) -> None:
+        """Free the slot of a turn that started at `started_at` (monotonic) and feed its outcome to the limit."""
+        latency = time.monotonic() - started_at
+        self.inflight -= 1
+        self._latency += 0.1 * (latency - self._latency)
+        self.limit.update(started_at, latency, error is not None and is_overload(error), self.inflight)
+        self._dispatch()
+
+    @asynccontextmanager
+    async def admit(self, thread_id: str) -> AsyncIterator[None]:
+        """Run the body in a slot admitted for the thread's tenant. Raises AdmissionRejected when over capacity."""
+        await self.acquire(self.tenant(thread_id))
+        started_at = time.monotonic()
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self.release(started_at, error)
+
+    def get_stats(self) -> dict:
+        return {
+            "limit": round(self.limit.limit, 2),
+            "inflight": self.inflight,
+            "queued": self._queued,
+            "queued_tenants": len(self._queues),
+            "admitted": self.admitted,
+            "queued_total": self.queued_total,
+            "rejected_tenant": self.rejected_tenant,
+            "rejected_full": self.rejected_full,
+            "timed_out": self.timed_out,
+            "evicted": self.evicted,
+            "limit_decreases": self.limit.decreases,
+            "latency_seconds": round(self._latency, 3),
+        }
@@ -1,14 +1,23 @@
+import asyncio
+import math
 import os
-from typing import List, Optional, TypedDict, Annotated
+import time
+from contextlib import asynccontextmanager, contextmanager, nullcontext
+from typing import AsyncIterator, Callable, Dict, List, Optional, Sequence, Tuple
+
+from typing_extensions import NotRequired
 
 import google.auth
 from google.auth.transport.requests import AuthorizedSession, Request
-from langchain_core.messages import BaseMessage, HumanMessage, AIMessage, SystemMessage
-from langchain_google_vertexai import ChatVertexAI
-from langchain_google_cloud_sql_pg import PostgresSaver, PostgresEngine
+from langchain_core.messages import HumanMessage, AIMessage, SystemMessage, ToolMessage
 from langgraph.prebuilt import create_react_agent
+from langgraph.prebuilt.chat_agent_executor import AgentState as ReactAgentState
 
 from auth import get_auth_token
+from context_packing import search_token_budget
+from resilience import BreakerCallback, CircuitBreaker, CircuitOpenError, bind_to_turn, turn_deadline
+from telemetry import trace_chat
+from thread_locks import ThreadBusyError, ThreadLocks
 
 
 def get_system_prompt() -> str:
@@ -39,6 +48,7 @@ def get_system_prompt() -> str:
 - User: "I'm feeling stuck on this project" → Use search_knowledge("creative blocks problem solving motivation")
 - User: "My team is having communication issues" → Use search_knowledge("team collaboration communication leadership")
 - User: "I'm thinking about starting something new" → Use search_knowledge("innovation new ventures risk taking")
+- User: "How do I lead a remote team through a big change?" → Use search_knowledge(queries=["remote team leadership", "managing organizational change", "trust and communication at a distance"]) — several angles in one call, not one search after another
 
 ## Important:
 - You decide when to search based on conversational context
@@ -50,58 +60,228 @@ def get_system_prompt() -> str:
 Remember: You're having a conversation with someone who values thoughtful insights, not querying a database."""
 
 
-class AgentState(TypedDict):
-    messages: Annotated[List[BaseMessage], "The messages in the conversation"]
+def get_engine_kwargs() -> dict:
+    from db_pool import get_pool_args
+    return dict(
+        project_id="robot-rnd-nilor-gcp",
+        region="us-central1",
+        instance="pg-default",
+        database="book_agent_v1",
+        user=os.getenv("POSTGRES_USER", "book-agent"),
+        password=os.getenv("POSTGRES_PASSWORD", "testpassword"),
+        engine_args=get_pool_args()
+    )
+
+
+def should_init_tables() -> bool:
+    # Deployments run init_db.py once and set CHECKPOINT_TABLE_INIT=false so boots skip the DDL
+    return os.getenv("CHECKPOINT_TABLE_INIT", "true").lower() == "true"
+
+
+@asynccontextmanager
+async def _no_lock():
+    yield
+
+
+class AgentState(ReactAgentState):
+    # Rolling summary of turns folded out of `messages` by the history manager
+    summary: NotRequired[str]
 
 
 class AgentService:
-    def __init__(self, project_id: str, search_service_url: str):
+    def __init__(self, project_id: str, search_service_url: str, llm=None, checkpointer=None, engine=None):
         self.project_id = project_id
         self.search_service_url = search_service_url
         self._auth_session = None
-        self._checkpointer = None
-
-        self.llm = ChatVertexAI(
-            model="gemini-2.0-flash-exp",
-            temperature=0.7,
-            max_tokens=1000
-        )
+        self.engine = engine
+
+        # Passed with every model call
+        llm_call_kwargs = {}
+        if llm is None:
+            # Deferred: importing the Vertex AI stack is the bulk of startup time
+            from langchain_google_vertexai import ChatVertexAI
+            llm = ChatVertexAI(
+                model="gemini-2.0-flash-exp",
+                temperature=0.7,
+                max_tokens=1000,
+                # The client's own retries; its default of 6 lets one failing call stall a turn for minutes
+                max_retries=int(os.getenv("LLM_MAX_ATTEMPTS", "3")) - 1
+            )
+            # Per attempt, so a hung request is retried instead of waited on; the turn budget caps the total
+            llm_call_kwargs["timeout"] = float(os.getenv("LLM_ATTEMPT_TIMEOUT", "20"))
+        self.llm = llm
 
-        from tool_search import create_search_tool
-        tools = [create_search_tool(self.search_service_url)]
+        # Outbound calls of a turn share this budget: search attempts are cut to what is left of it
+        self.turn_budget = float(os.getenv("TURN_BUDGET", "60"))
+        llm_breaker_failures = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+        self.llm_breaker = CircuitBreaker(
+            "vertex-ai", llm_breaker_failures, float(os.getenv("LLM_BREAKER_RESET", "30"))
+        ) if llm_breaker_failures > 0 else None
 
         system_message = SystemMessage(content=get_system_prompt())
 
-        # PostgreSQL checkpointer using Google's Cloud SQL package
-        self.engine = PostgresEngine.from_instance(
-            project_id="robot-rnd-nilor-gcp",
-            region="us-central1", 
-            instance="pg-default",
-            database="book_agent_v1",
-            user=os.getenv("POSTGRES_USER", "book-agent"),
-            password=os.getenv("POSTGRES_PASSWORD", "testpassword")
-        )
-
-        # Initialize tables (idempotent)
-        try:
-            self.engine.init_checkpoint_table()
-        except Exception as e:
-            if "already exists" in str(e):
-                print("✅ Checkpoints table already exists, continuing...")
-            else:
-                raise e
-
-        # Create checkpointer 
-        checkpointer = PostgresSaver.create_sync(self.engine)
+        if checkpointer is None:
+            from langchain_google_cloud_sql_pg import PostgresSaver, PostgresEngine
+
+        if checkpointer is None and self.engine is None:
+            # PostgreSQL checkpointer using Google's Cloud SQL package
+            self.engine = PostgresEngine.from_instance(**get_engine_kwargs())
+
+            # Initialize tables (idempotent)
+            if should_init_tables():
+                try:
+                    self.engine.init_checkpoint_table()
+                except Exception as e:
+                    if "already exists" in str(e):
+                        print("✅ Checkpoints table already exists, continuing...")
+                    else:
+                        raise e
+                from checkpoint_serde import PostgresPayloadStore, dedup_enabled
+                if dedup_enabled():
+                    PostgresPayloadStore(self.engine).init_table()
+                from search_cache import PostgresSearchCacheBackend, shared_backend_enabled
+                if shared_backend_enabled():
+                    PostgresSearchCacheBackend(self.engine).init_table()
+
+        if checkpointer is None:
+            # Create checkpointer 
+            from checkpoint_serde import CompactSerializer
+            checkpointer = PostgresSaver.create_sync(self.engine, serde=CompactSerializer.from_env())
+
+        from checkpoint_serde import DedupingCheckpointer
+        self.checkpoint_payloads = DedupingCheckpointer.from_env(checkpointer, self.engine)
+        if self.checkpoint_payloads is not None:
+            checkpointer = self.checkpoint_payloads
+
+        from checkpoint_cache import CachingCheckpointer
+        self.checkpoint_cache = CachingCheckpointer.from_env(checkpointer, self.engine)
+        if self.checkpoint_cache is not None:
+            checkpointer = self.checkpoint_cache
+        # One checkpoint write per turn instead of one per graph step, when the cache coalesces writes
+        self.durability = self.checkpoint_cache.durability if self.checkpoint_cache else None
+
+        from telemetry import instrument_checkpointer
+        self._checkpointer = instrument_checkpointer(checkpointer)
+
+        from knowledge_index import KnowledgeIndex
+        from search_cache import SearchCache
+        from tool_search import SearchClient, create_search_tool
+        self.search_client = SearchClient(self.search_service_url)
+        self.search_cache = SearchCache.from_env(engine=self.engine)
+        self.knowledge_index = KnowledgeIndex.from_env(self.project_id)
+        from context_packing import ContextPacker
+        self.context_packer = ContextPacker.from_env()
+        tools = [create_search_tool(
+            self.search_service_url, self.search_client, self.search_cache, self.knowledge_index,
+            self.context_packer
+        )]
+
+        self.thread_locks = ThreadLocks.from_env(engine=self.engine)
+
+        from admission import AdmissionController
+        # Used by the /chat endpoints: caps turns in flight and queues or sheds the rest
+        self.admission = AdmissionController.from_env()
+
+        from analytics import AnalyticsPipeline
+        # One event per turn, queued for a background writer
+        self.analytics = AnalyticsPipeline.from_env(self.project_id)
+
+        # Conversations run at once by chat_many / astream_chat_many
+        self.batch_concurrency = int(os.getenv("CHAT_BATCH_CONCURRENCY", "16"))
+
+        from history import HistoryManager
+        self.history_manager = HistoryManager.from_env(bind_to_turn(self.llm, **llm_call_kwargs), self.context_packer)
+
+        from response_cache import ResponseCache, model_fingerprint
+        self.response_cache = ResponseCache.from_env(model_fingerprint(get_system_prompt(), self.llm))
 
         self.agent = create_react_agent(
-            model=self.llm,
+            model=bind_to_turn(self.llm, tools, **llm_call_kwargs),
             tools=tools,
             checkpointer=checkpointer,
-            prompt=system_message
+            prompt=system_message,
+            state_schema=AgentState,
+            pre_model_hook=self.history_manager.as_hook() if self.history_manager else None
+        )
+
+        from search_gate import SearchGate
+        self.search_gate = SearchGate.from_env()
+        # Turns the gate judges trivial, and every turn while the search service is down, get one
+        # model call with no tools bound, on the same checkpoints
+        self.direct_agent = create_react_agent(
+            model=bind_to_turn(self.llm, **llm_call_kwargs),
+            tools=[],
+            checkpointer=checkpointer,
+            prompt=system_message,
+            state_schema=AgentState,
+            pre_model_hook=self.history_manager.as_hook() if self.history_manager else None
         )
 
+        from search_prefetch import SearchPrefetcher
+        from tool_search import fetch_results
+        self.search_prefetcher = SearchPrefetcher.from_env(
+            lambda query: fetch_results(self.search_client, self.search_cache, query, self.knowledge_index)
+        )
 
+    @classmethod
+    async def acreate(
+        cls,
+        project_id: str,
+        search_service_url: str,
+        llm=None,
+        record_phase: Optional[Callable[[str, float], None]] = None,
+    ) -> "AgentService":
+        """Build the service without blocking the event loop, using the async engine and checkpointer."""
+        record_phase = record_phase or (lambda phase, started_at: None)
+
+        started_at = time.perf_counter()
+        from langchain_google_cloud_sql_pg import PostgresSaver, PostgresEngine
+        engine = await PostgresEngine.afrom_instance(**get_engine_kwargs())
+        record_phase("engine", started_at)
+
+        if should_init_tables():
+            started_at = time.perf_counter()
+            try:
+                await engine.ainit_checkpoint_table()
+            except Exception as e:
+                if "already exists" in str(e):
+                    print("✅ Checkpoints table already exists, continuing...")
+                else:
+                    raise e
+            from checkpoint_serde import PostgresPayloadStore, dedup_enabled
+            if dedup_enabled():
+                await PostgresPayloadStore(engine).ainit_table()
+            from search_cache import PostgresSearchCacheBackend, shared_backend_enabled
+            if shared_backend_enabled():
+                await PostgresSearchCacheBackend(engine).ainit_table()
+            record_phase("init_tables", started_at)
+
+        started_at = time.perf_counter()
+        from checkpoint_serde import CompactSerializer
+        checkpointer = await PostgresSaver.create(engine, serde=CompactSerializer.from_env())
+        record_phase("checkpointer", started_at)
+
+        # Building the LLM client and compiling the graph is synchronous work
+        started_at = time.perf_counter()
+        service = await asyncio.to_thread(
+            cls, project_id, search_service_url, llm=llm, checkpointer=checkpointer, engine=engine
+        )
+        record_phase("graph", started_at)
+        return service
+
+    async def warm_up(self) -> None:
+        """Open a pooled database connection and the Vertex AI clients before the first chat needs them."""
+        try:
+            await self._checkpointer.aget_tuple({"configurable": {"thread_id": "__warm_up__"}})
+        except Exception as e:
+            print(f"Error warming up checkpointer: {e}")
+
+        if hasattr(self.llm, "async_prediction_client"):
+            try:
+                await asyncio.to_thread(lambda: self.llm.prediction_client)
+                self.llm.async_prediction_client
+            except Exception as e:
+                print(f"Error warming up LLM client: {e}")
 
     def _get_auth_session(self) -> AuthorizedSession:
         if self._auth_session is None:
@@ -111,24 +291,316 @@ class AgentService:
             self._auth_session = AuthorizedSession(credentials)
         return self._auth_session
 
-    def chat(self, message: str, thread_id: str) -> str:
+    def get_stats(self) -> dict:
+        from db_pool import get_pool_stats
+        return {
+            "search_cache": self.search_cache.get_stats() if self.search_cache else None,
+            "knowledge_index": self.knowledge_index.get_stats() if self.knowledge_index else None,
+            "context_packing": self.context_packer.get_stats() if self.context_packer else None,
+            "postgres_pool": get_pool_stats(self.engine) if self.engine is not None else None,
+            "response_cache": self.response_cache.get_stats() if self.response_cache else None,
+            "search_gate": self.search_gate.get_stats() if self.search_gate else None,
+            "search_prefetch": self.search_prefetcher.get_stats() if self.search_prefetcher else None,
+            "thread_locks": self.thread_locks.get_stats() if self.thread_locks else None,
+            "checkpoint_cache": self.checkpoint_cache.get_stats() if self.checkpoint_cache else None,
+            "checkpoint_payloads": self.checkpoint_payloads.get_stats() if self.checkpoint_payloads else None,
+            "search_calls": self.search_client.policy.get_stats(),
+            "llm_circuit": self.llm_breaker.get_stats() if self.llm_breaker else None,
+            "admission": self.admission.get_stats() if self.admission else None,
+            "analytics": self.analytics.get_stats() if self.analytics else None,
+        }
+
+    @staticmethod
+    def _get_response(result: dict) -> str:
+        messages = result["messages"]
+        if messages and isinstance(messages[-1], AIMessage):
+            return messages[-1].content
+
+        return "I'm sorry, I couldn't generate a response at this time."
+
+    def _remember_first_turn(self, message: str, result: dict, started_at: float, degraded: bool) -> None:
+        """Cache the exchange if `result` is a new thread's first, successful turn.
+
+        Turns answered without knowledge, because the search circuit was open (`degraded`)
+        or a search failed, are not cached: their answers would outlive the outage.
+        """
+        if self.response_cache is None or degraded:
+            return
+        from tool_search import NO_KNOWLEDGE_MESSAGE
+
+        messages = result["messages"]
+        if (
+            sum(isinstance(m, HumanMessage) for m in messages) != 1
+            or not isinstance(messages[-1], AIMessage)
+            or messages[-1].tool_calls
+            or any(isinstance(m, ToolMessage) and m.content == NO_KNOWLEDGE_MESSAGE for m in messages)
+        ):
+            return
+        self.response_cache.set(message, messages, self._get_response(result), time.perf_counter() - started_at)
+
+    def _answer_from_cache(self, message: str, config: dict) -> Optional[str]:
+        """Answer a new thread's first turn from the response cache, writing the exchange to its checkpoint."""
+        started_at = time.perf_counter()
+        if self.response_cache is None or self._checkpointer.get_tuple(config) is not None:
+            return None
+        turn = self.response_cache.get(message)
+        if turn is None:
+            return None
+        self.agent.update_state(config, {"messages": turn.messages}, as_node="agent")
+        self.response_cache.record_saving(turn.seconds - (time.perf_counter() - started_at))
+        return turn.response
+
+    async def _aanswer_from_cache(self, message: str, config: dict) -> Optional[str]:
+        started_at = time.perf_counter()
+        if self.response_cache is None or await self._checkpointer.aget_tuple(config) is not None:
+            return None
+        turn = self.response_cache.get(message)
+        if turn is None:
+            return None
+        await self.agent.aupdate_state(config, {"messages": turn.messages}, as_node="agent")
+        self.response_cache.record_saving(turn.seconds - (time.perf_counter() - started_at))
+        return turn.response
+
+    def _config(self, thread_id: str, telemetry) -> dict:
+        callbacks = [telemetry]
+        if self.llm_breaker is not None:
+            callbacks.append(BreakerCallback(self.llm_breaker))
+        return {"configurable": {"thread_id": thread_id}, "callbacks": callbacks}
+
+    @contextmanager
+    def _outbound(self):
+        """Run a turn's model and search calls under the turn budget, and its search results under the token budget.
+
+        Raises CircuitOpenError, before any call is made, while Vertex AI is failing.
+        """
+        probe = self.llm_breaker.check() if self.llm_breaker is not None else False
+        search_tokens = self.context_packer.turn_budget if self.context_packer else None
         try:
-            config = {"configurable": {"thread_id": thread_id}}
+            with turn_deadline(self.turn_budget), search_token_budget(search_tokens):
+                yield
+        finally:
+            if probe:
+                # A turn that ended before its model call answered can't decide the probe
+                self.llm_breaker.release_probe()
+
+    def _select_agent(self, message: str, telemetry) -> Tuple[object, bool, bool]:
+        """The graph to run `message` on, as routed by the search gate, and whether to prefetch a search.
+
+        The third value says whether the turn is degraded: answered without knowledge because
+        the search circuit is open.
+        """
+        if not self.search_client.available():
+            # Answer without knowledge at once instead of waiting on a search that would fail fast anyway
+            telemetry.note("search.circuit_open", True)
+            return self.direct_agent, False, True
+
+        route = None
+        if self.search_gate is not None:
+            from search_gate import DIRECT
+            route = self.search_gate.route(message)
+            telemetry.note("search_gate.route", route)
+            if route == DIRECT:
+                return self.direct_agent, False, False
+        prefetch = self.search_prefetcher is not None and self.search_prefetcher.wants(route)
+        return self.agent, prefetch, False
+
+    async def _previous_message(self, config: dict, message: str) -> Optional[str]:
+        """The thread's last user message before `message`, for prefetching short follow-ups with context."""
+        checkpoint = await self._checkpointer.aget_tuple(config)
+        if checkpoint is None:
+            return None
+        human = [
+            m.text() for m in checkpoint.checkpoint["channel_values"].get("messages", [])
+            if isinstance(m, HumanMessage) and m.text() != message
+        ]
+        return human[-1] if human else None
+
+    def _speculate(self, message: str, config: dict, prefetch: bool):
+        """Search for `message` alongside the first model call, for the turn's `search_knowledge` call to claim."""
+        if not prefetch:
+            return nullcontext()
+        return self.search_prefetcher.speculate(message, lambda: self._previous_message(config, message))
 
-            result = self.agent.invoke(
-                {"messages": [HumanMessage(content=message)]},
-                config=config
-            )
-
-            messages = result["messages"]
-            if messages and isinstance(messages[-1], AIMessage):
-                return messages[-1].content
-
-            return "I'm sorry, I couldn't generate a response at this time."
-
-        except Exception as e:
-            print(f"Error in chat: {str(e)}")
-            return f"I encountered an error while processing your request: {str(e)}"
+    def chat(self, message: str, thread_id: str) -> str:
+        hold = self.thread_locks.hold_sync(thread_id) if self.thread_locks else nullcontext()
+        with hold, trace_chat("chat", thread_id, self.analytics) as telemetry:
+            try:
+                started_at = time.perf_counter()
+                config = self._config(thread_id, telemetry)
+
+                cached = self._answer_from_cache(message, config)
+                if cached is not None:
+                    telemetry.note("response_cache.hit", True)
+                    return cached
+
+                agent, _, degraded = self._select_agent(message, telemetry)
+                with self._outbound():
+                    result = agent.invoke(
+                        {"messages": [HumanMessage(content=message)]},
+                        config=config,
+                        durability=self.durability
+                    )
+
+                self._remember_first_turn(message, result, started_at, degraded)
+                return self._get_response(result)
+
+            except Exception as e:
+                telemetry.fail(e)
+                print(f"Error in chat: {str(e)}")
+                raise
+
+    async def achat(self, message: str, thread_id: str) -> str:
+        """Run one turn. Turns for the same thread run one at a time (see `ThreadLocks`).
+
+        Raises ThreadBusyError when too many turns are already waiting for the thread,
+        CircuitOpenError while Vertex AI is failing, and whatever else failed the turn.
+        """
+        if self.thread_locks is None:
+            return await self._achat_turn([message], thread_id)
+        return await self.thread_locks.run(thread_id, message, lambda messages: self._achat_turn(messages, thread_id))
+
+    async def _achat_turn(self, messages: List[str], thread_id: str) -> str:
+        # Several messages when back-to-back messages were coalesced into this turn
+        message = "\n".join(messages)
+        with trace_chat("achat", thread_id, self.analytics) as telemetry:
+            try:
+                started_at = time.perf_counter()
+                config = self._config(thread_id, telemetry)
+
+                cached = await self._aanswer_from_cache(message, config) if len(messages) == 1 else None
+                if cached is not None:
+                    telemetry.note("response_cache.hit", True)
+                    return cached
+
+                agent, prefetch, degraded = self._select_agent(message, telemetry)
+                with self._outbound(), self._speculate(message, config, prefetch):
+                    result = await agent.ainvoke(
+                        {"messages": [HumanMessage(content=m) for m in messages]},
+                        config=config,
+                        durability=self.durability
+                    )
+
+                self._remember_first_turn(message, result, started_at, degraded)
+                return self._get_response(result)
+
+            except Exception as e:
+                telemetry.fail(e)
+                print(f"Error in chat: {str(e)}")
+                raise
+
+    async def astream_chat_many(
+        self, items: Sequence[Tuple[str, str]], max_concurrency: Optional[int] = None
+    ) -> AsyncIterator[Tuple[int, str]]:
+        """Run many `(thread_id, message)` turns concurrently, yielding `(index, response)` as each completes.
+
+        At most `max_concurrency` (default `batch_concurrency`) turns run at once. Turns for
+        the same thread run one after another in batch order, and identical search queries
+        within the batch are sent to the search service once. Each turn is admitted by
+        `admission` like a /chat request, so batches share the service's capacity with
+        interactive turns; a turn it turns away gets an over-capacity response.
+        """
+        from tool_search import share_searches
+
+        semaphore = asyncio.Semaphore(max_concurrency or self.batch_concurrency)
+        searches: Dict[str, asyncio.Future] = {}
+        completed: asyncio.Queue = asyncio.Queue()
+
+        turns_by_thread: Dict[str, List[Tuple[int, str]]] = {}
+        for index, (thread_id, message) in enumerate(items):
+            turns_by_thread.setdefault(thread_id, []).append((index, message))
+
+        async def run_thread(thread_id: str, turns: List[Tuple[int, str]]) -> None:
+            share_searches(searches)
+            for index, message in turns:
+                async with semaphore:
+                    try:
+                        async with self.admission.admit(thread_id) if self.admission else nullcontext():
+                            response = await self.achat(message, thread_id)
+                    except Exception as e:
+                        # One failed conversation must not fail the batch
+                        response = f"I encountered an error while processing your request: {e}"
+                completed.put_nowait((index, response))
+
+        tasks = [asyncio.ensure_future(run_thread(thread_id, turns)) for thread_id, turns in turns_by_thread.items()]
+        try:
+            for _ in range(len(items)):
+                yield await completed.get()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def chat_many(
+        self, items: Sequence[Tuple[str, str]], max_concurrency: Optional[int] = None
+    ) -> List[str]:
+        """Batch version of `achat`: responses for `(thread_id, message)` items, in input order."""
+        responses: List[str] = [""] * len(items)
+        async for index, response in self.astream_chat_many(items, max_concurrency):
+            responses[index] = response
+        return responses
+
+    async def astream_chat(self, message: str, thread_id: str) -> AsyncIterator[dict]:
+        """Run one turn and yield `tool_start`, `tool_end` and `token` events as they happen, then `done`.
+
+        The checkpoint is written by the graph exactly as in `achat`; `done` is only
+        sent once the run, and so the checkpoint write, has completed. Streamed turns
+        wait for the thread like `achat` but are never coalesced. A failed turn ends
+        with an `error` event instead, carrying the exception under its `error` key.
+        """
+        try:
+            async with self.thread_locks.hold(thread_id) if self.thread_locks else _no_lock():
+                async for event in self._astream_turn(message, thread_id):
+                    yield event
+        except ThreadBusyError as e:
+            yield {"event": "error", "data": {"message": str(e)}, "error": e}
+
+    async def _astream_turn(self, message: str, thread_id: str) -> AsyncIterator[dict]:
+        with trace_chat("stream", thread_id, self.analytics) as telemetry:
+            response = None
+            try:
+                started_at = time.perf_counter()
+                config = self._config(thread_id, telemetry)
+
+                cached = await self._aanswer_from_cache(message, config)
+                if cached is not None:
+                    telemetry.note("response_cache.hit", True)
+                    yield {"event": "token", "data": {"content": cached}}
+                    yield {"event": "done", "data": {"response": cached}}
+                    return
+
+                agent, prefetch, degraded = self._select_agent(message, telemetry)
+                with self._outbound(), self._speculate(message, config, prefetch):
+                    async for event in agent.astream_events(
+                        {"messages": [HumanMessage(content=message)]},
+                        config=config,
+                        version="v2",
+                        durability=self.durability
+                    ):
+                        kind = event["event"]
+                        # Only the answering model streams to the user; history summaries run in their own node
+                        if kind == "on_chat_model_stream" and event["metadata"].get("langgraph_node") == "agent":
+                            content = event["data"]["chunk"].text()
+                            if content:
+                                yield {"event": "token", "data": {"content": content}}
+                        elif kind == "on_tool_start":
+                            yield {"event": "tool_start", "data": {"name": event["name"], "input": event["data"].get("input")}}
+                        elif kind == "on_tool_end":
+                            yield {"event": "tool_end", "data": {"name": event["name"]}}
+                        elif kind == "on_chain_end" and not event["parent_ids"]:
+                            response = self._get_response(event["data"]["output"])
+                            self._remember_first_turn(message, event["data"]["output"], started_at, degraded)
+
+                if response is None:
+                    response = "I'm sorry, I couldn't generate a response at this time."
+                yield {"event": "done", "data": {"response": response}}
+
+            except Exception as e:
+                telemetry.fail(e)
+                print(f"Error in chat: {str(e)}")
+                error = {"message": f"I encountered an error while processing your request: {str(e)}"}
+                if isinstance(e, CircuitOpenError):
+                    error["retry_after"] = math.ceil(e.retry_after)
+                # `error` is for the server (e.g. admission control), `data` is what the client sees
+                yield {"event": "error", "data": error, "error": e}
 
 
 if __name__ == "__main__":
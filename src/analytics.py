@@ -0,0 +1,294 @@
+"""
+Conversation analytics, written in batches off the request path.
+
+Each chat turn becomes one event (see `telemetry.trace_chat`). `AnalyticsPipeline.emit`
+only puts the event on a bounded in-memory queue, and never blocks or raises: when the
+queue is full the event is dropped and counted. A background thread takes events off
+the queue and hands them to the sink in batches of up to `batch_size`, or whatever has
+arrived once `flush_interval` seconds have passed since the batch's first event.
+
+Sinks are anything with `write(rows)` and `close()`. `BigQuerySink` streams batches
+through one reused `bigquery.Client`; `FileSink` (JSON lines) and `SQLiteSink` are
+local stand-ins for development and tests.
+"""
+
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from typing import Callable, List, Optional
+
+SINK_BIGQUERY = "bigquery"
+SINK_FILE = "file"
+SINK_SQLITE = "sqlite"
+
+# Columns of a chat event, in table order
+EVENT_COLUMNS = (
+    "event_id", "timestamp", "thread_id", "mode", "status", "latency_ms", "iterations",
+    "input_tokens", "output_tokens", "tool_calls", "tools", "route", "response_cache_hit",
+)
+
+_STOP = object()
+
+
+class FileSink:
+    """Appends rows to a local file, one JSON object per line."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def write(self, rows: List[dict]) -> None:
+        with open(self.path, "a") as f:
+            f.write("".join(json.dumps(row) + "\n" for row in rows))
+
+    def close(self) -> None:
+        pass
+
+
+class SQLiteSink:
+    """Inserts rows into a local SQLite table with the `EVENT_COLUMNS`; other keys are ignored."""
+
+    def __init__(self, path: str, table: str = "chat_events"):
+        self.path = path
+        self.table = table
+        # Opened on the worker thread, the only one that writes
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(f"CREATE TABLE IF NOT EXISTS {self.table} ({', '.join(EVENT_COLUMNS)})")
+        return self._conn
+
+    def write(self, rows: List[dict]) -> None:
+        conn = self._connect()
+        placeholders = ", ".join(f":{column}" for column in EVENT_COLUMNS)
+        values = [
+            {column: json.dumps(row[column]) if isinstance(row.get(column), list) else row.get(column)
+             for column in EVENT_COLUMNS}
+            for row in rows
+        ]
+        with conn:
+            conn.executemany(f"INSERT INTO {self.table} VALUES ({placeholders})", values)
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+class BigQuerySink:
+    """Streams rows into `project.dataset.table` like `utilities.insert_rows`, on one client made once.
+
+    Rows carrying an `event_id` are sent with it as the insert ID, so BigQuery can drop
+    the duplicates a retried batch would otherwise leave.
+    """
+
+    def __init__(self, project_id: str, dataset_id: str, table_id: str, client_factory: Optional[Callable] = None):
+        self.table_ref = f"{project_id}.{dataset_id}.{table_id}"
+        self.project_id = project_id
+        self.client_factory = client_factory
+        self._client = None
+
+    def _get_client(self):
+        if self._client is None:
+            if self.client_factory is not None:
+                self._client = self.client_factory()
+            else:
+                from google.cloud import bigquery
+                self._client = bigquery.Client(project=self.project_id)
+        return self._client
+
+    def write(self, rows: List[dict]) -> None:
+        row_ids = [row.get("event_id") for row in rows]
+        errors = self._get_client().insert_rows_json(
+            self.table_ref, rows, row_ids=row_ids if all(row_ids) else None
+        )
+        if errors:
+            raise RuntimeError(f"insert_rows_json into {self.table_ref} failed: {errors[:3]}")
+
+    def close(self) -> None:
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+
+class AnalyticsPipeline:
+    """Bounded queue of analytics events, flushed to `sink` by a background thread.
+
+    A batch the sink fails to write is retried with the next one, up to `max_attempts`
+    times, and then given up on (`failed`). `close` flushes what is queued, waiting at
+    most `close_timeout` seconds.
+    """
+
+    def __init__(
+        self,
+        sink,
+        max_queue: int = 10000,
+        batch_size: int = 500,
+        flush_interval: float = 5.0,
+        max_attempts: int = 3,
+        close_timeout: float = 10.0,
+    ):
+        self.sink = sink
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self.close_timeout = close_timeout
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._worker: Optional[threading.Thread] = None
+        self._worker_pid: Optional[int] = None
+        self._closed = False
+        self.emitted = 0
+        self.dropped = 0
+        self.written = 0
+        self.batches = 0
+        self.flush_errors = 0
+        self.failed = 0
+        self.max_queued = 0
+
+    @classmethod
+    def from_env(cls, project_id: str) -> Optional["AnalyticsPipeline"]:
+        if os.getenv("ANALYTICS_ENABLED", "false").lower() != "true":
+            return None
+        kind = os.getenv("ANALYTICS_SINK", SINK_BIGQUERY)
+        if kind == SINK_FILE:
+            sink = FileSink(os.getenv("ANALYTICS_PATH", "analytics.jsonl"))
+        elif kind == SINK_SQLITE:
+            sink = SQLiteSink(os.getenv("ANALYTICS_PATH", "analytics.db"))
+        else:
+            dataset_id, table_id = os.getenv("ANALYTICS_TABLE", "book_agent.chat_events").split(".", 1)
+            sink = BigQuerySink(project_id, dataset_id, table_id)
+        return cls(
+            sink,
+            max_queue=int(os.getenv("ANALYTICS_QUEUE_SIZE", "10000")),
+            batch_size=int(os.getenv("ANALYTICS_BATCH_SIZE", "500")),
+            flush_interval=float(os.getenv("ANALYTICS_FLUSH_INTERVAL", "5")),
+        )
+
+    def emit(self, event: dict) -> bool:
+        """Queue `event` without waiting; False if it was dropped because the queue is full or closed."""
+        if self._closed:
+            with self._lock:
+                self.dropped += 1
+            return False
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+        with self._lock:
+            self.emitted += 1
+            self.max_queued = max(self.max_queued, self._queue.qsize())
+        return True
+
+    def _ensure_worker(self) -> None:
+        # Started on first use, and again in a forked child, which doesn't inherit the thread
+        if self._worker is not None and self._worker_pid == os.getpid():
+            return
+        with self._lock:
+            if self._worker is None or self._worker_pid != os.getpid():
+                self._worker_pid = os.getpid()
+                self._worker = threading.Thread(target=self._run, name="analytics-flush", daemon=True)
+                self._worker.start()
+
+    def _run(self) -> None:
+        pending: List[dict] = []
+        attempts = 0
+        stopping = False
+        while not stopping:
+            # A batch that failed to write waits `flush_interval` for its retry
+            batch, stopping = self._next_batch(retrying=bool(pending))
+            pending += batch
+            if not pending:
+                continue
+            if self._write(pending[:self.batch_size]):
+                pending, attempts = pending[self.batch_size:], 0
+                continue
+            attempts += 1
+            if attempts >= self.max_attempts:
+                with self._lock:
+                    self.failed += len(pending[:self.batch_size])
+                pending, attempts = pending[self.batch_size:], 0
+        # Whatever is left after the last attempt on shutdown is lost
+        if pending:
+            with self._lock:
+                self.failed += len(pending)
+
+    def _next_batch(self, retrying: bool = False):
+        """Events up to `batch_size`, waiting at most `flush_interval` after the first; and whether to stop."""
+        batch: List[dict] = []
+        deadline = time.monotonic() + self.flush_interval if retrying else None
+        while len(batch) < self.batch_size:
+            timeout = None if deadline is None else deadline - time.monotonic()
+            if timeout is not None and timeout <= 0:
+                break
+            try:
+                event = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if event is _STOP:
+                return batch + self._drain(), True
+            batch.append(event)
+            if deadline is None:
+                deadline = time.monotonic() + self.flush_interval
+        return batch, False
+
+    def _drain(self) -> List[dict]:
+        events = []
+        while True:
+            try:
+                event = self._queue.get_nowait()
+            except queue.Empty:
+                return events
+            if event is not _STOP:
+                events.append(event)
+
+    def _write(self, rows: List[dict]) -> bool:
+        try:
+            self.sink.write(rows)
+        except Exception as e:
+            with self._lock:
+                self.flush_errors += 1
+            print(f"Error writing {len(rows)} analytics events: {e}")
+            return False
+        with self._lock:
+            self.written += len(rows)
+            self.batches += 1
+        return True
+
+    def close(self) -> None:
+        """Stop accepting events, write out the queue and close the sink."""
+        if self._closed:
+            return
+        self._closed = True
+        worker = self._worker
+        if worker is not None and self._worker_pid == os.getpid():
+            # Blocks only for a full queue, which the worker is busy emptying
+            try:
+                self._queue.put(_STOP, timeout=self.close_timeout)
+            except queue.Full:
+                pass
+            worker.join(self.close_timeout)
+        try:
+            self.sink.close()
+        except Exception as e:
+            print(f"Error closing analytics sink: {e}")
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                "queued": self._queue.qsize(),
+                "max_queued": self.max_queued,
+                "emitted": self.emitted,
+                "dropped": self.dropped,
+                "written": self.written,
+                "batches": self.batches,
+                "flush_errors": self.flush_errors,
+                "failed": self.failed,
+            }
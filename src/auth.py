@@ -1,6 +1,12 @@
+import base64
+import json
+import os
 import subprocess
-from typing import Optional
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
 import google.auth
+import google.oauth2.id_token
 from google.auth.transport.requests import AuthorizedSession, Request
 
 
@@ -25,6 +31,105 @@ def get_auth_session() -> AuthorizedSession:
     return AuthorizedSession(credentials)
 
 
+def get_token_expiry(token: str) -> float:
+    """Read the `exp` claim of a JWT without verifying it; unknown tokens are treated as valid for an hour."""
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload))["exp"])
+    except Exception:
+        return time.time() + 3600
+
+
+class IdTokenCache:
+    """Caches Google ID tokens per audience and refreshes them in the background before they expire.
+
+    A valid token is returned from memory. Inside `refresh_margin` seconds of expiry the
+    cached token is still returned while a background thread fetches its replacement, so
+    callers only block on the very first fetch for an audience. That fetch is made once:
+    concurrent callers wait for it instead of each asking the metadata server.
+    """
+
+    def __init__(self, fetch: Optional[Callable[[str], str]] = None, refresh_margin: float = 300.0):
+        self._fetch = fetch or self._fetch_id_token
+        self.refresh_margin = refresh_margin
+        self._tokens: Dict[str, Tuple[str, float]] = {}
+        self._refreshing: Dict[str, threading.Thread] = {}
+        # Held while an audience's token is fetched for callers that have none
+        self._fetching: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._request = None
+
+    def _fetch_id_token(self, audience: str) -> str:
+        if self._request is None:
+            self._request = Request()
+        return google.oauth2.id_token.fetch_id_token(self._request, audience=audience)
+
+    def _refresh(self, audience: str) -> str:
+        token = self._fetch(audience)
+        with self._lock:
+            self._tokens[audience] = (token, get_token_expiry(token))
+            self._refreshing.pop(audience, None)
+        return token
+
+    def _refresh_in_background(self, audience: str) -> None:
+        with self._lock:
+            if audience in self._refreshing:
+                return
+            thread = threading.Thread(target=self._background_refresh, args=(audience,), daemon=True)
+            self._refreshing[audience] = thread
+        thread.start()
+
+    def _background_refresh(self, audience: str) -> None:
+        try:
+            self._refresh(audience)
+        except Exception as e:
+            print(f"Error refreshing ID token: {e}")
+            with self._lock:
+                self._refreshing.pop(audience, None)
+
+    def peek(self, audience: str) -> Optional[str]:
+        """Return a still-valid cached token, scheduling a refresh if it is close to expiry."""
+        override = os.environ.get("AUTH_TOKEN", None)
+        if override is not None:
+            return override
+
+        cached = self._tokens.get(audience)
+        if cached is None:
+            return None
+
+        token, expiry = cached
+        now = time.time()
+        if now >= expiry:
+            return None
+        if now >= expiry - self.refresh_margin:
+            self._refresh_in_background(audience)
+        return token
+
+    def get(self, audience: str) -> str:
+        token = self.peek(audience)
+        if token is None:
+            with self._lock:
+                fetching = self._fetching.setdefault(audience, threading.Lock())
+            with fetching:
+                # Fetched by another caller while this one waited
+                token = self.peek(audience)
+                if token is None:
+                    token = self._refresh(audience)
+        return token
+
+    def clear(self) -> None:
+        with self._lock:
+            self._tokens.clear()
+
+    def reset_after_fork(self) -> None:
+        """In a forked child: keep the tokens, drop the parent's lock, refresh threads and HTTP session."""
+        self._lock = threading.Lock()
+        self._refreshing = {}
+        self._fetching = {}
+        self._request = None
+
+
 if __name__ == "__main__":
     token = get_auth_token()
     if token:
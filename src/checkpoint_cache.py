@@ -0,0 +1,318 @@
+"""
+Write-through cache of active threads' latest checkpoints, in front of PostgresSaver.
+
+A turn starts by reading the thread's newest checkpoint, which for an active thread
+is nearly always the one this process wrote at the end of its previous turn. The
+cache keeps that checkpoint in memory and answers the read after a version check:
+one query for the thread's newest checkpoint id and the number of pending writes
+stored against it, both primary-key index lookups, instead of the checkpoint blob and
+the writes themselves. If another instance or worker has written a checkpoint or a
+pending write since, the versions differ and the read goes to Postgres. The check is
+still a round trip per hit, which the cache saves only the payload of.
+
+The cache is bounded by thread count and by the serialized size of the checkpoints
+it holds: long conversations make large checkpoints, and every worker has its own
+cache. Keeping checkpoints serialized costs one `dumps_typed` per write on top of
+PostgresSaver's own; see benchmarks/bench_checkpoint_cache.py.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Iterator, Optional, Sequence, Tuple
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import BaseCheckpointSaver, CheckpointTuple, get_checkpoint_id
+from sqlalchemy import text
+
+
+class _Entry:
+    """A thread's latest checkpoint, kept serialized so cached state can't be mutated by the caller."""
+
+    __slots__ = ("config", "checkpoint", "metadata", "parent_config", "pending_writes", "size")
+
+    def __init__(self, config: dict, checkpoint: Tuple[str, bytes], metadata: Tuple[str, bytes],
+                 parent_config: Optional[dict], pending_writes: list):
+        self.config = config
+        self.checkpoint = checkpoint
+        self.metadata = metadata
+        self.parent_config = parent_config
+        self.pending_writes = pending_writes
+        # Pending writes of a thread's latest checkpoint are rare and small: not counted
+        self.size = len(checkpoint[1]) + len(metadata[1])
+
+    @property
+    def checkpoint_id(self) -> str:
+        return self.config["configurable"]["checkpoint_id"]
+
+    @property
+    def version(self) -> Tuple[str, int]:
+        return self.checkpoint_id, len(self.pending_writes)
+
+
+def _table_name(saver: BaseCheckpointSaver) -> str:
+    # Through wrappers such as DedupingCheckpointer to the saver they write to
+    while isinstance(getattr(saver, "inner", None), BaseCheckpointSaver):
+        saver = saver.inner
+    # PostgresSaver keeps its AsyncPostgresSaver, which knows the table, in a private attribute
+    inner = getattr(saver, "_PostgresSaver__checkpoint", saver)
+    return getattr(inner, "table_name", "checkpoints")
+
+
+class CachingCheckpointer(BaseCheckpointSaver):
+    """Checkpointer that serves threads' latest checkpoints from a bounded LRU, writing through to `inner`.
+
+    Only reads of a thread's latest checkpoint are cached; reads of a specific
+    checkpoint id hit the cache only when it is the cached one, and listing goes to
+    `inner`. With `coalesce_writes`, turns should run with `durability` (``"exit"``) so
+    the graph writes one checkpoint per turn instead of one per step.
+    """
+
+    def __init__(
+        self,
+        inner: BaseCheckpointSaver,
+        engine,
+        table_name: str = "checkpoints",
+        max_threads: int = 1000,
+        max_bytes: int = 64 * 1024 * 1024,
+        coalesce_writes: bool = False,
+    ):
+        super().__init__(serde=inner.serde)
+        self.inner = inner
+        self.engine = engine
+        self.table_name = table_name
+        self.max_threads = max_threads
+        self.max_bytes = max_bytes
+        self.coalesce_writes = coalesce_writes
+        self._entries: "OrderedDict[Tuple[str, str], _Entry]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.evictions = 0
+
+    @classmethod
+    def from_env(cls, inner: BaseCheckpointSaver, engine) -> Optional["CachingCheckpointer"]:
+        # The version check needs the Postgres tables; in-memory savers have nothing to save
+        if engine is None or os.getenv("CHECKPOINT_CACHE_ENABLED", "true").lower() != "true":
+            return None
+        return cls(
+            inner,
+            engine,
+            table_name=_table_name(inner),
+            max_threads=int(os.getenv("CHECKPOINT_CACHE_MAX_THREADS", "1000")),
+            max_bytes=int(os.getenv("CHECKPOINT_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+            coalesce_writes=os.getenv("CHECKPOINT_COALESCE_WRITES", "false").lower() == "true",
+        )
+
+    @property
+    def durability(self) -> Optional[str]:
+        """The `durability` to run turns with: one checkpoint write at the end of the turn when coalescing."""
+        return "exit" if self.coalesce_writes else None
+
+    @staticmethod
+    def _key(config: RunnableConfig) -> Tuple[str, str]:
+        configurable = config["configurable"]
+        return configurable["thread_id"], configurable.get("checkpoint_ns", "")
+
+    def _get(self, key: Tuple[str, str]) -> Optional[_Entry]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def _store(self, key: Tuple[str, str], entry: _Entry) -> None:
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous.size
+            if entry.size > self.max_bytes:
+                # Would evict everything else; the thread's next read goes to Postgres
+                self.evictions += 1
+                return
+            self._entries[key] = entry
+            self._bytes += entry.size
+            while len(self._entries) > self.max_threads or self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.size
+                self.evictions += 1
+
+    def _drop(self, key: Tuple[str, str], checkpoint_id: Optional[str] = None) -> None:
+        """Forget the thread's entry (only if it is `checkpoint_id`, when given)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (checkpoint_id is None or entry.checkpoint_id == checkpoint_id):
+                del self._entries[key]
+                self._bytes -= entry.size
+
+    def _record(self, **increments) -> None:
+        with self._lock:
+            for name, value in increments.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def _entry_from_tuple(self, saved: CheckpointTuple) -> _Entry:
+        return _Entry(
+            config=saved.config,
+            checkpoint=self.serde.dumps_typed(saved.checkpoint),
+            metadata=self.serde.dumps_typed(saved.metadata),
+            parent_config=saved.parent_config,
+            pending_writes=list(saved.pending_writes or []),
+        )
+
+    def _tuple_from_entry(self, entry: _Entry) -> CheckpointTuple:
+        return CheckpointTuple(
+            config={"configurable": dict(entry.config["configurable"])},
+            checkpoint=self.serde.loads_typed(entry.checkpoint),
+            metadata=self.serde.loads_typed(entry.metadata),
+            parent_config=entry.parent_config,
+            pending_writes=list(entry.pending_writes),
+        )
+
+    def _entry_from_put(self, config: RunnableConfig, next_config: RunnableConfig, checkpoint, metadata) -> _Entry:
+        thread_id, checkpoint_ns = self._key(config)
+        parent_id = config["configurable"].get("checkpoint_id")
+        return _Entry(
+            config={"configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": next_config["configurable"]["checkpoint_id"],
+            }},
+            checkpoint=self.serde.dumps_typed(checkpoint),
+            metadata=self.serde.dumps_typed(metadata),
+            parent_config={"configurable": {
+                "thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": parent_id,
+            }} if parent_id else None,
+            pending_writes=[],
+        )
+
+    async def _latest_version(self, thread_id: str, checkpoint_ns: str) -> Optional[Tuple[str, int]]:
+        """The thread's newest checkpoint id and how many pending writes it has."""
+        async with self.engine._pool.connect() as conn:
+            result = await conn.execute(
+                text(f"""SELECT c.checkpoint_id, (
+                        SELECT count(*) FROM "{self.table_name}_writes" w
+                        WHERE w.thread_id = c.thread_id
+                            AND w.checkpoint_ns = c.checkpoint_ns
+                            AND w.checkpoint_id = c.checkpoint_id
+                    )
+                    FROM "{self.table_name}" c
+                    WHERE c.thread_id = :thread_id AND c.checkpoint_ns = :checkpoint_ns
+                    ORDER BY c.checkpoint_id DESC LIMIT 1"""),
+                {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns},
+            )
+            row = result.first()
+            return tuple(row) if row is not None else None
+
+    def _cached(self, config: RunnableConfig) -> Tuple[Optional[_Entry], bool]:
+        """The entry that may answer `config`, and whether it must first be checked against Postgres."""
+        entry = self._get(self._key(config))
+        if entry is None:
+            return None, False
+        checkpoint_id = get_checkpoint_id(config)
+        if checkpoint_id:
+            # A checkpoint id names one immutable checkpoint
+            return (entry, False) if checkpoint_id == entry.checkpoint_id else (None, False)
+        return entry, True
+
+    def _resolve(self, config: RunnableConfig, entry: _Entry,
+                 latest: Optional[Tuple[str, int]]) -> Optional[CheckpointTuple]:
+        if latest == entry.version:
+            self._record(hits=1)
+            return self._tuple_from_entry(entry)
+        # Written to by another instance or worker, or deleted by compaction
+        self._record(stale=1)
+        self._drop(self._key(config), entry.checkpoint_id)
+        return None
+
+    def _remember_read(self, config: RunnableConfig, saved: Optional[CheckpointTuple]) -> None:
+        self._record(misses=1)
+        if saved is not None and not get_checkpoint_id(config):
+            self._store(self._key(config), self._entry_from_tuple(saved))
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        entry, verify = self._cached(config)
+        if entry is not None:
+            if not verify:
+                self._record(hits=1)
+                return self._tuple_from_entry(entry)
+            latest = await self.engine._run_as_async(self._latest_version(*self._key(config)))
+            saved = self._resolve(config, entry, latest)
+            if saved is not None:
+                return saved
+        saved = await self.inner.aget_tuple(config)
+        self._remember_read(config, saved)
+        return saved
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        entry, verify = self._cached(config)
+        if entry is not None:
+            if not verify:
+                self._record(hits=1)
+                return self._tuple_from_entry(entry)
+            latest = self.engine._run_as_sync(self._latest_version(*self._key(config)))
+            saved = self._resolve(config, entry, latest)
+            if saved is not None:
+                return saved
+        saved = self.inner.get_tuple(config)
+        self._remember_read(config, saved)
+        return saved
+
+    async def aput(self, config: RunnableConfig, checkpoint, metadata, new_versions) -> RunnableConfig:
+        next_config = await self.inner.aput(config, checkpoint, metadata, new_versions)
+        self._store(self._key(config), self._entry_from_put(config, next_config, checkpoint, metadata))
+        return next_config
+
+    def put(self, config: RunnableConfig, checkpoint, metadata, new_versions) -> RunnableConfig:
+        next_config = self.inner.put(config, checkpoint, metadata, new_versions)
+        self._store(self._key(config), self._entry_from_put(config, next_config, checkpoint, metadata))
+        return next_config
+
+    async def aput_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str,
+                          task_path: str = "") -> None:
+        await self.inner.aput_writes(config, writes, task_id, task_path)
+        # Pending writes change what a read of this checkpoint returns; let the next read load them
+        self._drop(self._key(config), get_checkpoint_id(config))
+
+    def put_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str,
+                   task_path: str = "") -> None:
+        self.inner.put_writes(config, writes, task_id, task_path)
+        self._drop(self._key(config), get_checkpoint_id(config))
+
+    def alist(self, config: Optional[RunnableConfig], **kwargs) -> AsyncIterator[CheckpointTuple]:
+        return self.inner.alist(config, **kwargs)
+
+    def list(self, config: Optional[RunnableConfig], **kwargs) -> Iterator[CheckpointTuple]:
+        return self.inner.list(config, **kwargs)
+
+    def _forget_thread(self, thread_id: str) -> None:
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == thread_id]:
+                self._bytes -= self._entries.pop(key).size
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await self.inner.adelete_thread(thread_id)
+        self._forget_thread(thread_id)
+
+    def delete_thread(self, thread_id: str) -> None:
+        self.inner.delete_thread(thread_id)
+        self._forget_thread(thread_id)
+
+    def get_next_version(self, current, channel):
+        return self.inner.get_next_version(current, channel)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            # Stale entries are also counted as misses, when the read goes to Postgres
+            reads = self.hits + self.misses
+            return {
+                "threads": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale": self.stale,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / reads if reads else 0.0,
+                "coalesce_writes": int(self.coalesce_writes),
+            }
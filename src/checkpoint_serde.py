@@ -0,0 +1,423 @@
+"""
+Compact storage for PostgresSaver checkpoints.
+
+Every checkpoint row holds the thread's whole message history, and most of its
+bytes are `search_knowledge` results, many of them passages an earlier search of
+the thread already returned. CompactSerializer encodes values with LangGraph's
+msgpack serializer and compresses them with zstd under its own type tag. The zstd
+window spans the whole checkpoint, so a repeated passage is stored as a reference
+to its first occurrence. Rows written with another type, such as the plain
+"msgpack" rows already in the table, are read by the LangGraph serializer as before.
+
+Compression stops at the row: every checkpoint of a thread still carries each tool
+result the thread has seen. DedupingCheckpointer stores large tool results once per
+thread in a PayloadStore, keyed by their SHA-256, and writes only the digest into
+the checkpoint (see `PAYLOAD_REF`); reads put the content back. Payloads live as
+long as their thread: compaction deletes them with the thread.
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator, Optional, Sequence, Tuple
+
+import zstandard
+from langchain_core.messages import ToolMessage
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import BaseCheckpointSaver, CheckpointTuple
+from langgraph.checkpoint.serde.base import SerializerProtocol
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+from sqlalchemy import text
+
+COMPRESSED_TYPE = "msgpack+zstd"
+
+# Content of a ToolMessage whose payload is in the PayloadStore, followed by its SHA-256
+PAYLOAD_REF = "checkpoint-payload:sha256:"
+# What a message reads as if its payload is gone, so the thread stays usable
+MISSING_PAYLOAD_MESSAGE = "[Tool result from an earlier turn, no longer stored]"
+
+
+class CompactSerializer(SerializerProtocol):
+    """LangGraph's msgpack serialization, compressed with zstd.
+
+    Values that encode to fewer than `min_size` bytes are left uncompressed, in the
+    LangGraph serializer's own format.
+    """
+
+    def __init__(self, level: int = 3, min_size: int = 512, inner: Optional[JsonPlusSerializer] = None):
+        self.inner = inner or JsonPlusSerializer()
+        self.level = level
+        self.min_size = min_size
+        # zstd contexts can't be shared between threads
+        self._local = threading.local()
+
+    @classmethod
+    def from_env(cls) -> Optional["CompactSerializer"]:
+        # Off by default: instances running older code can't read the rows it writes
+        if os.getenv("CHECKPOINT_COMPACT_SERDE", "false").lower() != "true":
+            return None
+        return cls(
+            level=int(os.getenv("CHECKPOINT_ZSTD_LEVEL", "3")),
+            min_size=int(os.getenv("CHECKPOINT_COMPRESS_MIN_BYTES", "512")),
+        )
+
+    def _contexts(self) -> Tuple[zstandard.ZstdCompressor, zstandard.ZstdDecompressor]:
+        if not hasattr(self._local, "compressor"):
+            self._local.compressor = zstandard.ZstdCompressor(level=self.level)
+            self._local.decompressor = zstandard.ZstdDecompressor()
+        return self._local.compressor, self._local.decompressor
+
+    def dumps(self, obj: Any) -> bytes:
+        return self.inner.dumps(obj)
+
+    def loads(self, data: bytes) -> Any:
+        return self.inner.loads(data)
+
+    def dumps_typed(self, obj: Any) -> Tuple[str, bytes]:
+        type_, data = self.inner.dumps_typed(obj)
+        if type_ != "msgpack" or len(data) < self.min_size:
+            return type_, data
+        compressor, _ = self._contexts()
+        return COMPRESSED_TYPE, compressor.compress(data)
+
+    def loads_typed(self, data: Tuple[str, bytes]) -> Any:
+        type_, payload = data
+        if type_ != COMPRESSED_TYPE:
+            return self.inner.loads_typed(data)
+        _, decompressor = self._contexts()
+        return self.inner.loads_typed(("msgpack", decompressor.decompress(payload)))
+
+
+def dedup_enabled() -> bool:
+    # Off by default: instances running older code can't read the references DedupingCheckpointer writes
+    return os.getenv("CHECKPOINT_DEDUP_PAYLOADS", "false").lower() == "true"
+
+
+def payload_digest(content: str) -> str:
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def _messages(checkpoint: dict) -> Optional[list]:
+    return (checkpoint.get("channel_values") or {}).get("messages")
+
+
+def _with_messages(checkpoint: dict, messages: list) -> dict:
+    return {**checkpoint, "channel_values": {**checkpoint["channel_values"], "messages": messages}}
+
+
+def externalize_payloads(checkpoint: dict, min_size: int) -> Tuple[dict, Dict[str, str]]:
+    """`checkpoint` with tool results of `min_size` characters or more replaced by references, and those payloads.
+
+    Payloads are keyed by digest. Messages are copied, not changed: the graph keeps using the originals.
+    """
+    messages = _messages(checkpoint)
+    if not messages:
+        return checkpoint, {}
+    payloads: Dict[str, str] = {}
+    stored = []
+    for message in messages:
+        content = message.content if isinstance(message, ToolMessage) else None
+        if isinstance(content, str) and len(content) >= min_size and not content.startswith(PAYLOAD_REF):
+            digest = payload_digest(content)
+            payloads[digest] = content
+            message = message.model_copy(update={"content": PAYLOAD_REF + digest})
+        stored.append(message)
+    if not payloads:
+        return checkpoint, {}
+    return _with_messages(checkpoint, stored), payloads
+
+
+def payload_refs(checkpoint: dict) -> set:
+    """Digests of the payloads `checkpoint` refers to."""
+    return {
+        m.content[len(PAYLOAD_REF):] for m in _messages(checkpoint) or []
+        if isinstance(m, ToolMessage) and isinstance(m.content, str) and m.content.startswith(PAYLOAD_REF)
+    }
+
+
+def resolve_payloads(checkpoint: dict, payloads: Dict[str, str]) -> dict:
+    """`checkpoint` with its references replaced by the payloads' content."""
+    messages = _messages(checkpoint)
+    if not messages:
+        return checkpoint
+    resolved = []
+    for message in messages:
+        content = message.content
+        if isinstance(message, ToolMessage) and isinstance(content, str) and content.startswith(PAYLOAD_REF):
+            content = payloads.get(content[len(PAYLOAD_REF):])
+            if content is None:
+                print(f"Missing checkpoint payload {message.content} of tool call {message.tool_call_id}")
+                content = MISSING_PAYLOAD_MESSAGE
+            message = message.model_copy(update={"content": content})
+        resolved.append(message)
+    return _with_messages(checkpoint, resolved)
+
+
+class PayloadStore:
+    """Tool results of checkpoints by thread and digest, in memory. Adding a payload the thread has is free."""
+
+    def __init__(self):
+        self._payloads: Dict[Tuple[str, str], str] = {}
+        self._lock = threading.Lock()
+        self.written = 0
+        self.written_bytes = 0
+        self.deduplicated = 0
+
+    def _count(self, written: Iterable[str], deduplicated: int) -> None:
+        with self._lock:
+            for content in written:
+                self.written += 1
+                self.written_bytes += len(content.encode())
+            self.deduplicated += deduplicated
+
+    def put(self, thread_id: str, payloads: Dict[str, str]) -> None:
+        with self._lock:
+            new = {digest: c for digest, c in payloads.items() if (thread_id, digest) not in self._payloads}
+            self._payloads.update({(thread_id, digest): c for digest, c in new.items()})
+        self._count(new.values(), len(payloads) - len(new))
+
+    def get(self, thread_id: str, digests: Iterable[str]) -> Dict[str, str]:
+        with self._lock:
+            return {d: self._payloads[(thread_id, d)] for d in digests if (thread_id, d) in self._payloads}
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            for key in [k for k in self._payloads if k[0] == thread_id]:
+                del self._payloads[key]
+
+    async def aput(self, thread_id: str, payloads: Dict[str, str]) -> None:
+        self.put(thread_id, payloads)
+
+    async def aget(self, thread_id: str, digests: Iterable[str]) -> Dict[str, str]:
+        return self.get(thread_id, digests)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        self.delete_thread(thread_id)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                "payloads_written": self.written,
+                "bytes_written": self.written_bytes,
+                "deduplicated": self.deduplicated,
+            }
+
+
+class PostgresPayloadStore(PayloadStore):
+    """Payloads in a Postgres table, one row per (thread, digest), with the recently used ones kept in memory.
+
+    Unlike the search cache, failures are raised: a checkpoint must not be written
+    with references to payloads that were never stored.
+    """
+
+    def __init__(self, engine, table_name: str = "checkpoint_payloads", max_cached_bytes: int = 16 * 1024 * 1024):
+        super().__init__()
+        self.engine = engine
+        self.table_name = table_name
+        self.max_cached_bytes = max_cached_bytes
+        # (thread_id, digest) -> content of payloads known to be in the table
+        self._cached: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+        self._cached_bytes = 0
+
+    async def ainit_table(self) -> None:
+        """Create the table (idempotent). Run by init_db.py, and at boot unless CHECKPOINT_TABLE_INIT=false."""
+        async def create():
+            async with self.engine._pool.connect() as conn:
+                await conn.execute(text(f"""CREATE TABLE IF NOT EXISTS "{self.table_name}"(
+                    thread_id TEXT NOT NULL,
+                    digest TEXT NOT NULL,
+                    content TEXT NOT NULL,
+                    PRIMARY KEY (thread_id, digest)
+                );"""))
+                await conn.commit()
+
+        await self.engine._run_as_async(create())
+
+    def init_table(self) -> None:
+        self.engine._run_as_sync(self.ainit_table())
+
+    def _remember(self, thread_id: str, payloads: Dict[str, str]) -> None:
+        with self._lock:
+            for digest, content in payloads.items():
+                key = (thread_id, digest)
+                previous = self._cached.pop(key, None)
+                if previous is not None:
+                    self._cached_bytes -= len(previous.encode())
+                self._cached[key] = content
+                self._cached_bytes += len(content.encode())
+            while self._cached_bytes > self.max_cached_bytes and self._cached:
+                _, evicted = self._cached.popitem(last=False)
+                self._cached_bytes -= len(evicted.encode())
+
+    def _recall(self, thread_id: str, digests: Iterable[str]) -> Dict[str, str]:
+        found = {}
+        with self._lock:
+            for digest in digests:
+                content = self._cached.get((thread_id, digest))
+                if content is not None:
+                    self._cached.move_to_end((thread_id, digest))
+                    found[digest] = content
+        return found
+
+    async def _aput(self, thread_id: str, payloads: Dict[str, str]) -> None:
+        known = self._recall(thread_id, payloads)
+        new = {digest: content for digest, content in payloads.items() if digest not in known}
+        if new:
+            async with self.engine._pool.connect() as conn:
+                result = await conn.execute(
+                    text(f"""INSERT INTO "{self.table_name}" (thread_id, digest, content)
+                        SELECT :thread_id, digest, content
+                        FROM unnest(CAST(:digests AS TEXT[]), CAST(:contents AS TEXT[])) AS payload(digest, content)
+                        ON CONFLICT (thread_id, digest) DO NOTHING
+                        RETURNING digest"""),
+                    {"thread_id": thread_id, "digests": list(new), "contents": list(new.values())},
+                )
+                inserted = {row[0] for row in result.fetchall()}
+                await conn.commit()
+            self._remember(thread_id, new)
+        else:
+            inserted = set()
+        self._count((new[digest] for digest in inserted), len(payloads) - len(inserted))
+
+    async def _aget(self, thread_id: str, digests: Iterable[str]) -> Dict[str, str]:
+        digests = set(digests)
+        found = self._recall(thread_id, digests)
+        missing = digests - found.keys()
+        if missing:
+            async with self.engine._pool.connect() as conn:
+                result = await conn.execute(
+                    text(f"""SELECT digest, content FROM "{self.table_name}"
+                        WHERE thread_id = :thread_id AND digest = ANY(:digests)"""),
+                    {"thread_id": thread_id, "digests": list(missing)},
+                )
+                loaded = {row[0]: row[1] for row in result.fetchall()}
+            self._remember(thread_id, loaded)
+            found.update(loaded)
+        return found
+
+    async def _adelete_thread(self, thread_id: str) -> None:
+        async with self.engine._pool.connect() as conn:
+            await conn.execute(text(f'DELETE FROM "{self.table_name}" WHERE thread_id = :thread_id'),
+                               {"thread_id": thread_id})
+            await conn.commit()
+        with self._lock:
+            for key in [k for k in self._cached if k[0] == thread_id]:
+                self._cached_bytes -= len(self._cached.pop(key).encode())
+
+    def put(self, thread_id: str, payloads: Dict[str, str]) -> None:
+        self.engine._run_as_sync(self._aput(thread_id, payloads))
+
+    def get(self, thread_id: str, digests: Iterable[str]) -> Dict[str, str]:
+        return self.engine._run_as_sync(self._aget(thread_id, digests))
+
+    def delete_thread(self, thread_id: str) -> None:
+        self.engine._run_as_sync(self._adelete_thread(thread_id))
+
+    async def aput(self, thread_id: str, payloads: Dict[str, str]) -> None:
+        await self.engine._run_as_async(self._aput(thread_id, payloads))
+
+    async def aget(self, thread_id: str, digests: Iterable[str]) -> Dict[str, str]:
+        return await self.engine._run_as_async(self._aget(thread_id, digests))
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await self.engine._run_as_async(self._adelete_thread(thread_id))
+
+    def get_stats(self) -> dict:
+        stats = super().get_stats()
+        with self._lock:
+            stats["cached_bytes"] = self._cached_bytes
+        return stats
+
+
+class DedupingCheckpointer(BaseCheckpointSaver):
+    """Checkpointer that stores each large tool result once per thread in `store`, writing through to `inner`.
+
+    Checkpoints reach `inner` with ToolMessages of `min_size` characters or more
+    replaced by a reference to their digest, and are read back with the content in
+    place. Pending writes are passed through as they are.
+    """
+
+    def __init__(self, inner: BaseCheckpointSaver, store: PayloadStore, min_size: int = 512):
+        super().__init__(serde=inner.serde)
+        self.inner = inner
+        self.store = store
+        self.min_size = min_size
+
+    @classmethod
+    def from_env(cls, inner: BaseCheckpointSaver, engine) -> Optional["DedupingCheckpointer"]:
+        if engine is None or not dedup_enabled():
+            return None
+        return cls(
+            inner,
+            PostgresPayloadStore(engine),
+            min_size=int(os.getenv("CHECKPOINT_PAYLOAD_MIN_CHARS", "512")),
+        )
+
+    @staticmethod
+    def _thread_id(config: RunnableConfig) -> str:
+        return config["configurable"]["thread_id"]
+
+    def _resolved(self, saved: CheckpointTuple, payloads: Dict[str, str]) -> CheckpointTuple:
+        return saved._replace(checkpoint=resolve_payloads(saved.checkpoint, payloads))
+
+    async def _aresolve(self, saved: Optional[CheckpointTuple]) -> Optional[CheckpointTuple]:
+        digests = payload_refs(saved.checkpoint) if saved is not None else None
+        if not digests:
+            return saved
+        return self._resolved(saved, await self.store.aget(self._thread_id(saved.config), digests))
+
+    def _resolve(self, saved: Optional[CheckpointTuple]) -> Optional[CheckpointTuple]:
+        digests = payload_refs(saved.checkpoint) if saved is not None else None
+        if not digests:
+            return saved
+        return self._resolved(saved, self.store.get(self._thread_id(saved.config), digests))
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await self._aresolve(await self.inner.aget_tuple(config))
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return self._resolve(self.inner.get_tuple(config))
+
+    async def alist(self, config: Optional[RunnableConfig], **kwargs) -> AsyncIterator[CheckpointTuple]:
+        async for saved in self.inner.alist(config, **kwargs):
+            yield await self._aresolve(saved)
+
+    def list(self, config: Optional[RunnableConfig], **kwargs) -> Iterator[CheckpointTuple]:
+        for saved in self.inner.list(config, **kwargs):
+            yield self._resolve(saved)
+
+    async def aput(self, config: RunnableConfig, checkpoint, metadata, new_versions) -> RunnableConfig:
+        checkpoint, payloads = externalize_payloads(checkpoint, self.min_size)
+        if payloads:
+            # Before the checkpoint: a reader must never find a reference without its payload
+            await self.store.aput(self._thread_id(config), payloads)
+        return await self.inner.aput(config, checkpoint, metadata, new_versions)
+
+    def put(self, config: RunnableConfig, checkpoint, metadata, new_versions) -> RunnableConfig:
+        checkpoint, payloads = externalize_payloads(checkpoint, self.min_size)
+        if payloads:
+            self.store.put(self._thread_id(config), payloads)
+        return self.inner.put(config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str,
+                          task_path: str = "") -> None:
+        await self.inner.aput_writes(config, writes, task_id, task_path)
+
+    def put_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str,
+                   task_path: str = "") -> None:
+        self.inner.put_writes(config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await self.inner.adelete_thread(thread_id)
+        await self.store.adelete_thread(thread_id)
+
+    def delete_thread(self, thread_id: str) -> None:
+        self.inner.delete_thread(thread_id)
+        self.store.delete_thread(thread_id)
+
+    def get_next_version(self, current, channel):
+        return self.inner.get_next_version(current, channel)
+
+    def get_stats(self) -> dict:
+        return self.store.get_stats()
@@ -0,0 +1,238 @@
+"""
+Retention for the LangGraph checkpoint tables. PostgresSaver writes a checkpoint and its
+pending writes on every graph step and never deletes them; this keeps the newest
+`keep_last` checkpoints per thread and drops threads that have been idle longer than a TTL,
+with their tool-result payloads (see checkpoint_serde.DedupingCheckpointer).
+
+Work is done in batches of threads, each in its own short transaction, so live chats
+are never blocked behind a long-running delete.
+
+    PYTHONPATH=src python src/compaction.py --keep-last 1 --ttl-days 30
+    PYTHONPATH=src python src/compaction.py --interval 3600   # keep running, once an hour
+"""
+
+import argparse
+import asyncio
+import os
+import time
+from typing import List, Optional
+from uuid import UUID
+
+from sqlalchemy import text
+
+from tag import TAG
+
+# 100-ns intervals between the UUID epoch (1582-10-15) and the Unix epoch
+UUID_EPOCH_OFFSET = 0x01B21DD213814000
+
+
+def checkpoint_id_at(timestamp: float) -> str:
+    """The smallest checkpoint id LangGraph could have written at `timestamp`.
+
+    Checkpoint ids are UUIDv6, whose string form sorts by creation time, so comparing
+    ids against this tells whether a checkpoint is older than `timestamp`.
+    """
+    uuid_time = int(timestamp * 10_000_000) + UUID_EPOCH_OFFSET
+    uuid_int = ((uuid_time >> 12) & 0xFFFFFFFFFFFF) << 80
+    uuid_int |= (0x6000 | (uuid_time & 0x0FFF)) << 64
+    uuid_int |= 0x8000 << 48  # RFC 4122 variant; clock sequence and node left at zero
+    return str(UUID(int=uuid_int))
+
+
+class CheckpointCompactor:
+    """Deletes superseded checkpoints and idle threads from the PostgresSaver tables."""
+
+    def __init__(
+        self,
+        engine,
+        table_name: str = "checkpoints",
+        keep_last: int = 1,
+        thread_ttl: Optional[float] = None,
+        batch_size: int = 200,
+        batch_pause: float = 0.0,
+        payloads_table_name: str = "checkpoint_payloads",
+    ):
+        if keep_last < 1:
+            raise ValueError("keep_last must be at least 1")
+        self.engine = engine
+        self.table_name = table_name
+        self.writes_table_name = f"{table_name}_writes"
+        self.payloads_table_name = payloads_table_name
+        # Whether the payloads table exists, checked once per run
+        self._has_payloads = False
+        self.keep_last = keep_last
+        self.thread_ttl = thread_ttl
+        self.batch_size = batch_size
+        self.batch_pause = batch_pause
+
+    @classmethod
+    def from_env(cls, engine) -> "CheckpointCompactor":
+        thread_ttl = float(os.getenv("CHECKPOINT_THREAD_TTL", "0"))
+        return cls(
+            engine,
+            keep_last=int(os.getenv("CHECKPOINT_KEEP_LAST", "1")),
+            thread_ttl=thread_ttl or None,
+            batch_size=int(os.getenv("CHECKPOINT_COMPACTION_BATCH_SIZE", "200")),
+            batch_pause=float(os.getenv("CHECKPOINT_COMPACTION_BATCH_PAUSE", "0")),
+        )
+
+    async def _next_threads(self, conn, after: str, idle_before: Optional[str] = None) -> List[str]:
+        having = "HAVING max(checkpoint_id) < :idle_before" if idle_before else ""
+        result = await conn.execute(
+            text(f"""SELECT thread_id FROM "{self.table_name}"
+                WHERE thread_id > :after
+                GROUP BY thread_id {having}
+                ORDER BY thread_id
+                LIMIT :limit"""),
+            {"after": after, "idle_before": idle_before, "limit": self.batch_size},
+        )
+        return [row[0] for row in result.fetchall()]
+
+    async def _delete_threads(self, conn, threads: List[str], idle_before: str) -> tuple:
+        # Whether each thread is still idle is checked again in the statement that deletes it,
+        # so a thread that wrote a checkpoint since it was listed is left alone. One statement
+        # gives the deletes one snapshot, so they agree on which threads those are.
+        payloads = (
+            f'payloads AS (DELETE FROM "{self.payloads_table_name}" WHERE thread_id IN (SELECT thread_id FROM idle)),'
+            if self._has_payloads else ""
+        )
+        result = await conn.execute(
+            text(f"""WITH idle AS (
+                    SELECT thread_id FROM "{self.table_name}"
+                    WHERE thread_id = ANY(:threads)
+                    GROUP BY thread_id
+                    HAVING max(checkpoint_id) < :idle_before
+                ),
+                {payloads}
+                writes AS (
+                    DELETE FROM "{self.writes_table_name}" WHERE thread_id IN (SELECT thread_id FROM idle) RETURNING 1
+                ),
+                checkpoints AS (
+                    DELETE FROM "{self.table_name}" WHERE thread_id IN (SELECT thread_id FROM idle) RETURNING 1
+                )
+                SELECT (SELECT count(*) FROM idle), (SELECT count(*) FROM checkpoints), (SELECT count(*) FROM writes)"""),
+            {"threads": threads, "idle_before": idle_before},
+        )
+        return result.one()
+
+    async def _prune_threads(self, conn, threads: List[str]) -> tuple:
+        # The floor is the oldest checkpoint kept in each (thread, namespace). Only rows strictly
+        # older than it are deleted, so checkpoints written while this runs are never touched.
+        # The floor's parent keeps its writes: they hold the pending sends read with the floor.
+        floors = f"""WITH floors AS (
+            SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id FROM (
+                SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id,
+                    row_number() OVER (PARTITION BY thread_id, checkpoint_ns ORDER BY checkpoint_id DESC) AS rank
+                FROM "{self.table_name}"
+                WHERE thread_id = ANY(:threads)
+            ) ranked
+            WHERE rank = :keep_last
+        )"""
+        params = {"threads": threads, "keep_last": self.keep_last}
+        writes = await conn.execute(
+            text(f"""{floors}
+                DELETE FROM "{self.writes_table_name}" w USING floors f
+                WHERE w.thread_id = f.thread_id
+                    AND w.checkpoint_ns = f.checkpoint_ns
+                    AND w.checkpoint_id < f.checkpoint_id
+                    AND w.checkpoint_id IS DISTINCT FROM f.parent_checkpoint_id"""),
+            params,
+        )
+        checkpoints = await conn.execute(
+            text(f"""{floors}
+                DELETE FROM "{self.table_name}" c USING floors f
+                WHERE c.thread_id = f.thread_id
+                    AND c.checkpoint_ns = f.checkpoint_ns
+                    AND c.checkpoint_id < f.checkpoint_id"""),
+            params,
+        )
+        return checkpoints.rowcount, writes.rowcount
+
+    async def _run_pass(self, stats: dict, idle_before: Optional[str] = None) -> None:
+        after = ""
+        while True:
+            async with self.engine._pool.connect() as conn:
+                threads = await self._next_threads(conn, after, idle_before)
+                if not threads:
+                    return
+                if idle_before:
+                    expired, checkpoints, writes = await self._delete_threads(conn, threads, idle_before)
+                    stats["threads_expired"] += expired
+                else:
+                    checkpoints, writes = await self._prune_threads(conn, threads)
+                    stats["threads_scanned"] += len(threads)
+                await conn.commit()
+
+            stats["checkpoints_deleted"] += checkpoints
+            stats["writes_deleted"] += writes
+            stats["batches"] += 1
+            after = threads[-1]
+            if self.batch_pause:
+                await asyncio.sleep(self.batch_pause)
+
+    async def _acompact(self, now: Optional[float] = None) -> dict:
+        started_at = time.perf_counter()
+        stats = {
+            "threads_scanned": 0,
+            "threads_expired": 0,
+            "checkpoints_deleted": 0,
+            "writes_deleted": 0,
+            "batches": 0,
+        }
+        if self.thread_ttl:
+            async with self.engine._pool.connect() as conn:
+                name = f'"{self.payloads_table_name}"'
+                result = await conn.execute(text("SELECT to_regclass(:name)"), {"name": name})
+                self._has_payloads = result.scalar() is not None
+            now = time.time() if now is None else now
+            await self._run_pass(stats, idle_before=checkpoint_id_at(now - self.thread_ttl))
+        await self._run_pass(stats)
+        stats["seconds"] = round(time.perf_counter() - started_at, 3)
+        return stats
+
+    async def acompact(self, now: Optional[float] = None) -> dict:
+        return await self.engine._run_as_async(self._acompact(now))
+
+    def compact(self, now: Optional[float] = None) -> dict:
+        return self.engine._run_as_sync(self._acompact(now))
+
+
+async def main(args) -> None:
+    from langchain_google_cloud_sql_pg import PostgresEngine
+
+    if args.database_url:
+        engine = PostgresEngine.from_engine_args(args.database_url)
+    else:
+        from agent_service import get_engine_kwargs
+        engine = await PostgresEngine.afrom_instance(**get_engine_kwargs())
+
+    compactor = CheckpointCompactor.from_env(engine)
+    if args.keep_last is not None:
+        compactor.keep_last = args.keep_last
+    if args.ttl_days is not None:
+        compactor.thread_ttl = args.ttl_days * 86400 or None
+    if args.batch_size is not None:
+        compactor.batch_size = args.batch_size
+
+    try:
+        while True:
+            print(f"{TAG} compaction: {await compactor.acompact()}")
+            if not args.interval:
+                break
+            await asyncio.sleep(args.interval)
+    finally:
+        await engine.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Delete superseded checkpoints and idle threads")
+    parser.add_argument("--keep-last", type=int, help="checkpoints kept per thread (CHECKPOINT_KEEP_LAST)")
+    parser.add_argument(
+        "--ttl-days",
+        type=float,
+        help="delete threads idle this many days, 0 to keep them (CHECKPOINT_THREAD_TTL, which is in seconds)",
+    )
+    parser.add_argument("--batch-size", type=int, help="threads per transaction (CHECKPOINT_COMPACTION_BATCH_SIZE)")
+    parser.add_argument("--interval", type=float, default=0, help="keep running, compacting every INTERVAL seconds")
+    parser.add_argument("--database-url", help="postgresql+asyncpg:// URL instead of the Cloud SQL instance")
+    asyncio.run(main(parser.parse_args()))
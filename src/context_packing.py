@@ -0,0 +1,244 @@
+"""
+Packing knowledge search hits into the model's context under a token budget.
+
+`search_knowledge` used to return every hit's full `content`. `ContextPacker.format`
+returns the same "From {book_id} (page {page}): ..." lines, but:
+
+- hits of the same book that share a page, or share sentences (overlapping chunks),
+  are merged into one passage without the repeated sentences
+- from each passage it keeps the sentences that share the most (rarer) words with
+  the tool call's queries, in their original order, with "…" where text was left out
+- one call returns at most `call_budget` tokens, and all calls of a turn together at
+  most `turn_budget` (see `search_token_budget`)
+
+Once the turn is done, `reference` is what the history keeps of the results: the
+sources, not the text (see `HistoryManager`).
+"""
+
+import math
+import os
+import re
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional
+
+from search_cache import STOPWORDS, TOKEN_PATTERN
+
+# As in history.truncate_text
+CHARS_PER_TOKEN = 4
+
+SENTENCE_END = re.compile(r"(?<=[.!?…])[\"'”’)\]]*\s+")
+SOURCE_LINE = re.compile(r"^From (.+?)(?: \((pages? [^)]+)\))?: ", re.MULTILINE)
+
+BUDGET_EXHAUSTED_MESSAGE = (
+    "The knowledge search budget for this turn is used up. Answer from the results you already have."
+)
+
+
+def count_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def split_sentences(text: str) -> List[str]:
+    return [s.strip() for s in SENTENCE_END.split(text) if s.strip()]
+
+
+def terms(text: str) -> set:
+    return {t for t in TOKEN_PATTERN.findall(text.lower()) if t not in STOPWORDS}
+
+
+class TokenBudget:
+    """Tokens left for search results in one turn."""
+
+    def __init__(self, tokens: int):
+        self.remaining = tokens
+
+    def take(self, tokens: int) -> None:
+        self.remaining = max(0, self.remaining - tokens)
+
+
+_search_token_budget: ContextVar[Optional[TokenBudget]] = ContextVar("search_token_budget", default=None)
+
+
+@contextmanager
+def search_token_budget(tokens: Optional[int]) -> Iterator[Optional[TokenBudget]]:
+    """Share `tokens` among the search results of every tool call made in this context (one turn)."""
+    budget = TokenBudget(tokens) if tokens else None
+    token = _search_token_budget.set(budget)
+    try:
+        yield budget
+    finally:
+        _search_token_budget.reset(token)
+
+
+class _Passage:
+    def __init__(self, book_id, pages: List, sentences: List[str], rank: int):
+        self.book_id = book_id
+        self.pages = pages
+        self.sentences = sentences
+        self.rank = rank
+
+    def source(self) -> str:
+        pages = [str(p) for p in self.pages if p not in (None, "")]
+        if not pages:
+            return f"From {self.book_id}"
+        if len(pages) == 1:
+            return f"From {self.book_id} (page {pages[0]})"
+        return f"From {self.book_id} (pages {', '.join(pages)})"
+
+
+def merge_passages(hits: List[dict]) -> List[_Passage]:
+    """One passage per book page, folding in hits of the same book that repeat its sentences."""
+    passages: List[_Passage] = []
+    by_page: Dict[tuple, _Passage] = {}
+    for rank, hit in enumerate(hits):
+        book_id = hit.get("book_id", "Unknown")
+        page = hit.get("page_number", "")
+        sentences = split_sentences(hit.get("content", ""))
+        passage = by_page.get((book_id, page)) if page not in (None, "") else None
+        if passage is None:
+            seen = set(sentences)
+            passage = next((p for p in passages if p.book_id == book_id and seen.intersection(p.sentences)), None)
+        if passage is None:
+            passage = _Passage(book_id, [page], [], rank)
+            passages.append(passage)
+        elif page not in passage.pages:
+            passage.pages.append(page)
+        known = set(passage.sentences)
+        passage.sentences += [s for s in sentences if s not in known]
+        if page not in (None, ""):
+            by_page[(book_id, page)] = passage
+    return passages
+
+
+class ContextPacker:
+    """Formats search hits as their most query-relevant sentences, within per-call and per-turn token budgets."""
+
+    def __init__(self, call_budget: int = 400, turn_budget: int = 1000):
+        self.call_budget = call_budget
+        self.turn_budget = turn_budget
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.tokens_in = 0
+        self.tokens_out = 0
+        self.exhausted = 0
+
+    @classmethod
+    def from_env(cls) -> Optional["ContextPacker"]:
+        if os.getenv("CONTEXT_PACKING_ENABLED", "true").lower() != "true":
+            return None
+        return cls(
+            call_budget=int(os.getenv("CONTEXT_CALL_TOKENS", "400")),
+            turn_budget=int(os.getenv("CONTEXT_TURN_TOKENS", "1000")),
+        )
+
+    def format(self, queries: List[str], hits: List[dict]) -> str:
+        """The tool result for `hits` of a call searching `queries`, drawing on the turn's budget."""
+        if not hits:
+            return "No relevant insights found in the knowledge base."
+        turn = _search_token_budget.get()
+        budget = self.call_budget if turn is None else min(self.call_budget, turn.remaining)
+        tokens_in = sum(count_tokens(hit.get("content", "")) for hit in hits)
+        text = self.pack(queries, merge_passages(hits), budget) if budget > 0 else ""
+        used = count_tokens(text)
+        if not text:
+            # Too little left for even one cut-down passage
+            text = BUDGET_EXHAUSTED_MESSAGE
+        if turn is not None:
+            turn.take(used)
+        with self._lock:
+            self.calls += 1
+            self.tokens_in += tokens_in
+            self.tokens_out += used
+            self.exhausted += not used
+        return text
+
+    def pack(self, queries: List[str], passages: List[_Passage], budget: int) -> str:
+        query_terms = set().union(*(terms(q) for q in queries)) if queries else set()
+        sentence_terms = [[terms(s) for s in p.sentences] for p in passages]
+        # Words in many of the hits' sentences say little about which sentence answers the query
+        document_frequency: Dict[str, int] = {}
+        for passage_terms in sentence_terms:
+            for words in passage_terms:
+                for word in words & query_terms:
+                    document_frequency[word] = document_frequency.get(word, 0) + 1
+        total = sum(len(s) for s in sentence_terms) or 1
+
+        def score(i: int, j: int) -> float:
+            return sum(math.log(1 + total / document_frequency[w]) for w in sentence_terms[i][j] & query_terms)
+
+        scores = [[score(i, j) for j in range(len(p.sentences))] for i, p in enumerate(passages)]
+        chosen: List[set] = [set() for _ in passages]
+        remaining = budget
+
+        def take(i: int, j: int) -> bool:
+            nonlocal remaining
+            cost = count_tokens(passages[i].sentences[j]) + 1
+            if not chosen[i]:
+                cost += count_tokens(passages[i].source() + ": ")
+            if cost > remaining:
+                return False
+            chosen[i].add(j)
+            remaining -= cost
+            return True
+
+        # Every passage's best sentence first, in rank order; then the best of the rest; then
+        # the passages' remaining sentences in reading order while the budget lasts
+        best = [max(range(len(p.sentences)), key=lambda j: (scores[i][j], -j)) if p.sentences else None
+                for i, p in enumerate(passages)]
+        for i in range(len(passages)):
+            if best[i] is not None:
+                take(i, best[i])
+        relevant = sorted(
+            ((i, j) for i, p in enumerate(passages) for j in range(len(p.sentences)) if scores[i][j] > 0),
+            key=lambda ij: (-scores[ij[0]][ij[1]], passages[ij[0]].rank, ij[1]),
+        )
+        for i, j in relevant:
+            if j not in chosen[i]:
+                take(i, j)
+        for i, passage in enumerate(passages):
+            for j in range(len(passage.sentences)):
+                if j not in chosen[i] and not take(i, j):
+                    break
+
+        lines = []
+        for i, passage in enumerate(passages):
+            if not chosen[i]:
+                # Not even its best sentence fit: cut it to the budget that is left, if any
+                if best[i] is not None and remaining > count_tokens(passage.source()) + 8:
+                    text = passage.sentences[best[i]][:(remaining - count_tokens(passage.source()) - 4) * CHARS_PER_TOKEN]
+                    lines.append(f"{passage.source()}: {text.rsplit(' ', 1)[0]} …")
+                    remaining = 0
+                continue
+            parts, previous = ["…"] if min(chosen[i]) > 0 else [], None
+            for j in sorted(chosen[i]):
+                if previous is not None and j != previous + 1:
+                    parts.append("…")
+                parts.append(passage.sentences[j])
+                previous = j
+            if previous != len(passage.sentences) - 1:
+                parts.append("…")
+            lines.append(f"{passage.source()}: {' '.join(parts)}")
+        return "\n\n".join(lines)
+
+    @staticmethod
+    def reference(content: str) -> Optional[str]:
+        """What a finished turn keeps of a search result: its sources. None if it names none."""
+        sources = []
+        for book_id, pages in SOURCE_LINE.findall(content):
+            source = f"{book_id}, {pages}" if pages else book_id
+            if source not in sources:
+                sources.append(source)
+        if not sources:
+            return None
+        return f"[Knowledge search results from an earlier turn, text omitted: {'; '.join(sources)}]"
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "tokens_in": self.tokens_in,
+                "tokens_out": self.tokens_out,
+                "budget_exhausted": self.exhausted,
+            }
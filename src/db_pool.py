@@ -0,0 +1,131 @@
+import math
+import os
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+
+def percentile(samples, fraction: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class PoolMetrics:
+    """Counters for connection checkouts: how many callers are waiting and how long acquiring took."""
+
+    def __init__(self, window: int = 1024):
+        self._lock = threading.Lock()
+        self._latencies: deque = deque(maxlen=window)
+        self.waiting = 0
+        self.max_waiting = 0
+        self.acquired = 0
+        self.timeouts = 0
+        self.total_acquire_seconds = 0.0
+        self.max_acquire_seconds = 0.0
+
+    def start(self) -> float:
+        with self._lock:
+            self.waiting += 1
+            self.max_waiting = max(self.max_waiting, self.waiting)
+        return time.perf_counter()
+
+    def finish(self, started_at: float, timed_out: bool = False) -> None:
+        elapsed = time.perf_counter() - started_at
+        with self._lock:
+            self.waiting -= 1
+            if timed_out:
+                self.timeouts += 1
+                return
+            self.acquired += 1
+            self.total_acquire_seconds += elapsed
+            self.max_acquire_seconds = max(self.max_acquire_seconds, elapsed)
+            self._latencies.append(elapsed)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            latencies = list(self._latencies)
+            return {
+                "waiting": self.waiting,
+                "max_waiting": self.max_waiting,
+                "acquired": self.acquired,
+                "timeouts": self.timeouts,
+                "acquire_ms_avg": 1000 * self.total_acquire_seconds / self.acquired if self.acquired else 0.0,
+                "acquire_ms_p95": 1000 * percentile(latencies, 0.95),
+                "acquire_ms_max": 1000 * self.max_acquire_seconds,
+            }
+
+
+class InstrumentedPoolMixin:
+    """Times every checkout from a QueuePool subclass; the time includes opening new connections."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+
+    def _do_get(self):
+        started_at = self.metrics.start()
+        try:
+            record = super()._do_get()
+        except exc.TimeoutError:
+            self.metrics.finish(started_at, timed_out=True)
+            raise
+        except BaseException:
+            self.metrics.finish(started_at)
+            raise
+        self.metrics.finish(started_at)
+        return record
+
+
+class InstrumentedAsyncQueuePool(InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def worker_share(total: int, workers: int) -> int:
+    """One worker's part of an instance-wide connection budget, rounded up so every worker gets one."""
+    return max(1, math.ceil(total / workers)) if total > 0 else 0
+
+
+def get_pool_args() -> dict:
+    """`create_async_engine` pool arguments for the checkpointer engine, from POSTGRES_POOL_* env vars.
+
+    POSTGRES_POOL_SIZE and POSTGRES_POOL_MAX_OVERFLOW are per instance; with several
+    worker processes (WORKERS, see serve.py) each gets its share.
+    """
+    from serve import get_worker_count
+    workers = get_worker_count()
+    return dict(
+        poolclass=InstrumentedAsyncQueuePool,
+        pool_size=worker_share(int(os.getenv("POSTGRES_POOL_SIZE", "5")), workers),
+        max_overflow=worker_share(int(os.getenv("POSTGRES_POOL_MAX_OVERFLOW", "10")), workers),
+        pool_timeout=float(os.getenv("POSTGRES_POOL_TIMEOUT", "30")),
+        pool_recycle=int(os.getenv("POSTGRES_POOL_RECYCLE", "1800")),
+        pool_pre_ping=os.getenv("POSTGRES_POOL_PRE_PING", "true").lower() == "true",
+    )
+
+
+def get_pool_stats(engine) -> Optional[dict]:
+    """Pool occupancy for a PostgresEngine (or a SQLAlchemy engine); None when there is no pool to report."""
+    sqlalchemy_engine = getattr(engine, "_pool", engine)
+    pool = getattr(sqlalchemy_engine, "pool", None)
+    if pool is None or not hasattr(pool, "checkedout"):
+        return None
+
+    stats = {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        # SQLAlchemy counts overflow from -size while the pool is still filling
+        "overflow": max(0, pool.overflow()),
+        "max_overflow": pool._max_overflow,
+        "timeout": pool.timeout(),
+    }
+    metrics = getattr(pool, "metrics", None)
+    if metrics is not None:
+        stats.update(metrics.get_stats())
+    return stats
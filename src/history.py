@@ -0,0 +1,180 @@
+import os
+from typing import List, Optional
+
+from langchain_core.messages import BaseMessage, HumanMessage, RemoveMessage, SystemMessage, ToolMessage
+from langchain_core.messages.utils import count_tokens_approximately
+from langchain_core.runnables import RunnableLambda
+
+SUMMARY_PROMPT = """You maintain a running summary of a conversation between a user and a knowledgeable assistant.
+Fold the new messages into the existing summary. Keep facts the user shared about themselves, their goals and
+preferences, open questions, and the key ideas the assistant offered. Write plain prose, at most {max_tokens} tokens."""
+
+
+def split_turns(messages: List[BaseMessage]) -> List[List[BaseMessage]]:
+    """Group messages into turns, each starting at a user message, so tool calls stay with their results."""
+    turns: List[List[BaseMessage]] = []
+    for message in messages:
+        if isinstance(message, HumanMessage) or not turns:
+            turns.append([])
+        turns[-1].append(message)
+    return turns
+
+
+def truncate_text(content: str, max_tokens: int) -> str:
+    max_chars = max_tokens * 4
+    if len(content) <= max_chars:
+        return content
+    return content[:max_chars].rstrip() + " …[truncated]"
+
+
+def format_transcript(messages: List[BaseMessage]) -> str:
+    lines = []
+    for message in messages:
+        if isinstance(message, HumanMessage):
+            lines.append(f"User: {message.text()}")
+        elif isinstance(message, ToolMessage):
+            lines.append(f"Knowledge search results: {message.text()}")
+        elif message.text():
+            lines.append(f"Assistant: {message.text()}")
+    return "\n".join(lines)
+
+
+class HistoryManager:
+    """Bounds the history sent to the model on every call (used as the agent's pre-model hook).
+
+    - the last `keep_turns` turns are sent verbatim
+    - tool outputs in older turns are trimmed to `tool_output_max_tokens`, in the checkpoint too;
+      with a `context_packer`, search results of every finished turn are replaced by a reference
+      to their sources instead
+    - once the history exceeds `max_history_tokens`, older turns are folded into a rolling
+      summary that is stored in the checkpoint's `summary` key and removed from `messages`
+    """
+
+    def __init__(
+        self,
+        llm,
+        max_history_tokens: int = 6000,
+        keep_turns: int = 4,
+        summary_max_tokens: int = 500,
+        tool_output_max_tokens: int = 200,
+        context_packer=None,
+    ):
+        self.llm = llm
+        self.context_packer = context_packer
+        self.max_history_tokens = max_history_tokens
+        self.keep_turns = keep_turns
+        self.summary_max_tokens = summary_max_tokens
+        self.tool_output_max_tokens = tool_output_max_tokens
+
+    @classmethod
+    def from_env(cls, llm, context_packer=None) -> Optional["HistoryManager"]:
+        if os.getenv("HISTORY_ENABLED", "true").lower() != "true":
+            return None
+        return cls(
+            llm,
+            max_history_tokens=int(os.getenv("HISTORY_MAX_TOKENS", "6000")),
+            keep_turns=int(os.getenv("HISTORY_KEEP_TURNS", "4")),
+            summary_max_tokens=int(os.getenv("HISTORY_SUMMARY_MAX_TOKENS", "500")),
+            tool_output_max_tokens=int(os.getenv("HISTORY_TOOL_OUTPUT_MAX_TOKENS", "200")),
+            context_packer=context_packer,
+        )
+
+    def _trim_tool_outputs(self, turns: List[List[BaseMessage]]) -> List[BaseMessage]:
+        """Replace oversized tool outputs in place; returns the replacements so they can be written to state."""
+        replacements = []
+        for turn in turns:
+            for i, message in enumerate(turn):
+                if isinstance(message, ToolMessage) and isinstance(message.content, str):
+                    trimmed = truncate_text(message.content, self.tool_output_max_tokens)
+                    if trimmed != message.content:
+                        turn[i] = message.model_copy(update={"content": trimmed})
+                        replacements.append(turn[i])
+        return replacements
+
+    def _reference_tool_outputs(self, turns: List[List[BaseMessage]]) -> List[BaseMessage]:
+        """Replace search results in finished turns by their sources, in place; returns the replacements."""
+        replacements = []
+        for turn in turns:
+            for i, message in enumerate(turn):
+                if isinstance(message, ToolMessage) and isinstance(message.content, str):
+                    reference = self.context_packer.reference(message.content)
+                    if reference is not None and reference != message.content:
+                        turn[i] = message.model_copy(update={"content": reference})
+                        replacements.append(turn[i])
+        return replacements
+
+    def _plan(self, state: dict):
+        turns = split_turns(list(state["messages"]))
+        # The model has answered from them; later turns only need to know where they came from
+        references = self._reference_tool_outputs(turns[:-1]) if self.context_packer else []
+        keep = min(self.keep_turns, len(turns))
+
+        # The recent window itself must fit the budget; the current turn is always kept
+        while keep > 1 and count_tokens_approximately(
+            [m for turn in turns[-keep:] for m in turn]
+        ) > self.max_history_tokens:
+            keep -= 1
+
+        older, recent = turns[:-keep], turns[-keep:]
+        replacements = references + self._trim_tool_outputs(older)
+        older_messages = [m for turn in older for m in turn]
+        recent_messages = [m for turn in recent for m in turn]
+
+        total = count_tokens_approximately(older_messages + recent_messages)
+        fold = older_messages if older_messages and total > self.max_history_tokens else []
+        return older_messages, recent_messages, replacements, fold
+
+    def _summary_messages(self, summary: str, fold: List[BaseMessage]) -> List[BaseMessage]:
+        return [
+            SystemMessage(content=SUMMARY_PROMPT.format(max_tokens=self.summary_max_tokens)),
+            HumanMessage(content=f"Existing summary:\n{summary or '(none)'}\n\nNew messages:\n{format_transcript(fold)}"),
+        ]
+
+    def _update(self, state: dict, older, recent, replacements, fold, new_summary: Optional[str]) -> dict:
+        summary = state.get("summary", "")
+        update: dict = {}
+
+        if fold and new_summary:
+            summary = truncate_text(new_summary, self.summary_max_tokens)
+            update["summary"] = summary
+            folded = {m.id for m in fold}
+            update["messages"] = [RemoveMessage(id=m.id) for m in fold if m.id] + [
+                m for m in replacements if m.id not in folded
+            ]
+            llm_messages = recent
+        elif fold:
+            # Summarizing failed: leave state alone and send only the recent window this call
+            llm_messages = recent
+        else:
+            if replacements:
+                update["messages"] = replacements
+            llm_messages = older + recent
+
+        if summary:
+            llm_messages = [SystemMessage(content=f"Summary of the earlier conversation:\n{summary}")] + llm_messages
+        update["llm_input_messages"] = llm_messages
+        return update
+
+    def __call__(self, state: dict) -> dict:
+        older, recent, replacements, fold = self._plan(state)
+        new_summary = None
+        if fold:
+            try:
+                new_summary = self.llm.invoke(self._summary_messages(state.get("summary", ""), fold)).text()
+            except Exception as e:
+                print(f"Error summarizing history: {e}")
+        return self._update(state, older, recent, replacements, fold, new_summary)
+
+    async def acall(self, state: dict) -> dict:
+        older, recent, replacements, fold = self._plan(state)
+        new_summary = None
+        if fold:
+            try:
+                result = await self.llm.ainvoke(self._summary_messages(state.get("summary", ""), fold))
+                new_summary = result.text()
+            except Exception as e:
+                print(f"Error summarizing history: {e}")
+        return self._update(state, older, recent, replacements, fold, new_summary)
+
+    def as_hook(self) -> RunnableLambda:
+        return RunnableLambda(self.__call__, afunc=self.acall, name="history_manager")
@@ -0,0 +1,40 @@
+"""
+Creates the database tables the service needs. Run once per deploy (deploy.sh does this)
+so instances can boot with CHECKPOINT_TABLE_INIT=false and skip the DDL.
+
+    PYTHONPATH=src python src/init_db.py
+"""
+
+import asyncio
+
+from langchain_google_cloud_sql_pg import PostgresEngine
+
+from agent_service import get_engine_kwargs
+from checkpoint_serde import PostgresPayloadStore
+from search_cache import PostgresSearchCacheBackend
+from tag import TAG
+
+
+async def init_db() -> None:
+    engine = await PostgresEngine.afrom_instance(**get_engine_kwargs())
+
+    try:
+        await engine.ainit_checkpoint_table()
+        print(f"{TAG} init_db: created checkpoint tables")
+    except Exception as e:
+        if "already exists" in str(e):
+            print(f"{TAG} init_db: checkpoint tables already exist")
+        else:
+            raise e
+
+    await PostgresSearchCacheBackend(engine).ainit_table()
+    print(f"{TAG} init_db: search cache table ready")
+
+    await PostgresPayloadStore(engine).ainit_table()
+    print(f"{TAG} init_db: checkpoint payloads table ready")
+
+    await engine.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(init_db())
@@ -0,0 +1,357 @@
+"""
+In-process tier of the knowledge search, for the most-hit book passages.
+
+A snapshot is an embedding matrix (one L2-normalized float32 row per passage) and
+the passages' `book_id`, `page_number` and `content`. A search embeds the query,
+ranks every passage with one matrix-vector product and answers locally only when
+the embedder is confident enough (`min_score`) in the best passage, with the top
+passages that are as confident; otherwise the tool asks the search service, as
+before. Snapshots are rebuilt in the background from the passages the
+search service has returned most often, or from a BigQuery query, and can be saved
+under LOCAL_INDEX_PATH, where every worker memory-maps the same file.
+
+Local answers trade accuracy for latency. The snapshot holds only the most-hit
+passages and the hashing embedder matches words, not meaning, so a local answer is
+the search service's best passage less often than the service's own answer is. On
+benchmarks/bench_knowledge_index.py, 71% of locally answered searches return the
+service's best passage at the default `min_score` of 0.9. No threshold closes the
+gap: at 1.0 it is 74%, with the share answered locally down from 59% to 51%. Enable
+the index where taking the search round trip off the most common questions is
+worth that.
+
+Queries and passages must be embedded by the same embedder: a snapshot records its
+embedder's `name` and is not loaded by an index whose embedder has another.
+"""
+
+import json
+import os
+import shutil
+import threading
+import time
+import zlib
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from search_cache import STOPWORDS, TOKEN_PATTERN
+
+SOURCE_HITS = "hits"
+SOURCE_BIGQUERY = "bigquery"
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    return matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+
+
+class HashingEmbedder:
+    """Bag-of-words embeddings by feature hashing: no model to load or call, the same in every process.
+
+    Token counts are damped with log1p, weighted (by the snapshot's IDF, see `idf`) and
+    normalized, so the dot product of two rows is their cosine similarity. It matches
+    passages sharing a query's rarer words, not paraphrases. A short query's cosine with
+    a long passage stays low even when the passage has every word of it, so confidence
+    is the share of the query's weight the passage covers instead (see `confidence`).
+    """
+
+    def __init__(self, dim: int = 1024):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def counts(self, texts: List[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token in TOKEN_PATTERN.findall(text.lower()):
+                if token not in STOPWORDS:
+                    # crc32, unlike hash(), is stable across processes
+                    vectors[row, zlib.crc32(token.encode()) % self.dim] += 1.0
+        return np.log1p(vectors, out=vectors)
+
+    def idf(self, texts: List[str]) -> np.ndarray:
+        """Per-dimension weights for a snapshot of `texts`: words in every passage count for little."""
+        document_frequency = np.count_nonzero(self.counts(texts), axis=0)
+        return (np.log((1 + len(texts)) / (1 + document_frequency)) + 1).astype(np.float32)
+
+    def __call__(self, texts: List[str], weights: Optional[np.ndarray] = None) -> np.ndarray:
+        vectors = self.counts(texts)
+        if weights is not None:
+            vectors *= weights
+        return normalize_rows(vectors)
+
+    @staticmethod
+    def confidence(query_vector: np.ndarray, passage_vector: np.ndarray) -> float:
+        """Share of the query's weight on words the passage contains."""
+        total = float(query_vector.sum())
+        return float(query_vector[passage_vector > 0].sum()) / total if total else 0.0
+
+
+def hit_key(hit: dict) -> tuple:
+    page = hit.get("page_number")
+    return hit.get("book_id"), page if page not in (None, "") else hit.get("content")
+
+
+def embedder_name(embed: Callable) -> str:
+    """What a snapshot records of the embedder its rows came from."""
+    return getattr(embed, "name", None) or getattr(embed, "__qualname__", type(embed).__qualname__)
+
+
+def bigquery_rows(project_id: str, query_text: str) -> List[dict]:
+    """Passages for a snapshot from BigQuery: `book_id`, `page_number` and `content`; other columns are ignored."""
+    from utilities import execute_query
+    return [dict(row.items()) for row in execute_query(project_id, query_text, verbose=False)]
+
+
+class _Snapshot:
+    def __init__(
+        self, matrix: np.ndarray, passages: List[dict], version: str, weights: Optional[np.ndarray], embedder: str
+    ):
+        self.matrix = matrix
+        self.passages = passages
+        self.version = version
+        self.embedder = embedder
+        # Query embeddings need the same weights as the snapshot's rows
+        self.weights = weights
+        self.loaded_at = time.monotonic()
+
+
+class KnowledgeIndex:
+    """Top-k cosine search over a snapshot of passages, answering only when confident.
+
+    `load_rows` returns the passages of a new snapshot; without it, snapshots hold the
+    `max_passages` passages that `record` saw most often in the search service's
+    results. `refresh_interval` seconds after a refresh, the next search starts
+    another in a background thread. With `path`, snapshots are written there and
+    memory-mapped, and a worker picks up a snapshot another worker wrote instead of
+    building its own.
+    """
+
+    def __init__(
+        self,
+        embed: Optional[Callable[[List[str]], np.ndarray]] = None,
+        min_score: float = 0.9,
+        max_passages: int = 5000,
+        refresh_interval: float = 600.0,
+        load_rows: Optional[Callable[[], List[dict]]] = None,
+        path: Optional[str] = None,
+    ):
+        self.embed = embed or HashingEmbedder()
+        self.min_score = min_score
+        self.max_passages = max_passages
+        self.refresh_interval = refresh_interval
+        self.load_rows = load_rows
+        self.path = path
+        self._snapshot: Optional[_Snapshot] = None
+        # hit_key -> [times returned, hit]
+        self._hits: Dict[tuple, list] = {}
+        self._lock = threading.Lock()
+        self._refreshing = False
+        # A BigQuery snapshot is wanted right away; hit counts need time to build up
+        self._last_refresh = 0.0 if load_rows else time.monotonic()
+        self.local_hits = 0
+        self.low_confidence = 0
+        self.refreshes = 0
+        self.refresh_errors = 0
+        if path:
+            self._load_current()
+
+    @classmethod
+    def from_env(cls, project_id: str) -> Optional["KnowledgeIndex"]:
+        if os.getenv("LOCAL_INDEX_ENABLED", "false").lower() != "true":
+            return None
+        load_rows = None
+        if os.getenv("LOCAL_INDEX_SOURCE", SOURCE_HITS) == SOURCE_BIGQUERY:
+            query_text = os.environ["LOCAL_INDEX_QUERY"]
+            load_rows = lambda: bigquery_rows(project_id, query_text)
+        return cls(
+            embed=HashingEmbedder(int(os.getenv("LOCAL_INDEX_DIM", "1024"))),
+            # Higher answers locally less often for little accuracy (see the module docstring)
+            min_score=float(os.getenv("LOCAL_INDEX_MIN_SCORE", "0.9")),
+            max_passages=int(os.getenv("LOCAL_INDEX_MAX_PASSAGES", "5000")),
+            refresh_interval=float(os.getenv("LOCAL_INDEX_REFRESH_INTERVAL", "600")),
+            load_rows=load_rows,
+            path=os.getenv("LOCAL_INDEX_PATH") or None,
+        )
+
+    def search(self, query: str, limit: int = 3) -> Optional[List[dict]]:
+        """The `limit` best passages for `query` that reach `min_score`, or None for the search service to answer."""
+        self.maybe_refresh()
+        snapshot = self._snapshot
+        if snapshot is None or not snapshot.passages:
+            return None
+
+        if snapshot.weights is not None:
+            query_vector = self.embed([query], snapshot.weights)[0]
+        else:
+            query_vector = self.embed([query])[0]
+        scores = snapshot.matrix @ query_vector
+        k = min(limit, len(scores))
+        top = np.argpartition(scores, -k)[-k:]
+        top = top[np.argsort(scores[top])[::-1]]
+        # Embedders without a notion of confidence are trusted on cosine similarity
+        confidence = getattr(self.embed, "confidence", None)
+
+        def confident(i: int) -> bool:
+            return (confidence(query_vector, snapshot.matrix[i]) if confidence else scores[i]) >= self.min_score
+
+        # Past the confident passages the top k would only reach the model as noise
+        top = [i for i in top if confident(i)] if confident(top[0]) else []
+        if not top:
+            with self._lock:
+                self.low_confidence += 1
+            return None
+        with self._lock:
+            self.local_hits += 1
+        return [snapshot.passages[i] for i in top]
+
+    def record(self, results: List[dict]) -> None:
+        """Count the passages the search service returned, for the next snapshot of most-hit passages."""
+        if self.load_rows is not None:
+            return
+        with self._lock:
+            for hit in results:
+                entry = self._hits.setdefault(hit_key(hit), [0, hit])
+                entry[0] += 1
+            if len(self._hits) > 4 * self.max_passages:
+                # Forget the passages seen least, so the counts stay bounded
+                ranked = sorted(self._hits.items(), key=lambda item: item[1][0], reverse=True)
+                self._hits = dict(ranked[:2 * self.max_passages])
+
+    def maybe_refresh(self) -> None:
+        """Start a background refresh when the snapshot is due one."""
+        with self._lock:
+            if self._refreshing or time.monotonic() - self._last_refresh < self.refresh_interval:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._refresh_in_background, daemon=True).start()
+
+    def _refresh_in_background(self) -> None:
+        try:
+            self.refresh()
+        except Exception as e:
+            with self._lock:
+                self.refresh_errors += 1
+            print(f"Error refreshing local knowledge index: {e}")
+        finally:
+            with self._lock:
+                self._refreshing = False
+                self._last_refresh = time.monotonic()
+
+    def _passages(self) -> List[dict]:
+        if self.load_rows is not None:
+            return self.load_rows()[:self.max_passages]
+        with self._lock:
+            ranked = sorted(self._hits.values(), key=lambda entry: entry[0], reverse=True)
+        return [hit for _, hit in ranked[:self.max_passages]]
+
+    def refresh(self) -> None:
+        """Build a snapshot from the current source and swap it in."""
+        if self.path and self._adopt_recent():
+            return
+        rows = self._passages()
+        if not rows:
+            return
+
+        passages = [
+            {"book_id": r.get("book_id"), "page_number": r.get("page_number"), "content": r.get("content", "")}
+            for r in rows
+        ]
+        # Rows are embedded here even when the source has embeddings of its own: queries
+        # can only be compared with passages embedded the same way
+        weights = None
+        if isinstance(self.embed, HashingEmbedder):
+            texts = [p["content"] for p in passages]
+            weights = self.embed.idf(texts)
+            matrix = self.embed(texts, weights)
+        else:
+            matrix = self.embed([p["content"] for p in passages])
+
+        version = f"{time.time():.6f}-{os.getpid()}"
+        embedder = embedder_name(self.embed)
+        if self.path:
+            self._save(matrix, passages, version, weights, embedder)
+            self._load_current()
+        else:
+            self._snapshot = _Snapshot(matrix, passages, version, weights, embedder)
+        with self._lock:
+            self.refreshes += 1
+
+    def _save(
+        self, matrix: np.ndarray, passages: List[dict], version: str, weights: Optional[np.ndarray], embedder: str
+    ) -> None:
+        os.makedirs(self.path, exist_ok=True)
+        staging = os.path.join(self.path, f".{version}")
+        os.makedirs(staging)
+        np.save(os.path.join(staging, "embeddings.npy"), matrix)
+        if weights is not None:
+            np.save(os.path.join(staging, "weights.npy"), weights)
+        with open(os.path.join(staging, "passages.json"), "w") as f:
+            json.dump(passages, f)
+        with open(os.path.join(staging, "meta.json"), "w") as f:
+            json.dump({"embedder": embedder, "dim": int(matrix.shape[1])}, f)
+        os.rename(staging, os.path.join(self.path, version))
+
+        current = os.path.join(self.path, f".CURRENT-{version}")
+        with open(current, "w") as f:
+            f.write(version)
+        # Readers see either the old version or the new one
+        previous = self._current_version()
+        os.replace(current, os.path.join(self.path, "CURRENT"))
+
+        # Keep the previous snapshot for workers that haven't switched yet
+        for name in os.listdir(self.path):
+            if name not in (version, previous, "CURRENT") and not name.startswith("."):
+                shutil.rmtree(os.path.join(self.path, name), ignore_errors=True)
+
+    def _current_version(self) -> Optional[str]:
+        try:
+            with open(os.path.join(self.path, "CURRENT")) as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            return None
+
+    def _adopt_recent(self) -> bool:
+        """Load a snapshot another worker wrote within the refresh interval, instead of building one."""
+        version = self._current_version()
+        if version is None or (self._snapshot is not None and self._snapshot.version == version):
+            return False
+        if time.time() - float(version.split("-")[0]) > self.refresh_interval:
+            return False
+        return self._load_current()
+
+    def _load_current(self) -> bool:
+        """Memory-map the snapshot under `path`; True if there is one made by this index's embedder."""
+        version = self._current_version()
+        if version is None:
+            return False
+        directory = os.path.join(self.path, version)
+        try:
+            with open(os.path.join(directory, "meta.json")) as f:
+                meta = json.load(f)
+            embedder = embedder_name(self.embed)
+            if meta.get("embedder") != embedder:
+                print(f"Not loading local knowledge index {version}: embedded by {meta.get('embedder')!r}, "
+                      f"queries are embedded by {embedder!r}")
+                return False
+            matrix = np.load(os.path.join(directory, "embeddings.npy"), mmap_mode="r")
+            with open(os.path.join(directory, "passages.json")) as f:
+                passages = json.load(f)
+            weights_path = os.path.join(directory, "weights.npy")
+            weights = np.load(weights_path) if os.path.exists(weights_path) else None
+        except FileNotFoundError:
+            # Pruned by a newer snapshot between reading CURRENT and opening it
+            return False
+        self._snapshot = _Snapshot(matrix, passages, version, weights, embedder)
+        return True
+
+    def get_stats(self) -> dict:
+        snapshot = self._snapshot
+        with self._lock:
+            return {
+                "passages": len(snapshot.passages) if snapshot else 0,
+                "embedder": snapshot.embedder if snapshot else None,
+                "snapshot_age_seconds": round(time.monotonic() - snapshot.loaded_at, 1) if snapshot else 0.0,
+                "local_hits": self.local_hits,
+                "low_confidence": self.low_confidence,
+                "refreshes": self.refreshes,
+                "refresh_errors": self.refresh_errors,
+                "tracked_passages": len(self._hits),
+            }
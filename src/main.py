@@ -1,18 +1,119 @@
+import asyncio
+import importlib
+import json
+import math
 import os
+import time
+from contextlib import asynccontextmanager, nullcontext
+from typing import TYPE_CHECKING, Callable, List, Optional
+
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, generate_latest, multiprocess
 from pydantic import BaseModel
-from agent_service import AgentService
 
-app = FastAPI(title="Knowledge Agent", version="1.0.0")
+from admission import AdmissionRejected
+from resilience import CircuitOpenError
+from startup import ServiceLoader
+from telemetry import ServiceStatsCollector, configure_tracing
+from thread_locks import ThreadBusyError
+
+if TYPE_CHECKING:
+    from agent_service import AgentService
 
-# Create ONE instance that persists across all requests
 project_id = os.getenv("GCP_PROJECT", "robot-rnd-nilor-gcp")
 search_service_url = os.getenv("SEARCH_SERVICE_URL", "https://search-v1-959508709789.us-central1.run.app")
 
-agent_service = AgentService(
-    project_id=project_id,
-    search_service_url=search_service_url
-)
+# Create ONE instance that persists across all requests
+agent_service: Optional["AgentService"] = None
+
+# How long a request waits for a still-starting service before giving up
+STARTUP_WAIT_TIMEOUT = float(os.getenv("STARTUP_WAIT_TIMEOUT", "60"))
+
+# Largest accepted /chat/batch request
+CHAT_BATCH_MAX_ITEMS = int(os.getenv("CHAT_BATCH_MAX_ITEMS", "1000"))
+
+
+async def create_agent_service(loader: ServiceLoader) -> "AgentService":
+    # The langchain/langgraph/google import is CPU-bound; keep it off the event loop so health checks answer
+    started_at = time.perf_counter()
+    agent_service_module = await asyncio.to_thread(importlib.import_module, "agent_service")
+    loader.record("import", started_at)
+
+    service = await agent_service_module.AgentService.acreate(
+        project_id=project_id,
+        search_service_url=search_service_url,
+        record_phase=loader.record
+    )
+
+    started_at = time.perf_counter()
+    await service.warm_up()
+    loader.record("warm_up", started_at)
+    return service
+
+
+service_loader = ServiceLoader(create_agent_service)
+
+
+def reset_after_fork() -> None:
+    """A forked worker (e.g. gunicorn --preload) builds its own engine and clients instead of sharing the parent's."""
+    global agent_service, service_loader
+    agent_service = None
+    service_loader = ServiceLoader(create_agent_service)
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=reset_after_fork)
+
+
+def current_stats() -> dict:
+    service = agent_service or service_loader.service
+    return service.get_stats() if service is not None else {}
+
+
+# Cache and pool numbers from /stats, scraped alongside the request metrics
+stats_collector = ServiceStatsCollector(current_stats)
+REGISTRY.register(stats_collector)
+
+
+def metrics_registry() -> CollectorRegistry:
+    """The registry to expose: with several workers (serve.py), request metrics summed over all of them."""
+    if not os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    # Stats gauges describe the worker that answers the scrape
+    registry.register(stats_collector)
+    return registry
+
+
+async def get_agent_service() -> "AgentService":
+    global agent_service
+    if agent_service is None:
+        try:
+            agent_service = await service_loader.get(timeout=STARTUP_WAIT_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=503, detail="Service is starting up", headers={"Retry-After": "5"})
+        except Exception as e:
+            raise HTTPException(status_code=503, detail=f"Service failed to start: {e}")
+    return agent_service
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    configure_tracing()
+    if agent_service is None:
+        await service_loader.start()
+    yield
+    service = agent_service or service_loader.service
+    if service is not None:
+        await service.search_client.aclose()
+        if service.analytics is not None:
+            # Write out the turns still queued before the worker exits
+            await asyncio.to_thread(service.analytics.close)
+
+
+app = FastAPI(title="Knowledge Agent", version="1.0.0", lifespan=lifespan)
 
 
 class ChatRequest(BaseModel):
@@ -24,25 +125,151 @@ class ChatResponse(BaseModel):
     response: str
 
 
+class BatchChatRequest(BaseModel):
+    items: List[ChatRequest]
+    # Stream NDJSON lines as conversations complete instead of one ordered response
+    stream: bool = False
+    max_concurrency: Optional[int] = None
+
+
+class BatchChatResult(BaseModel):
+    thread_id: str
+    response: str
+
+
+class BatchChatResponse(BaseModel):
+    results: List[BatchChatResult]
+
+
 @app.get("/")
 def health_check():
-    return {"status": "healthy", "service": "knowledge-agent"}
+    status = service_loader.status()
+    status["ready"] = agent_service is not None or status["ready"]
+    return {"status": "healthy", "service": "knowledge-agent", **status}
+
+
+@app.get("/ready")
+def readiness_check():
+    if agent_service is None and not service_loader.ready:
+        return JSONResponse(status_code=503, content={"status": "starting", **service_loader.status()})
+    return {"status": "ready"}
+
+
+@app.get("/stats")
+async def stats():
+    service = await get_agent_service()
+    return service.get_stats()
+
+
+@app.get("/metrics")
+def metrics():
+    return Response(generate_latest(metrics_registry()), media_type=CONTENT_TYPE_LATEST)
 
 
 @app.post("/chat", response_model=ChatResponse)
-def chat_endpoint(request: ChatRequest):
+async def chat_endpoint(request: ChatRequest):
     try:
         # Use the SAME instance every time
-        response = agent_service.chat(
-            message=request.message,
-            thread_id=request.thread_id
-        )
+        service = await get_agent_service()
+        async with service.admission.admit(request.thread_id) if service.admission else nullcontext():
+            response = await service.achat(
+                message=request.message,
+                thread_id=request.thread_id
+            )
 
         return ChatResponse(response=response)
+    except HTTPException:
+        raise
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e), headers={"Retry-After": str(math.ceil(e.retry_after))})
+    except ThreadBusyError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(math.ceil(e.retry_after))})
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(math.ceil(e.retry_after))})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/chat/batch", response_model=BatchChatResponse)
+async def chat_batch_endpoint(request: BatchChatRequest):
+    if len(request.items) > CHAT_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {CHAT_BATCH_MAX_ITEMS} items per batch")
+    if request.max_concurrency is not None and request.max_concurrency < 1:
+        raise HTTPException(status_code=422, detail="max_concurrency must be at least 1")
+
+    service = await get_agent_service()
+    items = [(item.thread_id, item.message) for item in request.items]
+    # Callers may lower the server's concurrency for their batch, not raise it
+    max_concurrency = min(request.max_concurrency or service.batch_concurrency, service.batch_concurrency)
+
+    if request.stream:
+        async def result_lines():
+            async for index, response in service.astream_chat_many(items, max_concurrency):
+                yield json.dumps({"index": index, "thread_id": items[index][0], "response": response}) + "\n"
+
+        return StreamingResponse(result_lines(), media_type="application/x-ndjson")
+
+    responses = await service.chat_many(items, max_concurrency)
+    return BatchChatResponse(results=[
+        BatchChatResult(thread_id=thread_id, response=response)
+        for (thread_id, _), response in zip(items, responses)
+    ])
+
+
+class ClosingStreamingResponse(StreamingResponse):
+    """StreamingResponse that calls `on_close` when the response is over, however it ended.
+
+    A body generator's own `finally` doesn't run when the client is gone (or sending
+    the headers fails) before the generator is first iterated.
+    """
+
+    def __init__(self, content, on_close: Callable[[], None], **kwargs):
+        super().__init__(content, **kwargs)
+        self.on_close = on_close
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.on_close()
+
+
+@app.post("/chat/stream")
+async def chat_stream_endpoint(request: ChatRequest):
+    service = await get_agent_service()
+    admission = service.admission
+    if admission is not None:
+        # Rejected before the stream starts, so the caller gets a real 429/503
+        try:
+            await admission.acquire(admission.tenant(request.thread_id))
+        except AdmissionRejected as e:
+            raise HTTPException(status_code=e.status_code, detail=str(e), headers={"Retry-After": str(math.ceil(e.retry_after))})
+    started_at = time.monotonic()
+    # The turn's failure, which astream_chat reports as an `error` event rather than raising
+    failure: List[BaseException] = []
+
+    async def event_stream():
+        async for event in service.astream_chat(
+            message=request.message,
+            thread_id=request.thread_id
+        ):
+            if event["event"] == "error" and event.get("error") is not None:
+                failure.append(event["error"])
+            yield f"event: {event['event']}\ndata: {json.dumps(event['data'])}\n\n"
+
+    def release() -> None:
+        # A client that went away says nothing about the service's capacity; only the turn's own failure counts
+        if admission is not None:
+            admission.release(started_at, failure[0] if failure else None)
+
+    return ClosingStreamingResponse(
+        event_stream(),
+        on_close=release,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 if __name__ == '__main__':
     import uvicorn
     import httpx
@@ -0,0 +1,416 @@
+"""
+Outbound-call policy shared by the search service and Vertex AI calls.
+
+A turn runs under a deadline (`turn_deadline`); each outbound call gets a budget of
+its own, capped by what is left of the turn, and every attempt's timeout is cut
+from that budget. Failed attempts are retried with full-jitter backoff while the
+budget lasts, slow attempts can be hedged with a second request, and a circuit
+breaker per dependency fails calls fast while the dependency is down.
+"""
+
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Iterator, Optional, TypeVar
+
+import httpx
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.runnables import RunnableBinding
+
+T = TypeVar("T")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Status codes worth another attempt: the dependency is overloaded or restarting
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    """The dependency failed repeatedly and calls to it are being short-circuited."""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name} is unavailable, retry in {retry_after:.0f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class DeadlineExceeded(Exception):
+    """The turn's or the call's time budget ran out before the call could succeed."""
+
+
+# Monotonic time at which the current turn must be answered
+_turn_deadline: ContextVar[Optional[float]] = ContextVar("turn_deadline", default=None)
+
+
+@contextmanager
+def turn_deadline(seconds: Optional[float]) -> Iterator[None]:
+    """Bound every outbound call made in this context (and tasks it starts) to `seconds` from now."""
+    token = _turn_deadline.set(time.monotonic() + seconds if seconds else None)
+    try:
+        yield
+    finally:
+        _turn_deadline.reset(token)
+
+
+def turn_time_left() -> Optional[float]:
+    """Seconds left in the current turn, or None outside of one."""
+    deadline = _turn_deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Whether `error` says the dependency is unhealthy, rather than that the request was wrong."""
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code in RETRYABLE_STATUS
+    # google.api_core errors from Vertex AI carry their HTTP status as `code`
+    if getattr(error, "code", None) in RETRYABLE_STATUS:
+        return True
+    return isinstance(error, (httpx.TransportError, asyncio.TimeoutError, TimeoutError, ConnectionError))
+
+
+class CircuitBreaker:
+    """Opens after `failure_threshold` consecutive failures and fails calls fast for `reset_timeout`
+    seconds; then lets one probe through and closes again if it succeeds."""
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.short_circuited = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                return HALF_OPEN
+            return self._state
+
+    def check(self) -> bool:
+        """Raise CircuitOpenError unless a call may go through now; True if that call is the probe."""
+        with self._lock:
+            if self._state == CLOSED:
+                return False
+            waited = time.monotonic() - self._opened_at
+            if waited >= self.reset_timeout and not self._probing:
+                # One probe at a time decides whether the dependency is back
+                self._probing = True
+                return True
+            self.short_circuited += 1
+            raise CircuitOpenError(self.name, max(1.0, self.reset_timeout - waited))
+
+    def release_probe(self) -> None:
+        """Let another call probe: the current probe ended without telling us anything."""
+        with self._lock:
+            self._probing = False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._state = CLOSED
+            self._failures = 0
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._probing or (self._state == CLOSED and self._failures >= self.failure_threshold):
+                if self._state == CLOSED:
+                    self.opened += 1
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+            self._probing = False
+
+    def get_stats(self) -> dict:
+        state = self.state
+        return {
+            "circuit_state": state,
+            "circuit_open": int(state == OPEN),
+            "circuit_opened": self.opened,
+            "short_circuited": self.short_circuited,
+        }
+
+
+class BreakerCallback(BaseCallbackHandler):
+    """Feeds a CircuitBreaker from the outcome of every model call in a turn."""
+
+    run_inline = True
+
+    def __init__(self, breaker: CircuitBreaker):
+        self.breaker = breaker
+
+    def on_llm_end(self, response, **kwargs) -> None:
+        self.breaker.record_success()
+
+    def on_llm_error(self, error, **kwargs) -> None:
+        if is_retryable(error):
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+
+
+class TurnBoundModel(RunnableBinding):
+    """A chat model, tools bound, whose async calls fail with DeadlineExceeded once the turn's deadline passes.
+
+    Sync calls can't be cancelled: only the model client's own per-attempt timeout bounds them.
+    """
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        time_left = turn_time_left()
+        if time_left is None:
+            return await super().ainvoke(input, config, **kwargs)
+        if time_left <= 0:
+            raise DeadlineExceeded("turn budget exhausted before the model call")
+        try:
+            return await asyncio.wait_for(super().ainvoke(input, config, **kwargs), time_left)
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded(f"model call ran past the turn budget ({time_left:.1f}s left)") from None
+
+
+def bind_to_turn(model, tools: list = (), **kwargs) -> TurnBoundModel:
+    """`model` with `tools` and call `kwargs` (e.g. a per-attempt `timeout`) bound, under the turn deadline.
+
+    `create_react_agent` keeps a model whose tools are already bound as it is, so the
+    agent's model calls go through `TurnBoundModel.ainvoke`.
+    """
+    binding = model.bind_tools(tools) if tools else model.bind()
+    return TurnBoundModel(bound=binding.bound, kwargs={**binding.kwargs, **kwargs}, config=binding.config)
+
+
+class OutboundPolicy:
+    """Deadlines, jittered retries, hedging and circuit breaking for one dependency.
+
+    `acall(attempt)` calls `attempt(timeout)` until it succeeds, the error is not
+    retryable, `max_attempts` are used or the budget (`budget` seconds, capped by the
+    turn's deadline) runs out. Each attempt gets at most `attempt_timeout` seconds.
+    With `hedge_after` set, an attempt still running after that long (or, with
+    `hedge_after="auto"`, past the recent p95 and three times the median latency) is
+    raced against a second, identical request; only use it for idempotent calls.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        budget: float = 10.0,
+        attempt_timeout: float = 4.0,
+        max_attempts: int = 3,
+        backoff: float = 0.1,
+        max_backoff: float = 1.0,
+        hedge_after=None,
+        breaker: Optional[CircuitBreaker] = None,
+        retryable: Callable[[BaseException], bool] = is_retryable,
+    ):
+        self.name = name
+        self.budget = budget
+        self.attempt_timeout = attempt_timeout
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.hedge_after = hedge_after
+        self.breaker = breaker
+        self.retryable = retryable
+        self._latencies: deque = deque(maxlen=200)
+        self._stats_lock = threading.Lock()
+        self.calls = 0
+        self.attempts = 0
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.failures = 0
+
+    @classmethod
+    def from_env(cls, prefix: str, **defaults) -> "OutboundPolicy":
+        """Policy configured by `{prefix}_BUDGET`, `_ATTEMPT_TIMEOUT`, `_MAX_ATTEMPTS`, `_RETRY_BACKOFF`,
+        `_HEDGE_AFTER` (seconds, `auto` or `off`), `_BREAKER_FAILURES` and `_BREAKER_RESET`."""
+        def env(name: str, default) -> str:
+            return os.getenv(f"{prefix}_{name}", str(defaults.get(name.lower(), default)))
+
+        hedge_after = env("HEDGE_AFTER", "off").lower()
+        if hedge_after in ("off", "none", "0"):
+            hedge_after = None
+        elif hedge_after != "auto":
+            hedge_after = float(hedge_after)
+
+        name = prefix.lower()
+        failures = int(env("BREAKER_FAILURES", 5))
+        return cls(
+            name=name,
+            budget=float(env("BUDGET", 10.0)),
+            attempt_timeout=float(env("ATTEMPT_TIMEOUT", 4.0)),
+            max_attempts=int(env("MAX_ATTEMPTS", 3)),
+            backoff=float(env("RETRY_BACKOFF", 0.1)),
+            hedge_after=hedge_after,
+            breaker=CircuitBreaker(name, failures, float(env("BREAKER_RESET", 30.0))) if failures > 0 else None,
+        )
+
+    def _record(self, **increments) -> None:
+        with self._stats_lock:
+            for name, value in increments.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def _deadline(self) -> float:
+        deadline = time.monotonic() + self.budget
+        turn_deadline = _turn_deadline.get()
+        return deadline if turn_deadline is None else min(deadline, turn_deadline)
+
+    def _backoff(self, retry: int) -> float:
+        # Full jitter: retries from many callers spread out instead of arriving in waves
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** retry))
+
+    def _hedge_delay(self) -> Optional[float]:
+        if self.hedge_after != "auto":
+            return self.hedge_after
+        with self._stats_lock:
+            if len(self._latencies) < 20:
+                return None
+            latencies = sorted(self._latencies)
+        # The p95, but never within the normal spread: hedging is for the tail only
+        return max(latencies[int(0.95 * (len(latencies) - 1))], 3 * latencies[len(latencies) // 2])
+
+    def _check_breaker(self) -> None:
+        if self.breaker is not None:
+            try:
+                self.breaker.check()
+            except CircuitOpenError:
+                self._record(failures=1)
+                raise
+
+    def _succeeded(self, started_at: float) -> None:
+        with self._stats_lock:
+            self._latencies.append(time.monotonic() - started_at)
+        if self.breaker is not None:
+            self.breaker.record_success()
+
+    def _failed(self, error: BaseException) -> None:
+        if self.breaker is None:
+            return
+        if isinstance(error, asyncio.CancelledError):
+            # Our caller gave up; that says nothing about the dependency's health
+            self.breaker.release_probe()
+        elif self.retryable(error):
+            self.breaker.record_failure()
+        else:
+            # It answered, just not with what we asked for
+            self.breaker.record_success()
+
+    async def _hedged(self, attempt: Callable[[float], Awaitable[T]], timeout: float) -> T:
+        hedge_delay = self._hedge_delay()
+        first = asyncio.ensure_future(attempt(timeout))
+        if hedge_delay is None or hedge_delay >= timeout:
+            return await asyncio.wait_for(first, timeout)
+
+        attempt_deadline = time.monotonic() + timeout
+        tasks = [first]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=hedge_delay)
+            if not done:
+                self._record(hedges=1)
+                tasks.append(asyncio.ensure_future(attempt(attempt_deadline - time.monotonic())))
+            error = None
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, timeout=attempt_deadline - time.monotonic(), return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    raise asyncio.TimeoutError()
+                for task in done:
+                    if task.exception() is None:
+                        if task is not first:
+                            self._record(hedge_wins=1)
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def acall(self, attempt: Callable[[float], Awaitable[T]]) -> T:
+        """`await attempt(timeout)` under this policy."""
+        self._record(calls=1)
+        deadline = self._deadline()
+        for retry in range(self.max_attempts):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self._record(failures=1)
+                raise DeadlineExceeded(f"{self.name}: no time left for attempt {retry + 1}")
+            self._check_breaker()
+
+            self._record(attempts=1, retries=1 if retry else 0)
+            started_at = time.monotonic()
+            try:
+                result = await self._hedged(attempt, min(self.attempt_timeout, remaining))
+            except asyncio.CancelledError as e:
+                self._failed(e)
+                raise
+            except Exception as e:
+                self._failed(e)
+                pause = self._backoff(retry)
+                if (
+                    not self.retryable(e)
+                    or retry == self.max_attempts - 1
+                    or time.monotonic() + pause >= deadline
+                ):
+                    self._record(failures=1)
+                    raise
+                print(f"Retrying {self.name} after {type(e).__name__}: {e}")
+                await asyncio.sleep(pause)
+            else:
+                self._succeeded(started_at)
+                return result
+
+    def call(self, attempt: Callable[[float], T]) -> T:
+        """Blocking version of `acall`, without hedging."""
+        self._record(calls=1)
+        deadline = self._deadline()
+        for retry in range(self.max_attempts):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self._record(failures=1)
+                raise DeadlineExceeded(f"{self.name}: no time left for attempt {retry + 1}")
+            self._check_breaker()
+
+            self._record(attempts=1, retries=1 if retry else 0)
+            started_at = time.monotonic()
+            try:
+                result = attempt(min(self.attempt_timeout, remaining))
+            except Exception as e:
+                self._failed(e)
+                pause = self._backoff(retry)
+                if (
+                    not self.retryable(e)
+                    or retry == self.max_attempts - 1
+                    or time.monotonic() + pause >= deadline
+                ):
+                    self._record(failures=1)
+                    raise
+                print(f"Retrying {self.name} after {type(e).__name__}: {e}")
+                time.sleep(pause)
+            else:
+                self._succeeded(started_at)
+                return result
+
+    def get_stats(self) -> dict:
+        with self._stats_lock:
+            stats = {
+                "calls": self.calls,
+                "attempts": self.attempts,
+                "retries": self.retries,
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins,
+                "failures": self.failures,
+            }
+        if self.breaker is not None:
+            stats.update(self.breaker.get_stats())
+        return stats
@@ -0,0 +1,143 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import List, NamedTuple, Optional
+
+from langchain_core.messages import BaseMessage, HumanMessage, messages_to_dict
+
+from search_cache import TOKEN_PATTERN
+
+
+def normalize_message(message: str) -> str:
+    """Lowercase and drop punctuation and extra whitespace; word order and filler words still count."""
+    return " ".join(TOKEN_PATTERN.findall(message.lower()))
+
+
+def model_fingerprint(system_prompt: str, llm) -> str:
+    """Hash of everything besides the message that shapes a first-turn answer."""
+    config = {
+        "system_prompt": system_prompt,
+        "llm_type": getattr(llm, "_llm_type", type(llm).__name__),
+        "model": getattr(llm, "model_name", None) or getattr(llm, "model", None),
+        "temperature": getattr(llm, "temperature", None),
+        "max_tokens": getattr(llm, "max_output_tokens", None) or getattr(llm, "max_tokens", None),
+    }
+    return hashlib.sha256(json.dumps(config, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class CachedTurn(NamedTuple):
+    messages: List[BaseMessage]
+    response: str
+    # How long the turn took when it was computed
+    seconds: float
+
+
+class ResponseCache:
+    """LRU cache of complete first-turn exchanges, bounded by entry count, bytes and TTL.
+
+    Keys combine the normalized message with a fingerprint of the system prompt and
+    model config, so changing either starts from an empty cache.
+    """
+
+    def __init__(
+        self,
+        fingerprint: str,
+        max_entries: int = 512,
+        max_bytes: int = 16 * 1024 * 1024,
+        ttl: float = 86400.0,
+    ):
+        self.fingerprint = fingerprint
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.saved_seconds = 0.0
+
+    @classmethod
+    def from_env(cls, fingerprint: str) -> Optional["ResponseCache"]:
+        if os.getenv("RESPONSE_CACHE_ENABLED", "false").lower() != "true":
+            return None
+        return cls(
+            fingerprint,
+            max_entries=int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "512")),
+            max_bytes=int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(16 * 1024 * 1024))),
+            ttl=float(os.getenv("RESPONSE_CACHE_TTL", "86400")),
+        )
+
+    def key(self, message: str) -> str:
+        return hashlib.sha256(f"{self.fingerprint}:{normalize_message(message)}".encode()).hexdigest()
+
+    def get(self, message: str) -> Optional[CachedTurn]:
+        """The cached exchange for `message`, with fresh message ids so it can be written to a new thread."""
+        key = self.key(message)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() >= entry[2]:
+                del self._entries[key]
+                self._bytes -= entry[1]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            turn = entry[0]
+
+        # The new thread records the question as this user asked it
+        messages = [
+            m.model_copy(update={"id": None, "content": message} if isinstance(m, HumanMessage) else {"id": None})
+            for m in turn.messages
+        ]
+        return turn._replace(messages=messages)
+
+    def set(self, message: str, messages: List[BaseMessage], response: str, seconds: float) -> None:
+        size = len(json.dumps(messages_to_dict(messages), default=str))
+        if size > self.max_bytes:
+            return
+
+        key = self.key(message)
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+
+            self._entries[key] = (CachedTurn(list(messages), response, seconds), size, time.monotonic() + self.ttl)
+            self._bytes += size
+
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def record_saving(self, seconds: float) -> None:
+        with self._lock:
+            self.saved_seconds += max(0.0, seconds)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "saved_seconds": round(self.saved_seconds, 3),
+            }
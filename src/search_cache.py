@@ -0,0 +1,256 @@
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from sqlalchemy import text
+
+STOPWORDS = frozenset("""
+a about an and are as at be but by can could do does for from how i i'm if in is it its me my of on or
+so that the their them they this to us was we what when where which who why will with would you your
+""".split())
+
+# Letters and digits of any script, not just ASCII
+TOKEN_PATTERN = re.compile(r"[\w']+")
+
+
+def normalize_query(query: str) -> str:
+    """Lowercase, drop stopwords and sort the remaining tokens so word order and filler don't split the cache.
+
+    A query that is all stopwords (or punctuation) keeps its own key: the lowercased
+    query with whitespace collapsed, never the empty string every such query would share.
+    """
+    tokens = {t for t in TOKEN_PATTERN.findall(query.lower()) if t not in STOPWORDS}
+    return " ".join(sorted(tokens)) or " ".join(query.lower().split())
+
+
+class SearchCacheBackend:
+    """Shared second-level store consulted on a local miss. Implementations must never raise."""
+
+    def get(self, key: str) -> Optional[List[dict]]:
+        raise NotImplementedError
+
+    def set(self, key: str, results: List[dict], ttl: float) -> None:
+        raise NotImplementedError
+
+    async def aget(self, key: str) -> Optional[List[dict]]:
+        return self.get(key)
+
+    async def aset(self, key: str, results: List[dict], ttl: float) -> None:
+        self.set(key, results, ttl)
+
+
+class PostgresSearchCacheBackend(SearchCacheBackend):
+    """Shares cached search results between instances through the already-deployed Cloud SQL database."""
+
+    def __init__(self, engine, table_name: str = "search_cache"):
+        self.engine = engine
+        self.table_name = table_name
+
+    async def ainit_table(self) -> None:
+        """Create the table (idempotent). Run by init_db.py, and at boot unless CHECKPOINT_TABLE_INIT=false."""
+        async def create():
+            async with self.engine._pool.connect() as conn:
+                await conn.execute(text(f"""CREATE TABLE IF NOT EXISTS "{self.table_name}"(
+                    key TEXT PRIMARY KEY,
+                    results JSONB NOT NULL,
+                    expires_at TIMESTAMPTZ NOT NULL
+                );"""))
+                await conn.commit()
+
+        await self.engine._run_as_async(create())
+
+    def init_table(self) -> None:
+        self.engine._run_as_sync(self.ainit_table())
+
+    async def _aget(self, key: str) -> Optional[List[dict]]:
+        async with self.engine._pool.connect() as conn:
+            result = await conn.execute(
+                text(f'SELECT results FROM "{self.table_name}" WHERE key = :key AND expires_at > now()'),
+                {"key": key},
+            )
+            row = result.fetchone()
+            if row is None:
+                return None
+            value = row[0]
+            return json.loads(value) if isinstance(value, str) else value
+
+    async def _aset(self, key: str, results: List[dict], ttl: float) -> None:
+        async with self.engine._pool.connect() as conn:
+            await conn.execute(
+                text(f"""INSERT INTO "{self.table_name}" (key, results, expires_at)
+                    VALUES (:key, CAST(:results AS JSONB), now() + make_interval(secs => :ttl))
+                    ON CONFLICT (key) DO UPDATE SET
+                        results = EXCLUDED.results,
+                        expires_at = EXCLUDED.expires_at;"""),
+                {"key": key, "results": json.dumps(results), "ttl": ttl},
+            )
+            await conn.commit()
+
+    def get(self, key: str) -> Optional[List[dict]]:
+        try:
+            return self.engine._run_as_sync(self._aget(key))
+        except Exception as e:
+            print(f"Error reading search cache: {e}")
+            return None
+
+    def set(self, key: str, results: List[dict], ttl: float) -> None:
+        try:
+            self.engine._run_as_sync(self._aset(key, results, ttl))
+        except Exception as e:
+            print(f"Error writing search cache: {e}")
+
+    async def aget(self, key: str) -> Optional[List[dict]]:
+        try:
+            return await self.engine._run_as_async(self._aget(key))
+        except Exception as e:
+            print(f"Error reading search cache: {e}")
+            return None
+
+    async def aset(self, key: str, results: List[dict], ttl: float) -> None:
+        try:
+            await self.engine._run_as_async(self._aset(key, results, ttl))
+        except Exception as e:
+            print(f"Error writing search cache: {e}")
+
+
+def shared_backend_enabled() -> bool:
+    return os.getenv("SEARCH_CACHE_BACKEND", "memory") == "postgres"
+
+
+class SearchCache:
+    """In-process LRU cache of search results, bounded by entry count, bytes and TTL.
+
+    Keys are normalized queries. An optional backend is consulted on a local miss and
+    written through on every store, so a fleet of instances can share results.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        max_bytes: int = 8 * 1024 * 1024,
+        ttl: float = 3600.0,
+        backend: Optional[SearchCacheBackend] = None,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.backend = backend
+        self._entries: "OrderedDict[str, Tuple[List[dict], int, float]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.backend_hits = 0
+
+    @classmethod
+    def from_env(cls, engine=None) -> Optional["SearchCache"]:
+        if os.getenv("SEARCH_CACHE_ENABLED", "true").lower() != "true":
+            return None
+
+        backend = None
+        if shared_backend_enabled() and engine is not None:
+            backend = PostgresSearchCacheBackend(engine)
+
+        return cls(
+            max_entries=int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "1024")),
+            max_bytes=int(os.getenv("SEARCH_CACHE_MAX_BYTES", str(8 * 1024 * 1024))),
+            ttl=float(os.getenv("SEARCH_CACHE_TTL", "3600")),
+            backend=backend,
+        )
+
+    def _get_local(self, key: str) -> Optional[List[dict]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            results, size, expires_at = entry
+            if time.monotonic() >= expires_at:
+                del self._entries[key]
+                self._bytes -= size
+                self.expirations += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return results
+
+    def _set_local(self, key: str, results: List[dict]) -> None:
+        size = len(json.dumps(results))
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+
+            self._entries[key] = (results, size, time.monotonic() + self.ttl)
+            self._bytes += size
+
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def _record_backend(self, key: str, results: Optional[List[dict]]) -> Optional[List[dict]]:
+        if results is None:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.backend_hits += 1
+        self._set_local(key, results)
+        return results
+
+    def get(self, query: str) -> Optional[List[dict]]:
+        key = normalize_query(query)
+        results = self._get_local(key)
+        if results is not None:
+            return results
+        backend_results = self.backend.get(key) if self.backend else None
+        return self._record_backend(key, backend_results)
+
+    async def aget(self, query: str) -> Optional[List[dict]]:
+        key = normalize_query(query)
+        results = self._get_local(key)
+        if results is not None:
+            return results
+        backend_results = await self.backend.aget(key) if self.backend else None
+        return self._record_backend(key, backend_results)
+
+    def set(self, query: str, results: List[dict]) -> None:
+        key = normalize_query(query)
+        self._set_local(key, results)
+        if self.backend:
+            self.backend.set(key, results, self.ttl)
+
+    async def aset(self, query: str, results: List[dict]) -> None:
+        key = normalize_query(query)
+        self._set_local(key, results)
+        if self.backend:
+            await self.backend.aset(key, results, self.ttl)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.backend_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "backend_hits": self.backend_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": (self.hits + self.backend_hits) / lookups if lookups else 0.0,
+            }
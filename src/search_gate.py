@@ -0,0 +1,101 @@
+import os
+import re
+import threading
+from typing import Iterable, Optional
+
+from search_cache import TOKEN_PATTERN
+
+# Routes, from cheapest to most expensive
+DIRECT = "direct"        # one model call with no tools bound
+AGENT = "agent"          # the full ReAct graph; the model decides whether to search
+PREFETCH = "prefetch"    # the full graph, with a search for the message started alongside the first model call
+
+SMALL_TALK_WORDS = frozenset("""
+hi hello hey hiya yo howdy morning afternoon evening night good great nice cool awesome perfect
+thanks thank thx ty cheers appreciate appreciated it you so much very lot a again
+ok okay k kk sure yes yeah yep yup no nope nah alright right fine got understood makes sense
+bye goodbye later see ya cya take care have day
+lol haha wow oh ah hmm sup up what's that that's was helpful sounds to me fair enough
+""".split())
+
+# Pleasantries that look like questions
+SMALL_TALK_PHRASES = re.compile(
+    r"\b(how are you( doing)?|how's it going|how have you been|what's up|nice to meet you|how do you do)\b"
+)
+
+# Words that show the user is after ideas, advice or explanation rather than chit-chat, whatever the
+# knowledge base covers; words for the corpus's own topics come from SEARCH_GATE_TOPIC_CUES
+KNOWLEDGE_CUES = frozenset("""
+explain advice tips ideas idea help approach strategy strategies framework learn understand
+stuck struggling struggle problem challenge challenges overwhelmed burnout motivation motivated habit habits
+focus productive productivity creative creativity block blocks team teams leadership lead leader
+manager managing decision decisions career business startup venture change innovation communication conflict
+relationship relationships purpose meaning grow growth improve better practice principles concept theory
+""".split())
+
+QUESTION_OPENERS = frozenset("how why what which should can could would is are do does tell explain".split())
+
+# Questions about the conversation itself, and requests to rework the last answer, need history, not the knowledge base
+CONVERSATION_CUES = frozenset("""
+remember remind earlier said told mentioned name favorite favourite
+again briefly shorter longer bullet bullets translate rephrase reword summarize simpler wrong
+""".split())
+
+
+class SearchGate:
+    """Cheap local pre-classifier that routes each turn before the agent graph runs.
+
+    Scores how likely a message is to need the knowledge base from keyword and shape
+    heuristics (no model call): pure small talk scores 0, questions about ideas,
+    problems and advice score high, as do `topic_cues`, the words for the knowledge base's
+    own subjects. Below `skip_below` the turn takes the tools-disabled single-call path;
+    at or above `prefetch_above` the search is started early.
+    """
+
+    def __init__(self, skip_below: float = 0.2, prefetch_above: float = 0.6, topic_cues: Iterable[str] = ()):
+        self.skip_below = skip_below
+        self.prefetch_above = prefetch_above
+        self.cues = KNOWLEDGE_CUES | {cue.lower() for cue in topic_cues}
+        self._lock = threading.Lock()
+        self.routes = {DIRECT: 0, AGENT: 0, PREFETCH: 0}
+
+    @classmethod
+    def from_env(cls) -> Optional["SearchGate"]:
+        if os.getenv("SEARCH_GATE_ENABLED", "false").lower() != "true":
+            return None
+        return cls(
+            skip_below=float(os.getenv("SEARCH_GATE_SKIP_BELOW", "0.2")),
+            prefetch_above=float(os.getenv("SEARCH_GATE_PREFETCH_ABOVE", "0.6")),
+            topic_cues=os.getenv("SEARCH_GATE_TOPIC_CUES", "").replace(",", " ").split(),
+        )
+
+    def score(self, message: str) -> float:
+        """Likelihood-like score in [0, 1] that answering `message` benefits from a search."""
+        tokens = TOKEN_PATTERN.findall(SMALL_TALK_PHRASES.sub(" ", message.lower()))
+        if not tokens or all(t.strip("'") in SMALL_TALK_WORDS for t in tokens):
+            return 0.0
+
+        score = min(len(tokens) / 20, 0.3)
+        if "?" in message:
+            score += 0.2
+        if tokens[0] in QUESTION_OPENERS:
+            score += 0.15
+        score += min(0.2 * sum(t in self.cues for t in tokens), 0.5)
+        if any(t in CONVERSATION_CUES for t in tokens):
+            score -= 0.5
+        return max(0.0, min(score, 1.0))
+
+    def route(self, message: str) -> str:
+        score = self.score(message)
+        route = DIRECT if score < self.skip_below else PREFETCH if score >= self.prefetch_above else AGENT
+        with self._lock:
+            self.routes[route] += 1
+        return route
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            total = sum(self.routes.values())
+            return {
+                **self.routes,
+                "direct_rate": self.routes[DIRECT] / total if total else 0.0,
+            }
@@ -0,0 +1,134 @@
+import asyncio
+import os
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Iterator, List, Optional
+
+from search_cache import normalize_query
+
+# Prefetch modes: never, only for turns the search gate routes to PREFETCH, or on every turn that has tools
+OFF = "off"
+GATED = "gated"
+ALWAYS = "always"
+
+
+def query_overlap(a: str, b: str) -> float:
+    """Jaccard similarity of two queries' normalized tokens."""
+    tokens_a, tokens_b = set(normalize_query(a).split()), set(normalize_query(b).split())
+    if not tokens_a or not tokens_b:
+        return 0.0
+    return len(tokens_a & tokens_b) / len(tokens_a | tokens_b)
+
+
+class SpeculativeSearch:
+    """A search started for one turn before the model asked for it; the first similar query claims it."""
+
+    def __init__(self, query: str, min_overlap: float):
+        self.query = query
+        self.future: Optional["asyncio.Future"] = None
+        self.min_overlap = min_overlap
+        self.claimed = False
+
+    def claim(self, query: str) -> bool:
+        if self.claimed or query_overlap(self.query, query) < self.min_overlap:
+            return False
+        self.claimed = True
+        return True
+
+
+_speculative_search: ContextVar[Optional[SpeculativeSearch]] = ContextVar("speculative_search", default=None)
+
+
+def current_speculative_search() -> Optional[SpeculativeSearch]:
+    return _speculative_search.get()
+
+
+class SearchPrefetcher:
+    """Runs a speculative search alongside a turn's first model call and counts whether it paid off.
+
+    A prefetch is a hit when a `search_knowledge` query of the turn is similar enough
+    (`min_overlap`, Jaccard over normalized tokens) to claim it; otherwise it is wasted
+    and, if still in flight when the turn ends, cancelled.
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[str], Awaitable[List[dict]]],
+        mode: str = GATED,
+        min_overlap: float = 0.5,
+        context_min_tokens: int = 3,
+    ):
+        self.fetch = fetch
+        self.mode = mode
+        self.min_overlap = min_overlap
+        # Messages with fewer content tokens than this are searched together with the previous user message
+        self.context_min_tokens = context_min_tokens
+        self._lock = threading.Lock()
+        self.started = 0
+        self.hits = 0
+        self.wasted = 0
+        self.cancelled = 0
+
+    @classmethod
+    def from_env(cls, fetch: Callable[[str], Awaitable[List[dict]]]) -> Optional["SearchPrefetcher"]:
+        mode = os.getenv("SEARCH_PREFETCH", GATED).lower()
+        if mode == OFF:
+            return None
+        return cls(
+            fetch,
+            mode=mode,
+            min_overlap=float(os.getenv("SEARCH_PREFETCH_MIN_OVERLAP", "0.5")),
+        )
+
+    def wants(self, gate_route: Optional[str]) -> bool:
+        from search_gate import PREFETCH
+        return self.mode == ALWAYS or gate_route == PREFETCH
+
+    @contextmanager
+    def speculate(
+        self, message: str, previous_message: Optional[Callable[[], Awaitable[Optional[str]]]] = None
+    ) -> Iterator[SpeculativeSearch]:
+        """Start searching for `message`; `search_knowledge` calls made inside the block can claim the result.
+
+        Short messages ("and for teams?") are searched together with `previous_message()`,
+        which is looked up inside the speculative task so it never delays the turn.
+        """
+        speculative = SpeculativeSearch(message, self.min_overlap)
+
+        async def search() -> List[dict]:
+            if previous_message is not None and len(normalize_query(message).split()) < self.context_min_tokens:
+                previous = await previous_message()
+                if previous:
+                    speculative.query = f"{previous} {message}"
+            return await self.fetch(speculative.query)
+
+        future = speculative.future = asyncio.ensure_future(search())
+        # Nobody may ever await it: retrieve the exception so it is not reported as unhandled
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        token = _speculative_search.set(speculative)
+        with self._lock:
+            self.started += 1
+        try:
+            yield speculative
+        finally:
+            _speculative_search.reset(token)
+            in_flight = not future.done()
+            if not speculative.claimed and in_flight:
+                future.cancel()
+            with self._lock:
+                if speculative.claimed:
+                    self.hits += 1
+                else:
+                    self.wasted += 1
+                    self.cancelled += in_flight
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                "started": self.started,
+                "hits": self.hits,
+                "wasted": self.wasted,
+                "cancelled": self.cancelled,
+                "hit_rate": self.hits / self.started if self.started else 0.0,
+            }
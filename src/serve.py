@@ -0,0 +1,82 @@
+"""
+Container entry point: runs `main:app` under uvicorn with one worker per available vCPU.
+
+    WORKERS=auto python serve.py
+    python serve.py --workers 4 --port 8080
+
+Uvicorn spawns its workers as fresh interpreters, so each one builds its own engine,
+LLM client and search client in the app lifespan. Workers divide the instance's
+Postgres pool budget between them (see `db_pool.get_pool_args`) and, with more than
+one worker, Prometheus metrics are aggregated across workers through a shared
+directory.
+"""
+
+import argparse
+import math
+import os
+import shutil
+import tempfile
+from typing import Optional
+
+
+def available_cpus() -> int:
+    """vCPUs this container may use: the cgroup CPU quota if there is one, else the CPU affinity."""
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()[:2]
+        if quota != "max":
+            return max(1, math.ceil(int(quota) / int(period)))
+    except (OSError, ValueError):
+        pass
+
+    try:
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+            quota = int(f.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+            period = int(f.read())
+        if quota > 0:
+            return max(1, math.ceil(quota / period))
+    except (OSError, ValueError):
+        pass
+
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def get_worker_count(value: Optional[str] = None) -> int:
+    """Worker processes per instance, from `value` or WORKERS: a number, or `auto` for one per vCPU."""
+    value = value or os.getenv("WORKERS", "1")
+    if value == "auto":
+        return available_cpus()
+    return max(1, int(value))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the knowledge agent API")
+    parser.add_argument("--app", default="main:app")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8080")))
+    parser.add_argument("--workers", default=None, help="number of workers, or auto (default: WORKERS, else 1)")
+    args = parser.parse_args()
+
+    workers = get_worker_count(args.workers)
+    # Workers read the resolved count to size their share of the pool
+    os.environ["WORKERS"] = str(workers)
+
+    metrics_dir = None
+    if workers > 1 and not os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        metrics_dir = tempfile.mkdtemp(prefix="book-agent-metrics-")
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = metrics_dir
+
+    print(f"Starting {workers} worker(s) on {args.host}:{args.port}")
+    import uvicorn
+    try:
+        uvicorn.run(args.app, host=args.host, port=args.port, workers=workers)
+    finally:
+        if metrics_dir is not None:
+            shutil.rmtree(metrics_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
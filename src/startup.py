@@ -0,0 +1,64 @@
+import asyncio
+import os
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+
+class ServiceLoader:
+    """Builds the agent service off the request path so uvicorn can answer health checks immediately.
+
+    STARTUP_MODE=background (default) starts loading in a background task and lets
+    requests wait for it; STARTUP_MODE=blocking loads before the app starts serving.
+    Phase timings are recorded for the health check.
+    """
+
+    def __init__(self, factory: Callable[["ServiceLoader"], Awaitable[object]]):
+        self.factory = factory
+        self.mode = os.getenv("STARTUP_MODE", "background")
+        self.service = None
+        self.error: Optional[str] = None
+        self.phases: Dict[str, float] = {}
+        self._started_at = time.perf_counter()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.service is not None
+
+    def record(self, phase: str, started_at: float) -> None:
+        self.phases[phase] = round(time.perf_counter() - started_at, 3)
+
+    async def _load(self):
+        try:
+            self.service = await self.factory(self)
+            self.record("total", self._started_at)
+            print(f"✅ Service ready in {self.phases['total']}s: {self.phases}")
+        except Exception as e:
+            self.error = str(e)
+            print(f"Error starting service: {e}")
+            raise
+        return self.service
+
+    async def start(self) -> None:
+        self._started_at = time.perf_counter()
+        if self.mode == "blocking":
+            await self._load()
+        else:
+            self._task = asyncio.create_task(self._load())
+            # Failures are reported through status(); don't warn about an unretrieved exception
+            self._task.add_done_callback(lambda task: task.cancelled() or task.exception())
+
+    async def get(self, timeout: Optional[float] = None):
+        if self.service is not None:
+            return self.service
+        if self._task is None:
+            raise RuntimeError("Service loader was not started")
+        return await asyncio.wait_for(asyncio.shield(self._task), timeout)
+
+    def status(self) -> dict:
+        return {
+            "ready": self.ready,
+            "startup_mode": self.mode,
+            "phases": self.phases,
+            "error": self.error,
+        }
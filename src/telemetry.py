@@ -0,0 +1,262 @@
+import functools
+import json
+import os
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Iterator, Optional, Sequence
+from uuid import UUID, uuid4
+
+from langchain_core.callbacks import BaseCallbackHandler
+from opentelemetry import trace
+from opentelemetry.trace import Status, StatusCode
+from prometheus_client import Counter, Histogram
+from prometheus_client.core import GaugeMetricFamily
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+CHAT_SECONDS = Histogram(
+    "book_agent_chat_seconds", "End-to-end latency of a chat turn", ["mode", "status"], buckets=LATENCY_BUCKETS
+)
+PHASE_SECONDS = Histogram(
+    "book_agent_phase_seconds", "Time spent per phase of a chat turn", ["phase"], buckets=LATENCY_BUCKETS
+)
+LLM_TOKENS = Counter("book_agent_llm_tokens", "LLM tokens used, by direction", ["kind"])
+REACT_ITERATIONS = Histogram(
+    "book_agent_react_iterations", "Agent model calls per chat turn", buckets=(1, 2, 3, 4, 5, 6, 8, 10, 15)
+)
+
+_tracer = trace.get_tracer("book-agent")
+
+
+def get_tracer() -> trace.Tracer:
+    return _tracer
+
+
+class JsonLinesSpanExporter:
+    """Appends finished spans to a local file, one JSON object per line, for offline inspection."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def export(self, spans: Sequence) -> "SpanExportResult":
+        from opentelemetry.sdk.trace.export import SpanExportResult
+        with open(self.path, "a") as f:
+            for span in spans:
+                f.write(json.dumps(json.loads(span.to_json())) + "\n")
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self) -> None:
+        pass
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return True
+
+
+def configure_tracing(exporter=None):
+    """Route spans to `exporter`, or to the one named by TRACE_EXPORTER (none, console or jsonl).
+
+    Tracing stays a no-op until this is called with an exporter. Returns the exporter in use.
+    """
+    global _tracer
+
+    if exporter is None:
+        kind = os.getenv("TRACE_EXPORTER", "none")
+        if kind == "console":
+            from opentelemetry.sdk.trace.export import ConsoleSpanExporter
+            exporter = ConsoleSpanExporter()
+        elif kind == "jsonl":
+            exporter = JsonLinesSpanExporter(os.getenv("TRACE_FILE", "traces.jsonl"))
+        else:
+            return None
+
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor, SimpleSpanProcessor
+
+    provider = TracerProvider(resource=Resource.create({"service.name": "book-agent"}))
+    # Synchronous export keeps the in-memory exporter used by tests deterministic
+    processor = SimpleSpanProcessor if hasattr(exporter, "get_finished_spans") else BatchSpanProcessor
+    provider.add_span_processor(processor(exporter))
+    _tracer = provider.get_tracer("book-agent")
+    return exporter
+
+
+@contextmanager
+def traced_phase(phase: str, span_name: Optional[str] = None, **attributes) -> Iterator[trace.Span]:
+    """Span plus `book_agent_phase_seconds` observation around one unit of work."""
+    started_at = time.perf_counter()
+    with get_tracer().start_as_current_span(span_name or phase, attributes=attributes) as span:
+        try:
+            yield span
+        finally:
+            PHASE_SECONDS.labels(phase).observe(time.perf_counter() - started_at)
+
+
+CHECKPOINT_METHODS = {
+    "get_tuple": "checkpoint_load",
+    "put": "checkpoint_write",
+    "put_writes": "checkpoint_write",
+    "aget_tuple": "checkpoint_load",
+    "aput": "checkpoint_write",
+    "aput_writes": "checkpoint_write",
+}
+
+
+def instrument_checkpointer(checkpointer):
+    """Wrap the checkpointer's read and write methods in `traced_phase` spans, in place."""
+    for name, phase in CHECKPOINT_METHODS.items():
+        method = getattr(checkpointer, name)
+        if name.startswith("a"):
+            @functools.wraps(method)
+            async def traced(*args, _method=method, _name=name, _phase=phase, **kwargs):
+                with traced_phase(_phase, f"checkpoint.{_name}"):
+                    return await _method(*args, **kwargs)
+        else:
+            @functools.wraps(method)
+            def traced(*args, _method=method, _name=name, _phase=phase, **kwargs):
+                with traced_phase(_phase, f"checkpoint.{_name}"):
+                    return _method(*args, **kwargs)
+        setattr(checkpointer, name, traced)
+    return checkpointer
+
+
+class ChatTelemetry(BaseCallbackHandler):
+    """Callback handler for one chat turn: a span per model and tool call, token and iteration counts."""
+
+    run_inline = True
+
+    def __init__(self, span: trace.Span):
+        self.span = span
+        self.context = trace.set_span_in_context(span)
+        self.failed = False
+        self.iterations = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.tools = []
+        # Turn attributes set through `note`, also kept for the analytics event
+        self.notes = {}
+        self._runs = {}
+
+    def note(self, key: str, value) -> None:
+        """Set a span attribute on the turn."""
+        self.notes[key] = value
+        self.span.set_attribute(key, value)
+
+    def fail(self, error: BaseException) -> None:
+        """Mark the turn as failed when the caller handles the error itself."""
+        self.failed = True
+        self.span.record_exception(error)
+        self.span.set_status(Status(StatusCode.ERROR, str(error)))
+
+    def _start(self, run_id: UUID, phase: str, span_name: str, **attributes) -> None:
+        span = get_tracer().start_span(span_name, context=self.context, attributes=attributes)
+        self._runs[run_id] = (span, phase, time.perf_counter())
+
+    def _end(self, run_id: UUID, error: Optional[BaseException] = None, **attributes) -> None:
+        run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        span, phase, started_at = run
+        PHASE_SECONDS.labels(phase).observe(time.perf_counter() - started_at)
+        span.set_attributes(attributes)
+        if error is not None:
+            span.record_exception(error)
+            span.set_status(Status(StatusCode.ERROR, str(error)))
+        span.end()
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs) -> None:
+        node = (metadata or {}).get("langgraph_node", "")
+        if node == "agent":
+            self.iterations += 1
+        self._start(run_id, "llm", "llm", **{"langgraph.node": node})
+
+    def on_llm_end(self, response, *, run_id, **kwargs) -> None:
+        input_tokens = output_tokens = 0
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                input_tokens += usage.get("input_tokens", 0)
+                output_tokens += usage.get("output_tokens", 0)
+        self.input_tokens += input_tokens
+        self.output_tokens += output_tokens
+        LLM_TOKENS.labels("input").inc(input_tokens)
+        LLM_TOKENS.labels("output").inc(output_tokens)
+        self._end(run_id, **{"llm.input_tokens": input_tokens, "llm.output_tokens": output_tokens})
+
+    def on_llm_error(self, error, *, run_id, **kwargs) -> None:
+        self._end(run_id, error)
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs) -> None:
+        name = (serialized or {}).get("name") or kwargs.get("name", "tool")
+        self.tools.append(name)
+        self._start(run_id, "tool", f"tool.{name}")
+
+    def on_tool_end(self, output, *, run_id, **kwargs) -> None:
+        self._end(run_id)
+
+    def on_tool_error(self, error, *, run_id, **kwargs) -> None:
+        self._end(run_id, error)
+
+
+def chat_event(mode: str, thread_id: str, status: str, seconds: float, telemetry: ChatTelemetry) -> dict:
+    """One row of conversation analytics for a finished turn."""
+    return {
+        "event_id": uuid4().hex,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "thread_id": thread_id,
+        "mode": mode,
+        "status": status,
+        "latency_ms": round(seconds * 1000, 1),
+        "iterations": telemetry.iterations,
+        "input_tokens": telemetry.input_tokens,
+        "output_tokens": telemetry.output_tokens,
+        "tool_calls": len(telemetry.tools),
+        "tools": telemetry.tools,
+        "route": telemetry.notes.get("search_gate.route"),
+        "response_cache_hit": bool(telemetry.notes.get("response_cache.hit")),
+    }
+
+
+@contextmanager
+def trace_chat(mode: str, thread_id: str, analytics=None) -> Iterator[ChatTelemetry]:
+    """Root span and turn-level metrics for one chat call; pass the yielded handler as a callback.
+
+    With `analytics` (an `AnalyticsPipeline`), the turn is also queued as a `chat_event`.
+    """
+    started_at = time.perf_counter()
+    with get_tracer().start_as_current_span("chat", attributes={"chat.mode": mode, "chat.thread_id": thread_id}) as span:
+        telemetry = ChatTelemetry(span)
+        try:
+            yield telemetry
+        except Exception:
+            telemetry.failed = True
+            raise
+        finally:
+            status = "error" if telemetry.failed else "ok"
+            span.set_attributes({
+                "react.iterations": telemetry.iterations,
+                "llm.input_tokens": telemetry.input_tokens,
+                "llm.output_tokens": telemetry.output_tokens,
+            })
+            seconds = time.perf_counter() - started_at
+            CHAT_SECONDS.labels(mode, status).observe(seconds)
+            REACT_ITERATIONS.observe(telemetry.iterations)
+            if analytics is not None:
+                analytics.emit(chat_event(mode, thread_id, status, seconds, telemetry))
+
+
+class ServiceStatsCollector:
+    """Exposes the numeric values of `AgentService.get_stats()` as Prometheus gauges."""
+
+    def __init__(self, get_stats):
+        self.get_stats = get_stats
+
+    def describe(self):
+        return []
+
+    def collect(self):
+        for group, values in (self.get_stats() or {}).items():
+            for key, value in (values or {}).items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    yield GaugeMetricFamily(f"book_agent_{group}_{key}", f"{group} {key}, as in /stats", value=value)
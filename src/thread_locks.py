@@ -0,0 +1,402 @@
+import asyncio
+import hashlib
+import os
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional
+
+from sqlalchemy import text
+
+
+class ThreadBusyError(Exception):
+    """Too many turns are already waiting for this thread, or the wait timed out."""
+
+    def __init__(self, thread_id: str, reason: str, retry_after: float = 1.0):
+        super().__init__(f"Thread {thread_id} is busy: {reason}")
+        self.thread_id = thread_id
+        self.retry_after = retry_after
+
+
+def advisory_key(thread_id: str) -> int:
+    """Signed 64-bit key for pg_advisory_lock, stable across processes."""
+    return int.from_bytes(hashlib.sha256(thread_id.encode()).digest()[:8], "big", signed=True)
+
+
+class PostgresAdvisoryLocks:
+    """Cross-instance thread locks held as Postgres session advisory locks.
+
+    All of the instance's locks are held on one session, checked out of the pool while
+    any lock is held, so running turns don't each tie up a connection the checkpointer
+    needs. Statements on it run one at a time, but the session is only held for the
+    statement itself, so turns waiting on different threads poll independently. A failed
+    statement is rolled back, which leaves session locks in place, and a cancelled one
+    runs to completion, so neither costs other threads their locks. If the session itself
+    is lost, Postgres drops every lock it held: that is counted in `sessions_lost` and the
+    locks of turns still running are taken again on a new session, counting in
+    `locks_lost` any that another instance got to first.
+    """
+
+    def __init__(self, engine, poll_interval: float = 0.05):
+        self.engine = engine
+        self.poll_interval = poll_interval
+        self._conn = None
+        # Locks held for running turns, and those of them lost with a session and not yet retaken
+        self._keys: set = set()
+        self._stale: set = set()
+        self._session: Optional[asyncio.Lock] = None
+        self._abandoned: set = set()
+        self.sessions_lost = 0
+        self.locks_lost = 0
+
+    async def _connect(self):
+        if self._conn is None:
+            self._conn = await self.engine._pool.connect()
+            for key in sorted(self._stale):
+                result = await self._conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": key})
+                await self._conn.commit()
+                self._stale.discard(key)
+                if not result.scalar():
+                    self._keys.discard(key)
+                    self.locks_lost += 1
+                    print(f"Advisory lock {key} was taken by another instance while the session was down")
+        return self._conn
+
+    async def _recover(self, error: Exception) -> None:
+        """Roll back a failed statement, or start a new session if it failed with the old one."""
+        if self._conn is None:
+            return
+        if not self._conn.invalidated:
+            try:
+                await self._conn.rollback()
+                return
+            except Exception:
+                pass
+        conn, self._conn = self._conn, None
+        self._stale |= self._keys
+        self.sessions_lost += 1
+        print(f"Advisory lock session lost with {len(self._keys)} locks held: {error}")
+        try:
+            await conn.invalidate()
+        except Exception:
+            pass
+        if self._keys:
+            try:
+                await self._connect()
+            except Exception as e:
+                # Retried with the next statement
+                print(f"Error retaking advisory locks: {e}")
+
+    async def _run(self, statement: str, key: int, update: Callable[[bool], object]) -> bool:
+        """Run `statement` on the locks' session and apply `update` to its result as one step."""
+        async with self._session:
+            try:
+                conn = await self._connect()
+                result = await conn.execute(text(statement), {"key": key})
+                # Don't sit idle in a transaction while holding locks
+                await conn.commit()
+            except Exception as e:
+                await self._recover(e)
+                raise
+            value = bool(result.scalar())
+            update(value)
+            if not self._keys and self._conn is not None:
+                conn, self._conn = self._conn, None
+                await conn.close()
+            return value
+
+    def _release_abandoned(self, key: int, run: "asyncio.Future") -> None:
+        if not run.cancelled() and run.exception() is None and run.result():
+            task = asyncio.ensure_future(self._release(key))
+            self._abandoned.add(task)
+            task.add_done_callback(self._abandoned.discard)
+
+    async def _acquire(self, key: int, timeout: float) -> bool:
+        if self._session is None:
+            self._session = asyncio.Lock()
+        deadline = time.monotonic() + timeout
+        while True:
+            run = asyncio.ensure_future(
+                self._run("SELECT pg_try_advisory_lock(:key)", key, lambda taken: taken and self._keys.add(key))
+            )
+            try:
+                taken = await asyncio.shield(run)
+            except asyncio.CancelledError:
+                # The statement still finishes on the shared session; give back the lock if it took it
+                run.add_done_callback(lambda run: self._release_abandoned(key, run))
+                raise
+            if taken:
+                return True
+            if time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(self.poll_interval)
+
+    async def _release(self, key: int) -> None:
+        if key not in self._keys:
+            # Lost with a session and taken by another instance
+            return
+        self._keys.discard(key)
+        if key in self._stale:
+            # Lost with a session and not taken again yet
+            self._stale.discard(key)
+            return
+        try:
+            await asyncio.shield(self._run("SELECT pg_advisory_unlock(:key)", key, lambda released: None))
+        except Exception as e:
+            # Still held until the session closes, which it does once no other lock is held
+            print(f"Error releasing advisory lock: {e}")
+
+    async def acquire(self, thread_id: str, timeout: float) -> bool:
+        """Take the thread's lock; False if another instance held it for `timeout` seconds."""
+        return await self.engine._run_as_async(self._acquire(advisory_key(thread_id), timeout))
+
+    async def release(self, thread_id: str) -> None:
+        await self.engine._run_as_async(self._release(advisory_key(thread_id)))
+
+    def get_stats(self) -> dict:
+        return {"held": len(self._keys), "sessions_lost": self.sessions_lost, "locks_lost": self.locks_lost}
+
+
+class _PendingTurn:
+    def __init__(self, message: str):
+        self.messages = [message]
+        self.started = False
+        self.result: "asyncio.Future" = asyncio.get_running_loop().create_future()
+        # Joined callers retrieve a failure; don't report it as unhandled when there are none
+        self.result.add_done_callback(lambda f: f.cancelled() or f.exception())
+
+
+class _ThreadSlot:
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.users = 0
+        self.waiting = 0
+        self.pending: Optional[_PendingTurn] = None
+
+
+class ThreadLocks:
+    """Runs one turn at a time per thread_id; different threads run in parallel.
+
+    In-process turns queue on an asyncio lock per thread, at most `max_waiting` deep and
+    for at most `wait_timeout` seconds before ThreadBusyError. The turn then takes the
+    thread's lock shared with `hold_sync`, so a synchronous `chat` and an async turn on
+    the same thread don't interleave either. With `advisory` locks the
+    holder also takes a Postgres advisory lock, so turns for a thread are serialized
+    across instances too. With `coalesce`, messages that arrive while a turn for the
+    thread is queued join it (up to `max_coalesced`) and are answered together.
+    """
+
+    def __init__(
+        self,
+        max_waiting: int = 8,
+        wait_timeout: float = 120.0,
+        advisory: Optional[PostgresAdvisoryLocks] = None,
+        coalesce: bool = False,
+        coalesce_window: float = 0.0,
+        max_coalesced: int = 8,
+        poll_interval: float = 0.05,
+    ):
+        self.max_waiting = max_waiting
+        self.wait_timeout = wait_timeout
+        self.advisory = advisory
+        self.coalesce = coalesce
+        # How long a coalescing turn waits for more messages once it holds the lock
+        self.coalesce_window = coalesce_window
+        self.max_coalesced = max_coalesced
+        # How often an async turn checks whether a synchronous one has let go of the thread
+        self.poll_interval = poll_interval
+        self._slots: Dict[str, _ThreadSlot] = {}
+        # thread_id -> [lock, callers using it]; taken by sync and async turns alike
+        self._shared_locks: Dict[str, list] = {}
+        self._shared_guard = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.turns = 0
+        self.contended = 0
+        self.rejected = 0
+        self.coalesced = 0
+        self.wait_seconds = 0.0
+
+    @classmethod
+    def from_env(cls, engine=None) -> Optional["ThreadLocks"]:
+        if os.getenv("THREAD_LOCKS_ENABLED", "true").lower() != "true":
+            return None
+        advisory = None
+        if engine is not None and os.getenv("THREAD_LOCK_ADVISORY", "true").lower() == "true":
+            advisory = PostgresAdvisoryLocks(engine)
+        return cls(
+            max_waiting=int(os.getenv("THREAD_LOCK_MAX_WAITING", "8")),
+            wait_timeout=float(os.getenv("THREAD_LOCK_TIMEOUT", "120")),
+            advisory=advisory,
+            coalesce=os.getenv("THREAD_COALESCE", "false").lower() == "true",
+            coalesce_window=float(os.getenv("THREAD_COALESCE_WINDOW", "0")),
+            max_coalesced=int(os.getenv("THREAD_COALESCE_MAX_MESSAGES", "8")),
+        )
+
+    def _record(self, **increments) -> None:
+        with self._stats_lock:
+            for name, value in increments.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    @asynccontextmanager
+    async def _enter(self, thread_id: str) -> AsyncIterator[_ThreadSlot]:
+        slot = self._slots.setdefault(thread_id, _ThreadSlot())
+        slot.users += 1
+        try:
+            yield slot
+        finally:
+            slot.users -= 1
+            if slot.users == 0 and self._slots.get(thread_id) is slot:
+                del self._slots[thread_id]
+
+    @contextmanager
+    def _shared(self, thread_id: str) -> Iterator[threading.Lock]:
+        with self._shared_guard:
+            entry = self._shared_locks.setdefault(thread_id, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            yield entry[0]
+        finally:
+            with self._shared_guard:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._shared_locks[thread_id]
+
+    async def _acquire_shared(self, lock: threading.Lock, started_at: float) -> bool:
+        """Take `lock` without blocking the event loop; False after `wait_timeout` (counted from `started_at`)."""
+        while not lock.acquire(blocking=False):
+            if time.perf_counter() - started_at >= self.wait_timeout:
+                return False
+            await asyncio.sleep(self.poll_interval)
+        return True
+
+    @asynccontextmanager
+    async def _acquire(self, thread_id: str, slot: _ThreadSlot) -> AsyncIterator[None]:
+        started_at = time.perf_counter()
+        if not slot.lock.locked():
+            # Free: taken without suspending, so the next caller already sees it held
+            await slot.lock.acquire()
+        else:
+            if slot.waiting >= self.max_waiting:
+                self._record(rejected=1)
+                raise ThreadBusyError(thread_id, f"{slot.waiting} turns already waiting")
+            self._record(contended=1)
+
+            slot.waiting += 1
+            try:
+                await asyncio.wait_for(slot.lock.acquire(), self.wait_timeout)
+            except asyncio.TimeoutError:
+                self._record(rejected=1)
+                raise ThreadBusyError(thread_id, f"waited {self.wait_timeout}s for the running turn")
+            finally:
+                slot.waiting -= 1
+
+        try:
+            with self._shared(thread_id) as shared:
+                # Only ever held by a synchronous turn here: async turns for the thread queue on `slot.lock`
+                if not await self._acquire_shared(shared, started_at):
+                    self._record(rejected=1)
+                    raise ThreadBusyError(thread_id, f"waited {self.wait_timeout}s for the running turn")
+                try:
+                    async with self._acquire_advisory(thread_id, started_at):
+                        yield
+                finally:
+                    shared.release()
+        finally:
+            slot.lock.release()
+
+    @asynccontextmanager
+    async def _acquire_advisory(self, thread_id: str, started_at: float) -> AsyncIterator[None]:
+        locked = False
+        try:
+            if self.advisory is not None:
+                remaining = max(0.0, self.wait_timeout - (time.perf_counter() - started_at))
+                try:
+                    locked = await self.advisory.acquire(thread_id, remaining)
+                except Exception as e:
+                    # The database being unreachable must not stop chats; in-process order still holds
+                    print(f"Error taking advisory lock, continuing without it: {e}")
+                else:
+                    if not locked:
+                        self._record(rejected=1)
+                        raise ThreadBusyError(thread_id, "another instance is running a turn")
+            self._record(turns=1, wait_seconds=time.perf_counter() - started_at)
+            yield
+        finally:
+            if locked:
+                await self.advisory.release(thread_id)
+
+    @asynccontextmanager
+    async def hold(self, thread_id: str) -> AsyncIterator[None]:
+        """Hold the thread's lock for one turn."""
+        async with self._enter(thread_id) as slot, self._acquire(thread_id, slot):
+            yield
+
+    async def run(self, thread_id: str, message: str, turn: Callable[[List[str]], Awaitable[str]]) -> str:
+        """Run `turn(messages)` holding the thread's lock and return its response.
+
+        With coalescing, a message arriving while an earlier turn for the thread is still
+        queued is added to that turn's messages and gets the same response.
+        """
+        async with self._enter(thread_id) as slot:
+            pending = slot.pending
+            if (
+                self.coalesce
+                and pending is not None
+                and not pending.started
+                and len(pending.messages) < self.max_coalesced
+            ):
+                pending.messages.append(message)
+                self._record(coalesced=1)
+                return await asyncio.shield(pending.result)
+
+            pending = _PendingTurn(message)
+            if self.coalesce:
+                slot.pending = pending
+            try:
+                async with self._acquire(thread_id, slot):
+                    if self.coalesce_window and self.coalesce:
+                        await asyncio.sleep(self.coalesce_window)
+                    pending.started = True
+                    if slot.pending is pending:
+                        slot.pending = None
+                    response = await turn(pending.messages)
+            except BaseException as e:
+                if slot.pending is pending:
+                    slot.pending = None
+                if isinstance(e, Exception):
+                    pending.result.set_exception(e)
+                else:
+                    pending.result.cancel()
+                raise
+            pending.result.set_result(response)
+            return response
+
+    @contextmanager
+    def hold_sync(self, thread_id: str) -> Iterator[None]:
+        """Blocking, in-process-only version of `hold` for the synchronous chat path.
+
+        It shares the thread's lock with async turns, so it must not be called on the event
+        loop's thread while an async turn holds the lock: run it in a worker thread.
+        """
+        with self._shared(thread_id) as lock:
+            started_at = time.perf_counter()
+            if not lock.acquire(timeout=self.wait_timeout):
+                self._record(rejected=1)
+                raise ThreadBusyError(thread_id, f"waited {self.wait_timeout}s for the running turn")
+            try:
+                self._record(turns=1, wait_seconds=time.perf_counter() - started_at)
+                yield
+            finally:
+                lock.release()
+
+    def get_stats(self) -> dict:
+        with self._stats_lock:
+            return {
+                "active_threads": len(self._slots),
+                "turns": self.turns,
+                "contended": self.contended,
+                "rejected": self.rejected,
+                "coalesced": self.coalesced,
+                "wait_seconds": round(self.wait_seconds, 3),
+                "advisory": self.advisory.get_stats() if self.advisory is not None else None,
+            }
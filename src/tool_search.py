@@ -1,53 +1,364 @@
+import asyncio
+import contextvars
+import importlib.util
 import os
-from langchain_core.tools import tool
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+from langchain_core.tools import StructuredTool
 import httpx
-import google.auth.transport.requests
-import google.oauth2.id_token
 
+from auth import IdTokenCache
+from context_packing import ContextPacker
+from knowledge_index import KnowledgeIndex
+from resilience import OPEN, CircuitOpenError, OutboundPolicy
+from search_cache import SearchCache, normalize_query
+from search_prefetch import current_speculative_search
+from telemetry import traced_phase
 
-def create_search_tool(search_service_url: str):
-    @tool
-    def search_knowledge(query: str) -> str:
-        """Search the knowledge base for relevant insights and information."""
+# HTTP/2 is negotiated only when the optional `h2` package is installed
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+# One token cache per process: ID tokens are valid for an hour, fetching one is a metadata-server round-trip
+id_token_cache = IdTokenCache()
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=id_token_cache.reset_after_fork)
+
+
+class SearchClient:
+    """Pooled keep-alive client for the search service, shared by every search_knowledge call.
+
+    Requests go through `policy` (see `resilience.OutboundPolicy`): each attempt has a
+    deadline cut from the call's budget, failures are retried with jitter, slow
+    requests may be hedged and a circuit breaker fails searches fast while the
+    service is down.
+    """
+
+    def __init__(
+        self,
+        search_service_url: str,
+        timeout: float = 30.0,
+        token_cache: Optional[IdTokenCache] = None,
+        policy: Optional[OutboundPolicy] = None,
+    ):
+        self.search_service_url = search_service_url
+        self.timeout = timeout
+        self.token_cache = token_cache or id_token_cache
+        self.policy = policy or OutboundPolicy.from_env("SEARCH", hedge_after="auto")
+        self.limits = httpx.Limits(
+            max_connections=int(os.getenv("SEARCH_MAX_CONNECTIONS", "100")),
+            max_keepalive_connections=int(os.getenv("SEARCH_MAX_KEEPALIVE_CONNECTIONS", "20")),
+            keepalive_expiry=float(os.getenv("SEARCH_KEEPALIVE_EXPIRY", "60")),
+        )
+        self._client: Optional[httpx.Client] = None
+        self._async_client: Optional[httpx.AsyncClient] = None
+        self._async_client_loop = None
+        self._async_client_closer: Optional[asyncio.Task] = None
+
+    def _get_client(self) -> httpx.Client:
+        if self._client is None:
+            self._client = httpx.Client(http2=HTTP2_AVAILABLE, limits=self.limits, timeout=self.timeout)
+        return self._client
+
+    def _get_async_client(self) -> httpx.AsyncClient:
+        # Pooled connections belong to the event loop that opened them
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_client_loop is not loop:
+            self._release_async_client()
+            self._async_client = httpx.AsyncClient(http2=HTTP2_AVAILABLE, limits=self.limits, timeout=self.timeout)
+            self._async_client_loop = loop
+            self._async_client_closer = loop.create_task(self._close_when_cancelled(self._async_client))
+        return self._async_client
+
+    @staticmethod
+    async def _close_when_cancelled(client: httpx.AsyncClient) -> None:
+        """Close `client` on its own loop once cancelled, by `_release_async_client` or by asyncio.run,
+        which cancels leftover tasks before it closes the loop: after that, nothing can close the pool."""
         try:
-            id_token = os.environ.get("AUTH_TOKEN", None)
-            
-            if id_token is None:
-                auth_req = google.auth.transport.requests.Request()
-                id_token = google.oauth2.id_token.fetch_id_token(auth_req, audience=search_service_url)
-            
-            headers = {"Authorization": f"Bearer {id_token}"}
-            with httpx.Client() as client:
-                response = client.post(
-                    f"{search_service_url}/search",
-                    json={"query": query, "limit": 3},
-                    headers=headers,
-                    timeout=30.0
+            await asyncio.get_running_loop().create_future()
+        finally:
+            await client.aclose()
+
+    def _release_async_client(self) -> Optional[asyncio.Task]:
+        """Stop using the async client; the task returned closes it on its loop."""
+        closer = self._async_client_closer
+        self._async_client = self._async_client_loop = self._async_client_closer = None
+        if closer is not None and not closer.get_loop().is_closed():
+            closer.get_loop().call_soon_threadsafe(closer.cancel)
+        return closer
+
+    def available(self) -> bool:
+        """False while the circuit breaker is failing searches fast."""
+        return self.policy.breaker is None or self.policy.breaker.state != OPEN
+
+    def _headers(self, id_token: str) -> dict:
+        return {"Authorization": f"Bearer {id_token}"}
+
+    def search(self, query: str, limit: int = 3) -> List[dict]:
+        id_token = self.token_cache.get(self.search_service_url)
+
+        def attempt(timeout: float) -> List[dict]:
+            with traced_phase("search_http", "search.http"):
+                response = self._get_client().post(
+                    f"{self.search_service_url}/search",
+                    json={"query": query, "limit": limit},
+                    headers=self._headers(id_token),
+                    timeout=timeout,
                 )
-            response.raise_for_status()
-            result = response.json()
-            search_results = result.get("result", [])
+                response.raise_for_status()
+            return response.json().get("result", [])
+
+        return self.policy.call(attempt)
+
+    async def asearch(self, query: str, limit: int = 3) -> List[dict]:
+        id_token = self.token_cache.peek(self.search_service_url)
+        if id_token is None:
+            # First call for this audience: the fetch is blocking, keep it off the event loop
+            id_token = await asyncio.to_thread(self.token_cache.get, self.search_service_url)
+
+        async def attempt(timeout: float) -> List[dict]:
+            with traced_phase("search_http", "search.http"):
+                response = await self._get_async_client().post(
+                    f"{self.search_service_url}/search",
+                    json={"query": query, "limit": limit},
+                    headers=self._headers(id_token),
+                    timeout=timeout,
+                )
+                response.raise_for_status()
+            return response.json().get("result", [])
+
+        return await self.policy.acall(attempt)
+
+    def close(self) -> None:
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+    async def aclose(self) -> None:
+        self.close()
+        closer = self._release_async_client()
+        if closer is not None and closer.get_loop() is asyncio.get_running_loop():
+            await asyncio.wait([closer])
+
+
+# Tool result when the search service can't be reached: the model answers without it instead of apologising
+NO_KNOWLEDGE_MESSAGE = (
+    "The knowledge base is unavailable right now. Answer from what you already know, "
+    "without mentioning the search."
+)
+
+
+def search_failed(error: Exception) -> str:
+    if isinstance(error, CircuitOpenError):
+        print(f"Skipping knowledge search: {error}")
+    else:
+        print(f"Error searching knowledge base: {error}")
+    return NO_KNOWLEDGE_MESSAGE
+
+
+def format_results(search_results: List[dict]) -> str:
+    if not search_results:
+        return "No relevant insights found in the knowledge base."
+
+    formatted_results = []
+    for result in search_results:
+        book_id = result.get("book_id", "Unknown")
+        content = result.get("content", "")
+        page = result.get("page_number", "")
+
+        if page:
+            formatted_results.append(f"From {book_id} (page {page}): {content}")
+        else:
+            formatted_results.append(f"From {book_id}: {content}")
 
-            if not search_results:
-                return "No relevant insights found in the knowledge base."
+    return "\n\n".join(formatted_results)
 
-            formatted_results = []
-            for result in search_results:
-                book_id = result.get("book_id", "Unknown")
-                content = result.get("content", "")
-                page = result.get("page_number", "")
 
-                if page:
-                    formatted_results.append(f"From {book_id} (page {page}): {content}")
-                else:
-                    formatted_results.append(f"From {book_id}: {content}")
+# In-flight and finished searches shared by the conversations of one batch (see `share_searches`)
+_shared_searches: ContextVar[Optional[Dict[str, "asyncio.Future"]]] = ContextVar("shared_searches", default=None)
 
-            return "\n\n".join(formatted_results)
 
+def share_searches(searches: Dict[str, "asyncio.Future"]) -> None:
+    """Make async searches in the current task (and tasks it starts) run once per normalized query.
+
+    Every task that calls this with the same dict shares results, so a batch of
+    conversations asking the same question only hits the search service once.
+    """
+    _shared_searches.set(searches)
+
+
+async def fetch_results(
+    client: SearchClient,
+    search_cache: Optional[SearchCache],
+    query: str,
+    knowledge_index: Optional[KnowledgeIndex] = None,
+) -> List[dict]:
+    if knowledge_index is not None:
+        results = knowledge_index.search(query)
+        if results is not None:
+            return results
+    results = await search_cache.aget(query) if search_cache else None
+    if results is None:
+        results = await client.asearch(query)
+        if search_cache:
+            await search_cache.aset(query, results)
+    if knowledge_index is not None:
+        knowledge_index.record(results)
+    return results
+
+
+SEARCH_TOOL_DESCRIPTION = (
+    "Search the knowledge base for relevant insights and information. To look at a topic from "
+    "several angles, pass all the queries at once in `queries`: they run in parallel and the "
+    "results come back merged and deduplicated."
+)
+
+# Reciprocal-rank fusion constant: damps the lead of a single query's top hit
+RRF_K = 60
+
+
+def merge_results(result_lists: List[List[dict]], max_results: int) -> List[dict]:
+    """Fuse several queries' ranked hits into one list, deduplicated by (book_id, page_number).
+
+    Hits are ranked by reciprocal-rank fusion, so passages that several queries
+    agree on come first; ties keep the order they were first seen in.
+    """
+    scores: Dict[tuple, float] = {}
+    hits: Dict[tuple, dict] = {}
+    for results in result_lists:
+        for rank, hit in enumerate(results):
+            page = hit.get("page_number")
+            key = (hit.get("book_id"), page if page not in (None, "") else hit.get("content"))
+            scores[key] = scores.get(key, 0.0) + 1.0 / (RRF_K + rank + 1)
+            hits.setdefault(key, hit)
+    ranked = sorted(scores, key=lambda key: scores[key], reverse=True)
+    return [hits[key] for key in ranked[:max_results]]
+
+
+def collect_queries(query: str, queries: Optional[List[str]], max_queries: int) -> List[str]:
+    """The distinct queries of one tool call, in order, capped at `max_queries`."""
+    collected, seen = [], set()
+    for candidate in [query, *(queries or [])]:
+        key = normalize_query(candidate or "")
+        if candidate and candidate.strip() and key not in seen:
+            seen.add(key)
+            collected.append(candidate)
+    return collected[:max_queries]
+
+
+def create_search_tool(
+    search_service_url: str,
+    search_client: Optional[SearchClient] = None,
+    search_cache: Optional[SearchCache] = None,
+    knowledge_index: Optional[KnowledgeIndex] = None,
+    context_packer: Optional[ContextPacker] = None,
+):
+    client = search_client or SearchClient(search_service_url)
+
+    def format_hits(all_queries: List[str], results: List[dict]) -> str:
+        if context_packer is None:
+            return format_results(results)
+        return context_packer.format(all_queries, results)
+    max_queries = int(os.getenv("SEARCH_MAX_QUERIES", "5"))
+    max_results = int(os.getenv("SEARCH_MAX_RESULTS", "5"))
+
+    def fetch_sync(query: str) -> List[dict]:
+        if knowledge_index is not None:
+            results = knowledge_index.search(query)
+            if results is not None:
+                return results
+        results = search_cache.get(query) if search_cache else None
+        if results is None:
+            results = client.search(query)
+            if search_cache:
+                search_cache.set(query, results)
+        if knowledge_index is not None:
+            knowledge_index.record(results)
+        return results
+
+    def format_merged(all_queries: List[str], outcomes: list) -> str:
+        result_lists = [o for o in outcomes if not isinstance(o, Exception)]
+        if not result_lists:
+            raise outcomes[0]
+        for query, outcome in zip(all_queries, outcomes):
+            if isinstance(outcome, Exception):
+                print(f"Error searching knowledge base for {query!r}: {outcome}")
+        return format_hits(all_queries, merge_results(result_lists, max_results))
+
+    def search_knowledge(query: str = "", queries: Optional[List[str]] = None) -> str:
+        """Search the knowledge base for relevant insights and information."""
+        try:
+            all_queries = collect_queries(query, queries, max_queries)
+            if not all_queries:
+                return "No search query given."
+            if len(all_queries) == 1:
+                return format_hits(all_queries, fetch_sync(all_queries[0]))
+
+            def attempt(q: str):
+                try:
+                    return fetch_sync(q)
+                except Exception as e:
+                    return e
+
+            # Worker threads don't inherit context variables: carry the turn's deadline,
+            # token budget and trace span over, one copy per thread
+            contexts = [contextvars.copy_context() for _ in all_queries]
+            with ThreadPoolExecutor(max_workers=len(all_queries)) as executor:
+                outcomes = list(executor.map(lambda context, q: context.run(attempt, q), contexts, all_queries))
+            return format_merged(all_queries, outcomes)
+        except Exception as e:
+            return search_failed(e)
+
+    async def fetch_shared(query: str, searches: Dict[str, "asyncio.Future"]) -> List[dict]:
+        key = normalize_query(query)
+        future = searches.get(key)
+        if future is None:
+            future = searches[key] = asyncio.ensure_future(
+                fetch_results(client, search_cache, query, knowledge_index)
+            )
+        try:
+            # Shielded: one conversation being cancelled must not cancel the others' search
+            return await asyncio.shield(future)
+        except Exception:
+            # Let the next caller retry instead of sharing the failure
+            if searches.get(key) is future:
+                del searches[key]
+            raise
+
+    async def afetch(query: str) -> List[dict]:
+        speculative = current_speculative_search()
+        if speculative is not None and speculative.claim(query):
+            try:
+                return await speculative.future
+            except Exception as e:
+                print(f"Error in prefetched search for {speculative.query!r}, searching again: {e}")
+
+        searches = _shared_searches.get()
+        if searches is None:
+            return await fetch_results(client, search_cache, query, knowledge_index)
+        return await fetch_shared(query, searches)
+
+    async def asearch_knowledge(query: str = "", queries: Optional[List[str]] = None) -> str:
+        """Search the knowledge base for relevant insights and information."""
+        try:
+            all_queries = collect_queries(query, queries, max_queries)
+            if not all_queries:
+                return "No search query given."
+            if len(all_queries) == 1:
+                return format_hits(all_queries, await afetch(all_queries[0]))
+
+            outcomes = await asyncio.gather(*[afetch(q) for q in all_queries], return_exceptions=True)
+            return format_merged(all_queries, outcomes)
         except Exception as e:
-            return f"Error searching knowledge base: {str(e)}"
+            return search_failed(e)
 
-    return search_knowledge
+    return StructuredTool.from_function(
+        func=search_knowledge,
+        coroutine=asearch_knowledge,
+        name="search_knowledge",
+        description=SEARCH_TOOL_DESCRIPTION,
+    )
 
 
 if __name__ == "__main__":
@@ -68,6 +379,6 @@ if __name__ == "__main__":
     print(f"Result: {result2}")
 
     print(f"\n--- Test 3: Decision Making ---")
-    result3 = search_tool.invoke({"query": "decision making organizational leadership"})
+    result3 = asyncio.run(search_tool.ainvoke({"query": "decision making organizational leadership"}))
     print(f"Query: decision making organizational leadership")
     print(f"Result: {result3}")
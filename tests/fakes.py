@@ -0,0 +1,328 @@
+"""
+Offline stand-ins for Gemini and the search service, shared by tests and benchmarks.
+"""
+
+import asyncio
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, AsyncIterator, Callable, List, Optional, Union
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage, ToolMessage
+from langchain_core.messages.utils import count_tokens_approximately
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from langgraph.checkpoint.memory import MemorySaver
+
+from agent_service import AgentService
+
+
+class FakeChatModel(BaseChatModel):
+    """Deterministic chat model with configurable latency and tool-call behaviour.
+
+    When `search_query` is set, the first call of a turn on the tools-bound copy
+    asks for `search_knowledge(search_query)`, with `{message}` replaced by the
+    user's message; the call after the tool result answers. `search_queries` asks
+    for all of them in one `search_knowledge(queries=...)` call, or, with
+    `batch_searches=False`, for one per model call, as a sequential ReAct loop would. Copies made by `bind_tools` share the `calls` log.
+    `latency` is the time to the first token, `token_latency` the gap between
+    streamed tokens, and `latency_per_token` adds prompt-size dependent latency.
+    With `error` set, every call raises it after the latency, like an unavailable model.
+    """
+
+    latency: float = 0.0
+    latency_per_token: float = 0.0
+    token_latency: float = 0.0
+    search_query: Optional[str] = None
+    search_queries: List[str] = []
+    batch_searches: bool = True
+    answer: str = "Here is a thoughtful answer."
+    tools_bound: bool = False
+    error: Optional[Any] = None
+    calls: List[List[BaseMessage]] = []
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat-model"
+
+    @property
+    def call_count(self) -> int:
+        return len(self.calls)
+
+    @property
+    def last_messages(self) -> List[BaseMessage]:
+        return self.calls[-1] if self.calls else []
+
+    def _latency(self, messages: List[BaseMessage]) -> float:
+        if not self.latency_per_token:
+            return self.latency
+        return self.latency + self.latency_per_token * count_tokens_approximately(messages)
+
+    def bind_tools(self, tools: Any, **kwargs: Any):
+        # Like real chat models: a binding that passes the tool schemas to every call
+        return self.model_copy(update={"tools_bound": True}).bind(
+            tools=[convert_to_openai_tool(tool) for tool in tools], **kwargs
+        )
+
+    @staticmethod
+    def _usage(messages: List[BaseMessage], content: str) -> dict:
+        input_tokens = count_tokens_approximately(messages)
+        output_tokens = len(content.split())
+        return {"input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens}
+
+    def _respond(self, messages: List[BaseMessage]) -> AIMessage:
+        self.calls.append(list(messages))
+        if self.error is not None:
+            raise self.error
+        last = messages[-1]
+
+        args = None
+        if self.tools_bound and self.search_query and isinstance(last, HumanMessage):
+            args = {"query": self.search_query.format(message=last.content)}
+        elif self.tools_bound and self.search_queries and self.batch_searches and isinstance(last, HumanMessage):
+            args = {"queries": self.search_queries}
+        elif self.tools_bound and self.search_queries and not self.batch_searches:
+            turn_start = max(i for i, m in enumerate(messages) if isinstance(m, HumanMessage))
+            searched = sum(isinstance(m, ToolMessage) for m in messages[turn_start:])
+            if searched < len(self.search_queries):
+                args = {"query": self.search_queries[searched]}
+
+        if args is not None:
+            return AIMessage(
+                content="",
+                tool_calls=[{
+                    "name": "search_knowledge",
+                    "args": args,
+                    "id": f"call_{uuid.uuid4().hex[:12]}",
+                }],
+                usage_metadata=self._usage(messages, "search_knowledge"),
+            )
+
+        human = [m.content for m in messages if isinstance(m, HumanMessage)]
+        used_search = isinstance(last, ToolMessage)
+        content = f"{self.answer} You said: {human[-1] if human else ''}"
+        if used_search:
+            content += " (with knowledge)"
+        return AIMessage(content=content, usage_metadata=self._usage(messages, content))
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        if self._latency(messages):
+            time.sleep(self._latency(messages))
+        return ChatResult(generations=[ChatGeneration(message=self._respond(messages))])
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        if self._latency(messages):
+            await asyncio.sleep(self._latency(messages))
+        return ChatResult(generations=[ChatGeneration(message=self._respond(messages))])
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        if self._latency(messages):
+            await asyncio.sleep(self._latency(messages))
+        message = self._respond(messages)
+
+        if message.tool_calls:
+            yield ChatGenerationChunk(message=AIMessageChunk(
+                content="",
+                usage_metadata=message.usage_metadata,
+                tool_call_chunks=[{
+                    "name": call["name"],
+                    "args": json.dumps(call["args"]),
+                    "id": call["id"],
+                    "index": i,
+                } for i, call in enumerate(message.tool_calls)],
+            ))
+            return
+
+        words = message.content.split(" ")
+        for i, word in enumerate(words):
+            if i and self.token_latency:
+                await asyncio.sleep(self.token_latency)
+            token = word if i == len(words) - 1 else word + " "
+            # Usage arrives with the final chunk, as with Gemini
+            usage = message.usage_metadata if i == len(words) - 1 else None
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token, usage_metadata=usage))
+            if run_manager:
+                await run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+
+class StubSearchServer:
+    """Local HTTP server that speaks the search service's `/search` contract.
+
+    Faults can be injected: the first `fail_first` requests, and a random `error_rate`
+    of the rest, answer `error_status`; the first `slow_first` requests, and a random
+    `slow_rate` of the rest, take `slow_latency` instead of `latency`. The attributes
+    can be changed while the server runs, e.g. to take the service down and back up.
+
+    Usage:
+        with StubSearchServer(latency=0.05) as server:
+            tool = create_search_tool(server.url)
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        results: Optional[Union[List[dict], Callable[[str], List[dict]]]] = None,
+        error_rate: float = 0.0,
+        error_status: int = 503,
+        slow_rate: float = 0.0,
+        slow_latency: float = 1.0,
+        fail_first: int = 0,
+        slow_first: int = 0,
+        seed: Optional[int] = None,
+    ):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.fail_first = fail_first
+        self.slow_first = slow_first
+        self._random = random.Random(seed)
+        self._fault_lock = threading.Lock()
+        self.results = results if results is not None else [
+            {"book_id": "the-creative-act", "page_number": 12, "content": "Creativity is a practice of noticing."},
+            {"book_id": "deep-work", "page_number": 40, "content": "Focus is a skill that compounds."},
+            {"book_id": "the-network-state", "page_number": 3, "content": "A network state is a highly aligned online community."},
+        ]
+        self.request_count = 0
+        self.queries: List[str] = []
+        self.connections = set()
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _make_handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def handle(self):
+                try:
+                    super().handle()
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client gave up on the request, e.g. the losing half of a hedged pair
+                    pass
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                with stub._fault_lock:
+                    stub.request_count += 1
+                    number = stub.request_count
+                    fail = number <= stub.fail_first or stub._random.random() < stub.error_rate
+                    slow = number <= stub.slow_first or stub._random.random() < stub.slow_rate
+                stub.queries.append(payload.get("query", ""))
+                stub.connections.add(self.client_address)
+
+                latency = stub.slow_latency if slow else stub.latency
+                if latency:
+                    time.sleep(latency)
+
+                if fail:
+                    body = json.dumps({"status": "error", "message": "injected fault"}).encode()
+                    self.send_response(stub.error_status)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                    return
+
+                limit = payload.get("limit", 3)
+                results = stub.results(payload.get("query", "")) if callable(stub.results) else stub.results
+                body = json.dumps({"status": "success", "result": results[:limit]}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+    def start(self) -> "StubSearchServer":
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self) -> "StubSearchServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+def make_agent_service(search_service_url: str = "http://127.0.0.1:9", **llm_kwargs) -> AgentService:
+    """AgentService running the real graph on a FakeChatModel and an in-memory checkpointer."""
+    return AgentService(
+        project_id="test-project",
+        search_service_url=search_service_url,
+        llm=FakeChatModel(**llm_kwargs),
+        checkpointer=MemorySaver()
+    )
+
+
+def synthetic_corpus(size: int, seed: int = 0, vocabulary_size: int = 5000) -> List[dict]:
+    """Book passages of made-up words with Zipf-like frequencies, for retrieval tests and benchmarks."""
+    rng = random.Random(seed)
+    letters = "etaoinshrdlcumwfgypbvkjxqz"
+    vocabulary = sorted({
+        "".join(rng.choices(letters, [26 - i for i in range(26)], k=rng.randint(3, 9)))
+        for _ in range(vocabulary_size)
+    })
+    weights = [1 / (rank + 1) for rank in range(len(vocabulary))]
+    return [
+        {
+            "book_id": f"book-{i % 20}",
+            "page_number": i // 20 + 1,
+            "content": " ".join(rng.choices(vocabulary, weights, k=rng.randint(60, 120))),
+        }
+        for i in range(size)
+    ]
+
+
+def passage_query(passage: dict, rng: random.Random, words: int = 5) -> str:
+    """A query a reader might ask of `passage`: a few of its words, mostly ones it uses only once."""
+    tokens = passage["content"].split()
+    rare = sorted({t for t in tokens if tokens.count(t) == 1})
+    pool = rare if len(rare) >= words else sorted(set(tokens))
+    return " ".join(rng.sample(pool, words))
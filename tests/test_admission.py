@@ -0,0 +1,167 @@
+import asyncio
+import json
+import time
+
+import httpx
+import pytest
+
+import main
+from admission import AdmissionController, AdmissionRejected, AIMDLimit
+from resilience import DeadlineExceeded
+from tests.fakes import make_agent_service
+
+
+def test_aimd_limit_grows_while_fast_and_backs_off_once_per_round():
+    limit = AIMDLimit(initial=4, latency_target=1.0, backoff=0.5)
+    started_at = time.monotonic()
+
+    for _ in range(40):
+        limit.update(started_at, 0.1, False, inflight=3)
+    assert 8 < limit.limit < 10
+
+    grown = limit.limit
+    # A burst of slow turns that all ran under the old limit counts as one signal
+    for _ in range(10):
+        limit.update(started_at, 2.0, False, inflight=3)
+    assert limit.limit == grown / 2 and limit.decreases == 1
+
+    limit.update(time.monotonic(), 0.1, True, inflight=3)
+    assert limit.limit == grown / 4
+
+    # Light traffic doesn't grow the limit
+    limit.update(time.monotonic(), 0.1, False, inflight=0)
+    assert limit.limit == grown / 4
+
+
+def test_queued_turns_are_served_round_robin_across_tenants():
+    admission = AdmissionController(AIMDLimit(initial=1), queue_timeout=5)
+    order = []
+
+    async def turn(thread_id: str):
+        async with admission.admit(thread_id):
+            order.append(thread_id)
+            await asyncio.sleep(0.01)
+
+    async def run():
+        tasks = [asyncio.ensure_future(turn(f"bulk:{i}")) for i in range(4)]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.ensure_future(turn("chat:1")))
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+
+    # The quiet tenant waits for one of the bulk tenant's turns, not all of them
+    assert order == ["bulk:0", "bulk:1", "chat:1", "bulk:2", "bulk:3"]
+    assert admission.get_stats()["inflight"] == 0
+
+
+def test_over_capacity_is_rejected_fast():
+    admission = AdmissionController(AIMDLimit(initial=1), max_queue=3, max_queue_per_tenant=2, queue_timeout=0.2)
+
+    async def run():
+        await admission.acquire("busy")
+        waiting = [asyncio.ensure_future(admission.acquire("bulk")) for _ in range(2)]
+        await asyncio.sleep(0)
+
+        with pytest.raises(AdmissionRejected) as tenant_full:
+            await admission.acquire("bulk")
+        waiting.append(asyncio.ensure_future(admission.acquire("quiet")))
+        await asyncio.sleep(0)
+        # The queue is full: the longest queue gives up its newest request for a new caller
+        waiting.append(asyncio.ensure_future(admission.acquire("other")))
+        await asyncio.sleep(0)
+        evicted = waiting[1]
+        with pytest.raises(AdmissionRejected) as evicted_error:
+            await evicted
+
+        started_at = time.monotonic()
+        with pytest.raises(AdmissionRejected) as timed_out:
+            await waiting[0]
+        return tenant_full.value, evicted_error.value, timed_out.value, time.monotonic() - started_at
+
+    tenant_full, evicted, timed_out, waited = asyncio.run(run())
+
+    assert tenant_full.status_code == 429 and tenant_full.retry_after >= 1
+    assert evicted.status_code == 429
+    assert timed_out.status_code == 503 and waited < 0.5
+    stats = admission.get_stats()
+    assert stats["evicted"] == 1 and stats["rejected_tenant"] == 1 and stats["timed_out"] == 3
+
+
+def test_overload_errors_shrink_the_limit():
+    admission = AdmissionController(AIMDLimit(initial=8))
+
+    async def run():
+        with pytest.raises(DeadlineExceeded):
+            async with admission.admit("thread-1"):
+                raise DeadlineExceeded("turn budget exhausted")
+        with pytest.raises(ValueError):
+            async with admission.admit("thread-1"):
+                raise ValueError("bad request")
+
+    asyncio.run(run())
+
+    assert admission.limit.limit == 6 and admission.inflight == 0
+
+
+def test_chat_endpoint_sheds_load_with_retry_after(monkeypatch):
+    service = make_agent_service(latency=0.2)
+    service.admission = AdmissionController(AIMDLimit(initial=2), max_queue=2, queue_timeout=5)
+    monkeypatch.setattr(main, "agent_service", service)
+
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await asyncio.gather(*[
+                client.post("/chat", json={"message": "Hello!", "thread_id": f"thread-{i}"}) for i in range(8)
+            ])
+
+    responses = asyncio.run(run())
+
+    statuses = sorted(r.status_code for r in responses)
+    assert statuses == [200] * 4 + [503] * 4
+    assert all(int(r.headers["Retry-After"]) >= 1 for r in responses if r.status_code == 503)
+
+
+def test_stream_slot_is_released_when_the_client_is_gone_before_the_first_chunk(monkeypatch):
+    service = make_agent_service()
+    service.admission = AdmissionController(AIMDLimit(initial=2))
+    monkeypatch.setattr(main, "agent_service", service)
+    body = json.dumps({"message": "Hello!", "thread_id": "thread-gone"}).encode()
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+
+    async def receive():
+        return messages.pop(0) if messages else {"type": "http.disconnect"}
+
+    async def send(message):
+        # The connection is already closed when the headers go out
+        raise ConnectionResetError("client disconnected")
+
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+        "scheme": "http", "path": "/chat/stream", "raw_path": b"/chat/stream", "root_path": "",
+        "query_string": b"", "headers": [(b"content-type", b"application/json")],
+        "client": ("test", 1), "server": ("test", 80),
+    }
+    with pytest.raises(ConnectionResetError):
+        asyncio.run(main.app(scope, receive, send))
+
+    assert service.admission.inflight == 0
+    # Not an overload signal
+    assert service.admission.limit.decreases == 0
+
+
+def test_failed_stream_turn_shrinks_the_limit(monkeypatch):
+    service = make_agent_service(error=DeadlineExceeded("turn budget exhausted"))
+    service.admission = AdmissionController(AIMDLimit(initial=8))
+    monkeypatch.setattr(main, "agent_service", service)
+
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post("/chat/stream", json={"message": "Hello!", "thread_id": "thread-fail"})
+
+    response = asyncio.run(run())
+
+    assert "event: error" in response.text
+    assert service.admission.inflight == 0 and service.admission.limit.limit == 6
@@ -0,0 +1,149 @@
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+
+from fastapi.testclient import TestClient
+
+import main
+from analytics import AnalyticsPipeline, BigQuerySink, FileSink
+from tests.fakes import StubSearchServer, make_agent_service
+
+
+class BlockedSink:
+    """Sink whose writes wait until `release` is set, like a stalled BigQuery."""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.rows = []
+
+    def write(self, rows):
+        self.release.wait(5)
+        self.rows += rows
+
+    def close(self):
+        pass
+
+
+def read_lines(path) -> list:
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def test_chat_turns_are_written_to_sqlite(monkeypatch, tmp_path):
+    monkeypatch.setenv("AUTH_TOKEN", "test-token")
+    monkeypatch.setenv("ANALYTICS_ENABLED", "true")
+    monkeypatch.setenv("ANALYTICS_SINK", "sqlite")
+    monkeypatch.setenv("ANALYTICS_PATH", str(tmp_path / "analytics.db"))
+
+    with StubSearchServer() as server:
+        service = make_agent_service(server.url, search_query="creative blocks")
+        asyncio.run(service.achat("I'm stuck on a project", "thread-analytics"))
+        service.chat("Thanks!", "thread-analytics")
+    service.analytics.close()
+
+    conn = sqlite3.connect(str(tmp_path / "analytics.db"))
+    rows = conn.execute(
+        "SELECT thread_id, mode, status, iterations, tool_calls, tools, output_tokens FROM chat_events ORDER BY timestamp"
+    ).fetchall()
+    assert rows[0][:6] == ("thread-analytics", "achat", "ok", 2, 1, '["search_knowledge"]')
+    assert rows[1][1] == "chat"
+    assert all(row[6] > 0 for row in rows)
+    assert service.get_stats()["analytics"]["written"] == 2
+
+
+def test_full_queue_drops_instead_of_blocking():
+    sink = BlockedSink()
+    pipeline = AnalyticsPipeline(sink, max_queue=5, batch_size=1, flush_interval=0.01)
+
+    started_at = time.perf_counter()
+    accepted = [pipeline.emit({"n": i}) for i in range(50)]
+    elapsed = time.perf_counter() - started_at
+    sink.release.set()
+    pipeline.close()
+
+    stats = pipeline.get_stats()
+    assert elapsed < 0.1
+    assert stats["dropped"] == accepted.count(False) >= 40
+    assert len(sink.rows) == stats["emitted"] == stats["written"]
+
+
+def test_flushes_by_size_and_time(tmp_path):
+    path = tmp_path / "events.jsonl"
+    pipeline = AnalyticsPipeline(FileSink(str(path)), batch_size=3, flush_interval=0.05)
+
+    for i in range(7):
+        pipeline.emit({"n": i})
+    time.sleep(0.3)
+    # Two full batches, then the seventh event once the interval passed
+    assert [row["n"] for row in read_lines(path)] == list(range(7))
+    assert pipeline.get_stats()["batches"] == 3
+
+    pipeline.emit({"n": 7})
+    pipeline.close()
+    assert len(read_lines(path)) == 8
+    assert not pipeline.emit({"n": 8})
+
+
+def test_failed_batches_are_retried_then_counted(tmp_path):
+    class FlakySink(FileSink):
+        failures = 1
+
+        def write(self, rows):
+            if self.failures:
+                self.failures -= 1
+                raise ConnectionError("BigQuery unavailable")
+            super().write(rows)
+
+    path = tmp_path / "events.jsonl"
+    pipeline = AnalyticsPipeline(FlakySink(str(path)), batch_size=10, flush_interval=0.01)
+    pipeline.emit({"n": 0})
+    time.sleep(0.1)
+    pipeline.close()
+    assert len(read_lines(path)) == 1
+
+    broken = FlakySink(str(tmp_path / "broken.jsonl"))
+    broken.failures = 100
+    pipeline = AnalyticsPipeline(broken, flush_interval=0.01, max_attempts=2)
+    pipeline.emit({"n": 0})
+    time.sleep(0.1)
+    pipeline.close()
+    stats = pipeline.get_stats()
+    assert stats["flush_errors"] == 2 and stats["failed"] == 1 and stats["written"] == 0
+
+
+def test_bigquery_sink_reuses_one_client():
+    class FakeClient:
+        def __init__(self):
+            self.calls = []
+            self.closed = False
+
+        def insert_rows_json(self, table, rows, row_ids=None):
+            self.calls.append((table, row_ids))
+            return []
+
+        def close(self):
+            self.closed = True
+
+    clients = []
+    sink = BigQuerySink("project", "dataset", "events", client_factory=lambda: clients.append(FakeClient()) or clients[-1])
+    sink.write([{"event_id": "a"}, {"event_id": "b"}])
+    sink.write([{"event_id": "c"}])
+    sink.close()
+
+    assert len(clients) == 1 and clients[0].closed
+    assert clients[0].calls == [("project.dataset.events", ["a", "b"]), ("project.dataset.events", ["c"])]
+
+
+def test_shutdown_flushes_queued_events(monkeypatch, tmp_path):
+    path = tmp_path / "events.jsonl"
+    service = make_agent_service()
+    # Long enough that only shutdown writes the batch
+    service.analytics = AnalyticsPipeline(FileSink(str(path)), flush_interval=60)
+    monkeypatch.setattr(main, "agent_service", service)
+
+    with TestClient(main.app) as client:
+        assert client.post("/chat", json={"message": "Hello!", "thread_id": "thread-http"}).status_code == 200
+        assert not path.exists()
+
+    assert [row["thread_id"] for row in read_lines(path)] == ["thread-http"]
@@ -0,0 +1,72 @@
+import asyncio
+import time
+
+from fastapi.testclient import TestClient
+
+import main
+from tests.fakes import StubSearchServer, make_agent_service
+from tool_search import create_search_tool
+
+
+def test_achat_remembers_thread():
+    service = make_agent_service()
+
+    async def conversation():
+        await service.achat("My favorite color is purple", "thread-1")
+        return await service.achat("What is my favorite color?", "thread-1")
+
+    asyncio.run(conversation())
+
+    # The second turn sees the whole thread history
+    contents = [m.content for m in service.llm.last_messages]
+    assert any("purple" in c for c in contents)
+
+
+def test_achat_runs_conversations_concurrently():
+    service = make_agent_service(latency=0.2)
+
+    async def burst():
+        return await asyncio.gather(*[
+            service.achat(f"Hello {i}", f"thread-{i}") for i in range(100)
+        ])
+
+    start = time.perf_counter()
+    responses = asyncio.run(burst())
+    elapsed = time.perf_counter() - start
+
+    assert len(responses) == 100
+    assert all("Hello" in r for r in responses)
+    # 100 sequential calls would take 20s
+    assert elapsed < 5.0
+
+
+def test_async_search_tool(monkeypatch):
+    monkeypatch.setenv("AUTH_TOKEN", "test-token")
+
+    with StubSearchServer() as server:
+        tool = create_search_tool(server.url)
+        result = asyncio.run(tool.ainvoke({"query": "creative blocks"}))
+
+    assert "From the-creative-act (page 12)" in result
+    assert server.queries == ["creative blocks"]
+
+
+def test_achat_with_search(monkeypatch):
+    monkeypatch.setenv("AUTH_TOKEN", "test-token")
+
+    with StubSearchServer() as server:
+        service = make_agent_service(server.url, search_query="creative blocks")
+        response = asyncio.run(service.achat("I'm stuck on a project", "thread-search"))
+
+    assert "(with knowledge)" in response
+    assert server.request_count == 1
+
+
+def test_chat_endpoint(monkeypatch):
+    monkeypatch.setattr(main, "agent_service", make_agent_service())
+
+    client = TestClient(main.app)
+    response = client.post("/chat", json={"message": "Hello!", "thread_id": "thread-http"})
+
+    assert response.status_code == 200
+    assert "Hello!" in response.json()["response"]
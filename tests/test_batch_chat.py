@@ -0,0 +1,86 @@
+import asyncio
+import json
+import time
+
+from fastapi.testclient import TestClient
+
+import main
+from admission import AdmissionController, AIMDLimit
+from tests.fakes import StubSearchServer, make_agent_service
+
+
+def test_chat_many_returns_responses_in_order():
+    service = make_agent_service(latency=0.1)
+    items = [(f"thread-{i}", f"Hello {i}") for i in range(20)]
+
+    start = time.perf_counter()
+    responses = asyncio.run(service.chat_many(items, max_concurrency=5))
+    elapsed = time.perf_counter() - start
+
+    assert [r.endswith(f"Hello {i}") for i, r in enumerate(responses)] == [True] * 20
+    # 20 turns, 5 at a time
+    assert 0.4 <= elapsed < 2.0
+
+
+def test_chat_many_turns_go_through_admission():
+    service = make_agent_service(latency=0.1)
+    service.admission = AdmissionController(AIMDLimit(initial=2, max_limit=2), max_queue_per_tenant=2)
+    items = [(f"bulk:{i}", f"Hello {i}") for i in range(6)]
+
+    responses = asyncio.run(service.chat_many(items, max_concurrency=6))
+
+    # Two run, two wait in the tenant's queue, the rest are turned away
+    over_capacity = [r for r in responses if "Over capacity" in r]
+    assert len(over_capacity) == 2
+    stats = service.admission.get_stats()
+    assert stats["admitted"] == 4 and stats["rejected_tenant"] == 2 and stats["inflight"] == 0
+
+
+def test_chat_many_runs_turns_of_a_thread_in_order():
+    service = make_agent_service()
+    items = [("thread-a", "My favorite color is purple"), ("thread-b", "Hi"), ("thread-a", "What is my favorite color?")]
+
+    asyncio.run(service.chat_many(items))
+
+    state = asyncio.run(service.agent.aget_state({"configurable": {"thread_id": "thread-a"}}))
+    human = [m.content for m in state.values["messages"] if m.type == "human"]
+    assert human == ["My favorite color is purple", "What is my favorite color?"]
+
+
+def test_chat_many_deduplicates_searches(monkeypatch):
+    monkeypatch.setenv("AUTH_TOKEN", "test-token")
+    monkeypatch.setenv("SEARCH_CACHE_ENABLED", "false")
+
+    with StubSearchServer(latency=0.1) as server:
+        service = make_agent_service(server.url, search_query="creative blocks")
+        responses = asyncio.run(service.chat_many([(f"thread-{i}", "I'm stuck") for i in range(10)]))
+
+    assert all("(with knowledge)" in r for r in responses)
+    assert server.request_count == 1
+
+
+def test_chat_batch_endpoint(monkeypatch):
+    monkeypatch.setattr(main, "agent_service", make_agent_service())
+    client = TestClient(main.app)
+    items = [{"thread_id": f"thread-{i}", "message": f"Hello {i}"} for i in range(5)]
+
+    ordered = client.post("/chat/batch", json={"items": items})
+    assert ordered.status_code == 200
+    results = ordered.json()["results"]
+    assert [r["thread_id"] for r in results] == [f"thread-{i}" for i in range(5)]
+    assert results[3]["response"].endswith("Hello 3")
+
+    streamed = client.post("/chat/batch", json={"items": items, "stream": True})
+    assert streamed.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in streamed.text.splitlines()]
+    assert sorted(line["index"] for line in lines) == list(range(5))
+    assert all(line["response"].endswith(f"Hello {line['index']}") for line in lines)
+
+
+def test_chat_batch_rejects_oversized_batches(monkeypatch):
+    monkeypatch.setattr(main, "agent_service", make_agent_service())
+    monkeypatch.setattr(main, "CHAT_BATCH_MAX_ITEMS", 2)
+    client = TestClient(main.app)
+    items = [{"thread_id": f"thread-{i}", "message": "Hi"} for i in range(3)]
+
+    assert client.post("/chat/batch", json={"items": items}).status_code == 413
@@ -0,0 +1,177 @@
+import asyncio
+import uuid
+
+from langgraph.checkpoint.base import empty_checkpoint
+from langgraph.checkpoint.memory import MemorySaver
+
+from agent_service import AgentService
+from checkpoint_cache import CachingCheckpointer
+from tests.fakes import FakeChatModel, make_agent_service
+from tests.test_compaction import DATABASE_URL, count_rows, drop_tables, make_postgres_service, requires_postgres
+
+
+def test_cache_is_off_without_postgres():
+    service = make_agent_service()
+
+    assert service.checkpoint_cache is None
+    assert service.get_stats()["checkpoint_cache"] is None
+
+
+def test_cache_is_bounded_by_checkpoint_bytes():
+    # Writes don't touch the engine: only reads are checked against Postgres
+    cache = CachingCheckpointer(MemorySaver(), engine=None, max_bytes=10_000)
+
+    def put(thread_id: str, text: str) -> None:
+        checkpoint = empty_checkpoint()
+        checkpoint["channel_values"] = {"messages": text}
+        cache.put({"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}, checkpoint, {}, {})
+
+    for i in range(4):
+        put(f"thread-{i}", "x" * 3000)
+    stats = cache.get_stats()
+    assert stats["threads"] == 3 and stats["evictions"] == 1 and stats["bytes"] <= 10_000
+
+    # A thread's newer, larger checkpoint replaces its old one and pushes out the oldest thread
+    put("thread-3", "x" * 6000)
+    assert [thread_id for thread_id, _ in cache._entries] == ["thread-2", "thread-3"]
+
+    # Never cached: bigger than the whole cache
+    put("thread-big", "x" * 20_000)
+    assert ("thread-big", "") not in cache._entries
+    assert cache.get_stats()["bytes"] == sum(entry.size for entry in cache._entries.values())
+
+
+@requires_postgres
+def test_latest_checkpoint_is_served_from_memory():
+    table_name = f"checkpoints_{uuid.uuid4().hex[:8]}"
+
+    async def run():
+        engine, checkpointer, service = await make_postgres_service(table_name)
+        try:
+            for turn in range(3):
+                await service.achat(f"Turn {turn}", "thread-1")
+            state = await service.agent.aget_state({"configurable": {"thread_id": "thread-1"}})
+            return service.get_stats()["checkpoint_cache"], state
+        finally:
+            await drop_tables(engine, table_name)
+
+    stats, state = asyncio.run(run())
+
+    # Only the first turn's read misses; the thread was unknown
+    assert stats["misses"] == 1
+    assert stats["hits"] >= 3
+    assert stats["stale"] == 0
+    assert len(state.values["messages"]) == 6
+
+
+@requires_postgres
+def test_write_from_another_instance_is_not_served_stale():
+    table_name = f"checkpoints_{uuid.uuid4().hex[:8]}"
+
+    async def run():
+        from langchain_google_cloud_sql_pg import PostgresEngine, PostgresSaver
+
+        engine, checkpointer, first = await make_postgres_service(table_name)
+        # Another instance: its own engine and cache over the same tables
+        second_engine = PostgresEngine.from_engine_args(DATABASE_URL)
+        second = AgentService(
+            project_id="test-project",
+            search_service_url="http://127.0.0.1:9",
+            llm=FakeChatModel(),
+            checkpointer=await PostgresSaver.create(second_engine, table_name=table_name),
+            engine=second_engine,
+        )
+        try:
+            await first.achat("Hello from the first instance", "thread-1")
+            await second.achat("Hello from the second instance", "thread-1")
+            await first.achat("Back on the first instance", "thread-1")
+            state = await first.agent.aget_state({"configurable": {"thread_id": "thread-1"}})
+            return first.get_stats()["checkpoint_cache"], state
+        finally:
+            await second_engine.close()
+            await drop_tables(engine, table_name)
+
+    stats, state = asyncio.run(run())
+
+    assert stats["stale"] == 1
+    contents = [m.content for m in state.values["messages"]]
+    assert "Hello from the second instance" in contents
+    assert len(contents) == 6
+
+
+@requires_postgres
+def test_pending_write_from_another_instance_is_not_served_stale():
+    table_name = f"checkpoints_{uuid.uuid4().hex[:8]}"
+
+    async def run():
+        from langchain_google_cloud_sql_pg import PostgresEngine, PostgresSaver
+
+        engine, checkpointer, service = await make_postgres_service(table_name)
+        other_engine = PostgresEngine.from_engine_args(DATABASE_URL)
+        other = await PostgresSaver.create(other_engine, table_name=table_name)
+        cache = service.checkpoint_cache
+        thread = {"configurable": {"thread_id": "thread-1", "checkpoint_ns": ""}}
+        try:
+            await service.achat("Hello", "thread-1")
+            latest = await cache.aget_tuple(thread)
+            await other.aput_writes(latest.config, [("messages", "written elsewhere")], "task-1")
+            return latest, await cache.aget_tuple(thread), cache.get_stats()
+        finally:
+            await other_engine.close()
+            await drop_tables(engine, table_name)
+
+    before, after, stats = asyncio.run(run())
+
+    assert after.config == before.config
+    assert before.pending_writes == []
+    assert after.pending_writes == [("task-1", "messages", "written elsewhere")]
+    assert stats["stale"] == 1
+
+
+@requires_postgres
+def test_coalesced_writes_store_one_checkpoint_per_turn(monkeypatch):
+    monkeypatch.setenv("CHECKPOINT_COALESCE_WRITES", "true")
+    table_name = f"checkpoints_{uuid.uuid4().hex[:8]}"
+
+    async def run():
+        engine, checkpointer, service = await make_postgres_service(table_name)
+        try:
+            for turn in range(3):
+                await service.achat(f"Turn {turn}", "thread-1")
+            state = await service.agent.aget_state({"configurable": {"thread_id": "thread-1"}})
+            return await count_rows(engine, table_name), await count_rows(engine, f"{table_name}_writes"), state
+        finally:
+            await drop_tables(engine, table_name)
+
+    checkpoints, writes, state = asyncio.run(run())
+
+    assert checkpoints == 3
+    assert writes == 0
+    assert len(state.values["messages"]) == 6
+
+
+@requires_postgres
+def test_least_recently_used_threads_are_evicted():
+    table_name = f"checkpoints_{uuid.uuid4().hex[:8]}"
+
+    async def run():
+        engine, checkpointer, service = await make_postgres_service(table_name)
+        cache = CachingCheckpointer(checkpointer, engine, table_name=table_name, max_threads=2)
+        try:
+            for thread_id in ["thread-1", "thread-2", "thread-3"]:
+                await service.achat("Hello!", thread_id)
+            for thread_id in ["thread-1", "thread-2", "thread-3"]:
+                await cache.aget_tuple({"configurable": {"thread_id": thread_id}})
+            # thread-1 was evicted when thread-3 was read
+            await cache.aget_tuple({"configurable": {"thread_id": "thread-1"}})
+            await cache.aget_tuple({"configurable": {"thread_id": "thread-3"}})
+            return cache.get_stats()
+        finally:
+            await drop_tables(engine, table_name)
+
+    stats = asyncio.run(run())
+
+    assert stats["threads"] == 2
+    assert stats["evictions"] == 2
+    assert stats["misses"] == 4
+    assert stats["hits"] == 1
@@ -0,0 +1,185 @@
+import asyncio
+import time
+import uuid
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langgraph.checkpoint.base import empty_checkpoint
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+from agent_service import AgentService
+from checkpoint_serde import (
+    COMPRESSED_TYPE, PAYLOAD_REF, CompactSerializer, DedupingCheckpointer, PayloadStore, PostgresPayloadStore,
+)
+from tests.fakes import FakeChatModel, StubSearchServer
+from tests.test_compaction import DATABASE_URL, count_rows, drop_tables, make_postgres_service, requires_postgres
+
+
+def make_checkpoint(turns: int) -> dict:
+    passages = [f"From book-{i % 3} (page {i}): " + "A passage about creative practice. " * 20 for i in range(6)]
+    messages = []
+    for turn in range(turns):
+        call_id = f"call-{turn}"
+        messages += [
+            HumanMessage(content=f"Question {turn}", id=f"human-{turn}"),
+            AIMessage(content="", id=f"ai-call-{turn}", tool_calls=[
+                {"name": "search_knowledge", "args": {"query": f"question {turn}"}, "id": call_id}
+            ]),
+            # Later searches return passages earlier ones did
+            ToolMessage(content="\n\n".join(passages[turn % 4:turn % 4 + 3]), tool_call_id=call_id, id=f"tool-{turn}"),
+            AIMessage(content=f"Answer {turn}", id=f"ai-{turn}"),
+        ]
+    checkpoint = empty_checkpoint()
+    checkpoint["channel_values"] = {"messages": messages}
+    return checkpoint
+
+
+def test_round_trip_compresses_repeated_passages():
+    serde = CompactSerializer()
+    checkpoint = make_checkpoint(10)
+
+    type_, data = serde.dumps_typed(checkpoint)
+    restored = serde.loads_typed((type_, data))
+
+    assert type_ == COMPRESSED_TYPE
+    assert restored["channel_values"]["messages"] == checkpoint["channel_values"]["messages"]
+    assert len(data) < len(JsonPlusSerializer().dumps_typed(checkpoint)[1]) / 5
+
+
+def test_small_values_are_left_uncompressed():
+    serde = CompactSerializer(min_size=512)
+
+    assert serde.dumps_typed({"step": 1})[0] == "msgpack"
+    assert serde.dumps_typed(None) == ("null", b"")
+
+
+def test_reads_rows_written_by_the_default_serializer():
+    checkpoint = make_checkpoint(3)
+    row = JsonPlusSerializer().dumps_typed(checkpoint)
+
+    restored = CompactSerializer().loads_typed(row)
+
+    assert restored["channel_values"]["messages"] == checkpoint["channel_values"]["messages"]
+
+
+@requires_postgres
+def test_thread_continues_after_switching_serializer():
+    table_name = f"checkpoints_{uuid.uuid4().hex[:8]}"
+
+    async def run():
+        from langchain_google_cloud_sql_pg import PostgresSaver
+
+        engine, checkpointer, service = await make_postgres_service(table_name)
+        try:
+            await service.achat("Hello before the upgrade", "thread-1")
+            upgraded = AgentService(
+                project_id="test-project",
+                search_service_url="http://127.0.0.1:9",
+                llm=FakeChatModel(),
+                checkpointer=await PostgresSaver.create(engine, table_name=table_name, serde=CompactSerializer()),
+                engine=engine,
+            )
+            await upgraded.achat("Hello after the upgrade", "thread-1")
+            return await upgraded.agent.aget_state({"configurable": {"thread_id": "thread-1"}})
+        finally:
+            await drop_tables(engine, table_name)
+
+    state = asyncio.run(run())
+
+    contents = [m.content for m in state.values["messages"]]
+    assert contents[0] == "Hello before the upgrade"
+    assert "Hello after the upgrade" in contents
+    assert len(contents) == 4
+
+
+def put(saver, checkpoint: dict, parent_id=None) -> dict:
+    config = {"configurable": {"thread_id": "thread-1", "checkpoint_ns": "", "checkpoint_id": parent_id}}
+    checkpoint["channel_versions"] = {"messages": checkpoint["id"]}
+    return saver.put(config, checkpoint, {}, {"messages": checkpoint["id"]})
+
+
+def test_repeated_tool_results_are_stored_once_per_thread():
+    store = PayloadStore()
+    saver = DedupingCheckpointer(MemorySaver(), store, min_size=512)
+    first = make_checkpoint(1)
+    tool_message = first["channel_values"]["messages"][2]
+
+    config = put(saver, first)
+    written = store.get_stats()["bytes_written"]
+    # The next step's checkpoint carries the same tool result
+    second = empty_checkpoint()
+    second["channel_values"] = {"messages": first["channel_values"]["messages"] + [
+        HumanMessage(content="Thanks", id="human-thanks"), AIMessage(content="Any time", id="ai-thanks"),
+    ]}
+    config = put(saver, second, config["configurable"]["checkpoint_id"])
+
+    assert written == len(tool_message.content.encode())
+    assert store.get_stats() == {"payloads_written": 1, "bytes_written": written, "deduplicated": 1}
+    # The saver below holds only the reference; reads get the content back
+    stored = saver.inner.get_tuple(config).checkpoint["channel_values"]["messages"]
+    assert stored[2].content.startswith(PAYLOAD_REF) and len(stored[2].content) < 100
+    assert saver.get_tuple(config).checkpoint["channel_values"]["messages"] == second["channel_values"]["messages"]
+    assert [saved.checkpoint["channel_values"]["messages"][2] for saved in saver.list(None)] == [tool_message] * 2
+
+
+def test_graph_checkpoints_reference_tool_results(monkeypatch):
+    monkeypatch.setenv("AUTH_TOKEN", "test-token")
+    monkeypatch.setenv("CONTEXT_PACKING_ENABLED", "false")
+    hits = [{"book_id": "deep-work", "page_number": i, "content": "Focus compounds over years. " * 10} for i in range(3)]
+
+    with StubSearchServer(results=hits) as server:
+        service = AgentService(
+            project_id="test-project",
+            search_service_url=server.url,
+            llm=FakeChatModel(search_query="{message}"),
+            checkpointer=DedupingCheckpointer(MemorySaver(), PayloadStore()),
+        )
+        asyncio.run(service.achat("How do I focus?", "thread-1"))
+        state = asyncio.run(service.agent.aget_state({"configurable": {"thread_id": "thread-1"}}))
+
+    tool_results = [m.content for m in state.values["messages"] if isinstance(m, ToolMessage)]
+    assert len(tool_results) == 1 and "Focus compounds over years." in tool_results[0]
+    # Written by the tools step and again by the answering step, stored once
+    assert service._checkpointer.get_stats()["payloads_written"] == 1
+    assert service._checkpointer.get_stats()["deduplicated"] >= 1
+
+
+@requires_postgres
+def test_payloads_are_shared_through_postgres_and_expire_with_the_thread():
+    from compaction import CheckpointCompactor
+
+    table_name = f"checkpoints_{uuid.uuid4().hex[:8]}"
+    payloads_table = f"payloads_{uuid.uuid4().hex[:8]}"
+
+    async def run():
+        from langchain_google_cloud_sql_pg import PostgresEngine, PostgresSaver
+
+        engine = PostgresEngine.from_engine_args(DATABASE_URL)
+        await engine.ainit_checkpoint_table(table_name=table_name)
+        store = PostgresPayloadStore(engine, table_name=payloads_table)
+        await store.ainit_table()
+        try:
+            inner = await PostgresSaver.create(engine, table_name=table_name)
+            saver = DedupingCheckpointer(inner, store)
+            first = make_checkpoint(2)
+            config = {"configurable": {"thread_id": "thread-1", "checkpoint_ns": ""}}
+            config = await saver.aput(config, first, {}, {})
+            config = await saver.aput(config, make_checkpoint(2), {}, {})
+            written = store.get_stats()
+
+            # Another instance, with nothing cached, reads the payloads from the table
+            other = DedupingCheckpointer(inner, PostgresPayloadStore(engine, table_name=payloads_table))
+            saved = await other.aget_tuple({"configurable": {"thread_id": "thread-1", "checkpoint_ns": ""}})
+
+            compactor = CheckpointCompactor(engine, table_name=table_name, thread_ttl=1.0,
+                                            payloads_table_name=payloads_table)
+            await compactor.acompact(now=time.time() + 3600)
+            return first, written, saved, await count_rows(engine, payloads_table)
+        finally:
+            await drop_tables(engine, table_name, payloads_table)
+
+    first, written, saved, payloads_left = asyncio.run(run())
+
+    assert written["payloads_written"] == 2 and written["deduplicated"] == 2
+    assert saved.checkpoint["channel_values"]["messages"] == first["channel_values"]["messages"]
+    assert payloads_left == 0
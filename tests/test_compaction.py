@@ -0,0 +1,150 @@
+import asyncio
+import os
+import time
+import uuid
+
+import pytest
+from langgraph.checkpoint.base.id import uuid6
+
+from agent_service import AgentService
+from compaction import CheckpointCompactor, checkpoint_id_at
+from tests.fakes import FakeChatModel
+
+DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+requires_postgres = pytest.mark.skipif(
+    not DATABASE_URL, reason="set TEST_DATABASE_URL to a postgresql+asyncpg:// URL"
+)
+
+
+def test_checkpoint_id_at_orders_with_langgraph_ids():
+    before = checkpoint_id_at(time.time() - 1)
+    checkpoint_id = str(uuid6(clock_seq=-1))
+    after = checkpoint_id_at(time.time() + 1)
+
+    assert before < checkpoint_id < after
+
+
+async def count_rows(engine, table_name: str) -> int:
+    from sqlalchemy import text
+
+    async def count():
+        async with engine._pool.connect() as conn:
+            return (await conn.execute(text(f'SELECT count(*) FROM "{table_name}"'))).scalar()
+
+    return await engine._run_as_async(count())
+
+
+async def make_postgres_service(table_name: str):
+    from langchain_google_cloud_sql_pg import PostgresEngine, PostgresSaver
+
+    engine = PostgresEngine.from_engine_args(DATABASE_URL)
+    await engine.ainit_checkpoint_table(table_name=table_name)
+    checkpointer = await PostgresSaver.create(engine, table_name=table_name)
+    service = AgentService(
+        project_id="test-project",
+        search_service_url="http://127.0.0.1:9",
+        llm=FakeChatModel(),
+        checkpointer=checkpointer,
+        engine=engine,
+    )
+    return engine, checkpointer, service
+
+
+async def drop_tables(engine, table_name: str, *other_tables: str) -> None:
+    from sqlalchemy import text
+
+    tables = ", ".join(f'"{name}"' for name in (table_name, f"{table_name}_writes", *other_tables))
+
+    async def drop():
+        async with engine._pool.connect() as conn:
+            await conn.execute(text(f"DROP TABLE IF EXISTS {tables}"))
+            await conn.commit()
+
+    await engine._run_as_async(drop())
+    await engine.close()
+
+
+@requires_postgres
+def test_compaction_keeps_tables_and_reads_bounded():
+    table_name = f"checkpoints_{uuid.uuid4().hex[:8]}"
+    threads = [f"thread-{i}" for i in range(20)]
+
+    async def run():
+        engine, checkpointer, service = await make_postgres_service(table_name)
+        compactor = CheckpointCompactor(engine, table_name=table_name, keep_last=2, batch_size=7)
+        sizes, read_times = [], []
+        try:
+            for turn in range(5):
+                await asyncio.gather(*[service.achat(f"Turn {turn} from {t}", t) for t in threads])
+                await compactor.acompact()
+                sizes.append(await count_rows(engine, table_name))
+
+                started_at = time.perf_counter()
+                for t in threads:
+                    await checkpointer.aget_tuple({"configurable": {"thread_id": t}})
+                read_times.append(time.perf_counter() - started_at)
+
+            # The latest checkpoint still carries the whole conversation
+            state = await service.agent.aget_state({"configurable": {"thread_id": threads[0]}})
+            contents = [m.content for m in state.values["messages"]]
+            return sizes, read_times, contents
+        finally:
+            await drop_tables(engine, table_name)
+
+    sizes, read_times, contents = asyncio.run(run())
+
+    assert sizes == [len(threads) * 2] * 5
+    assert max(read_times) < 5 * min(read_times) + 0.05
+    assert any("Turn 0" in c for c in contents)
+    assert any("Turn 4" in c for c in contents)
+
+
+@requires_postgres
+def test_compaction_expires_idle_threads():
+    table_name = f"checkpoints_{uuid.uuid4().hex[:8]}"
+
+    async def run():
+        engine, checkpointer, service = await make_postgres_service(table_name)
+        compactor = CheckpointCompactor(engine, table_name=table_name, thread_ttl=3600)
+        try:
+            await service.achat("Hello", "idle-thread")
+            kept = await compactor.acompact()
+            expired = await compactor.acompact(now=time.time() + 7200)
+            remaining = await count_rows(engine, table_name)
+            return kept, expired, remaining
+        finally:
+            await drop_tables(engine, table_name)
+
+    kept, expired, remaining = asyncio.run(run())
+
+    assert kept["threads_expired"] == 0
+    assert expired["threads_expired"] == 1
+    assert remaining == 0
+
+
+@requires_postgres
+def test_compaction_keeps_threads_active_since_they_were_listed():
+    table_name = f"checkpoints_{uuid.uuid4().hex[:8]}"
+
+    async def run():
+        engine, checkpointer, service = await make_postgres_service(table_name)
+        compactor = CheckpointCompactor(engine, table_name=table_name, thread_ttl=3600)
+        list_threads = compactor._next_threads
+        # Lists every thread, as if the new one had been idle until just after the listing
+        compactor._next_threads = lambda conn, after, idle_before=None: list_threads(conn, after)
+        try:
+            await service.achat("Hello", "idle-thread")
+            await asyncio.sleep(0.05)
+            idle_until = time.time()
+            await asyncio.sleep(0.05)
+            await service.achat("Hello", "active-thread")
+            stats = await compactor.acompact(now=idle_until + 3600)
+            state = await service.agent.aget_state({"configurable": {"thread_id": "active-thread"}})
+            return stats, state.values["messages"]
+        finally:
+            await drop_tables(engine, table_name)
+
+    stats, messages = asyncio.run(run())
+
+    assert stats["threads_expired"] == 1
+    assert [m.content for m in messages][0] == "Hello"
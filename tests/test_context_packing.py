@@ -0,0 +1,93 @@
+import asyncio
+
+from langchain_core.messages import HumanMessage, ToolMessage
+
+from context_packing import BUDGET_EXHAUSTED_MESSAGE, ContextPacker, count_tokens, merge_passages
+from tests.fakes import StubSearchServer, make_agent_service
+
+FILLER = "The chapter returns to this idea several times with a different story each time. "
+
+HITS = [
+    {"book_id": "deep-work", "page_number": 40,
+     "content": FILLER * 3 + "Focus is a skill that compounds over years. " + FILLER * 3},
+    # An overlapping chunk of the same page
+    {"book_id": "deep-work", "page_number": 40,
+     "content": "Focus is a skill that compounds over years. Boredom tolerance has to be practiced too."},
+    {"book_id": "deep-work", "page_number": 41,
+     "content": "Boredom tolerance has to be practiced too. Schedule every minute of your day."},
+    {"book_id": "war-of-art", "page_number": 12,
+     "content": FILLER * 4 + "Creative blocks are resistance, and resistance is beaten by routine."},
+]
+
+
+def search_results(count: int) -> list:
+    return [
+        {"book_id": f"book-{i}", "page_number": i + 1,
+         "content": FILLER * 6 + f"Creative blocks yield to habit number {i}. " + FILLER * 6}
+        for i in range(count)
+    ]
+
+
+def test_overlapping_passages_of_a_book_are_merged():
+    passages = merge_passages(HITS)
+
+    assert [(p.book_id, p.pages) for p in passages] == [("deep-work", [40, 41]), ("war-of-art", [12])]
+    assert passages[0].sentences.count("Boredom tolerance has to be practiced too.") == 1
+    assert passages[0].source() == "From deep-work (pages 40, 41)"
+
+
+def test_most_relevant_sentences_fit_the_call_budget():
+    packer = ContextPacker(call_budget=60)
+
+    text = packer.format(["creative blocks", "focus skill"], HITS)
+
+    assert count_tokens(text) <= 60
+    assert "Focus is a skill that compounds over years." in text
+    assert "Creative blocks are resistance, and resistance is beaten by routine." in text
+    assert text.startswith("From deep-work (pages 40, 41): … Focus")
+    assert ContextPacker.reference(text) == (
+        "[Knowledge search results from an earlier turn, text omitted: deep-work, pages 40, 41; war-of-art, page 12]"
+    )
+
+
+def test_turn_budget_is_shared_by_the_turns_search_calls(monkeypatch):
+    monkeypatch.setenv("AUTH_TOKEN", "test-token")
+    monkeypatch.setenv("CONTEXT_CALL_TOKENS", "200")
+    monkeypatch.setenv("CONTEXT_TURN_TOKENS", "300")
+
+    with StubSearchServer(results=search_results(5)) as server:
+        service = make_agent_service(
+            server.url, search_queries=["creative blocks", "habits", "routine"], batch_searches=False
+        )
+        asyncio.run(service.achat("How do I get unstuck?", "thread-budget"))
+
+    state = asyncio.run(service.agent.aget_state({"configurable": {"thread_id": "thread-budget"}}))
+    outputs = [m.content for m in state.values["messages"] if isinstance(m, ToolMessage)]
+    assert len(outputs) == 3
+    assert count_tokens(outputs[0]) <= 200 and "Creative blocks yield to habit number 0." in outputs[0]
+    assert count_tokens(outputs[0]) + count_tokens(outputs[1]) <= 300
+    assert outputs[2] == BUDGET_EXHAUSTED_MESSAGE
+    assert service.get_stats()["context_packing"]["budget_exhausted"] == 1
+
+
+def test_finished_turns_keep_only_a_reference(monkeypatch):
+    monkeypatch.setenv("AUTH_TOKEN", "test-token")
+
+    with StubSearchServer(results=search_results(3)) as server:
+        service = make_agent_service(server.url, search_query="{message}")
+        asyncio.run(service.achat("Tell me about creative blocks", "thread-ref"))
+        asyncio.run(service.achat("Thanks, and habits?", "thread-ref"))
+
+    state = asyncio.run(service.agent.aget_state({"configurable": {"thread_id": "thread-ref"}}))
+    first, second = [m for m in state.values["messages"] if isinstance(m, ToolMessage)]
+    assert first.content.startswith("[Knowledge search results from an earlier turn, text omitted: book-0, page 1")
+    assert second.content.startswith("From book-0 (page 1)")
+
+    # The second turn's model calls never saw the first turn's passages
+    second_turn = [
+        call for call in service.llm.calls
+        if any(isinstance(m, HumanMessage) and m.content == "Thanks, and habits?" for m in call)
+    ]
+    sent = [m.content for call in second_turn for m in call
+            if isinstance(m, ToolMessage) and m.tool_call_id == first.tool_call_id]
+    assert sent and all(content == first.content for content in sent)
@@ -0,0 +1,88 @@
+import threading
+import time
+
+import pytest
+from sqlalchemy import create_engine, exc, text
+from sqlalchemy.pool import QueuePool
+
+from db_pool import InstrumentedPoolMixin, get_pool_args, get_pool_stats
+
+
+class InstrumentedQueuePool(InstrumentedPoolMixin, QueuePool):
+    pass
+
+
+def make_engine(tmp_path, **pool_args):
+    return create_engine(f"sqlite:///{tmp_path / 'pool.db'}", poolclass=InstrumentedQueuePool, **pool_args)
+
+
+def test_pool_args_from_env(monkeypatch):
+    monkeypatch.setenv("POSTGRES_POOL_SIZE", "12")
+    monkeypatch.setenv("POSTGRES_POOL_MAX_OVERFLOW", "3")
+    monkeypatch.setenv("POSTGRES_POOL_PRE_PING", "false")
+
+    args = get_pool_args()
+
+    assert args["pool_size"] == 12
+    assert args["max_overflow"] == 3
+    assert args["pool_pre_ping"] is False
+    assert args["pool_timeout"] == 30.0
+
+
+def test_pool_budget_is_split_between_workers(monkeypatch):
+    monkeypatch.setenv("POSTGRES_POOL_SIZE", "10")
+    monkeypatch.setenv("POSTGRES_POOL_MAX_OVERFLOW", "10")
+    monkeypatch.setenv("WORKERS", "4")
+
+    args = get_pool_args()
+
+    assert args["pool_size"] == 3
+    assert args["max_overflow"] == 3
+
+
+def test_pool_stats_show_waiting_and_acquire_latency(tmp_path):
+    engine = make_engine(tmp_path, pool_size=1, max_overflow=0, pool_timeout=5)
+    holding = threading.Event()
+
+    def hold():
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+            holding.set()
+            time.sleep(0.2)
+
+    def query():
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+
+    holder = threading.Thread(target=hold)
+    holder.start()
+    holding.wait()
+    waiters = [threading.Thread(target=query) for _ in range(3)]
+    for waiter in waiters:
+        waiter.start()
+    time.sleep(0.05)
+
+    during = get_pool_stats(engine)
+    assert during["checked_out"] == 1
+    assert during["waiting"] == 3
+
+    holder.join()
+    for waiter in waiters:
+        waiter.join()
+
+    after = get_pool_stats(engine)
+    assert after["waiting"] == 0
+    assert after["acquired"] == 4
+    assert after["acquire_ms_max"] >= 100
+
+
+def test_pool_stats_count_timeouts(tmp_path):
+    engine = make_engine(tmp_path, pool_size=1, max_overflow=0, pool_timeout=0.05)
+
+    with engine.connect():
+        with pytest.raises(exc.TimeoutError):
+            engine.connect()
+
+    stats = get_pool_stats(engine)
+    assert stats["timeouts"] == 1
+    assert stats["waiting"] == 0
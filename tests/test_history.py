@@ -0,0 +1,103 @@
+import asyncio
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+from langchain_core.messages.utils import count_tokens_approximately
+
+from history import HistoryManager, split_turns
+from tests.fakes import FakeChatModel, StubSearchServer, make_agent_service
+
+
+def make_turns(count: int, tool_output: str = ""):
+    messages = []
+    for i in range(count):
+        messages.append(HumanMessage(content=f"Question {i} " + "detail " * 20, id=f"h{i}"))
+        if tool_output:
+            messages.append(AIMessage(content="", id=f"c{i}", tool_calls=[
+                {"name": "search_knowledge", "args": {"query": "q"}, "id": f"call{i}"}
+            ]))
+            messages.append(ToolMessage(content=tool_output, tool_call_id=f"call{i}", id=f"t{i}"))
+        messages.append(AIMessage(content=f"Answer {i} " + "insight " * 20, id=f"a{i}"))
+    return messages
+
+
+def test_split_turns_keeps_tool_results_with_calls():
+    turns = split_turns(make_turns(3, tool_output="result"))
+    assert len(turns) == 3
+    assert [m.type for m in turns[0]] == ["human", "ai", "tool", "ai"]
+
+
+def test_short_history_is_sent_unchanged():
+    manager = HistoryManager(FakeChatModel())
+    messages = make_turns(2)
+
+    update = manager({"messages": messages})
+
+    assert update["llm_input_messages"] == messages
+    assert "summary" not in update
+
+
+def test_old_tool_outputs_are_trimmed():
+    manager = HistoryManager(FakeChatModel(), keep_turns=1, max_history_tokens=100_000, tool_output_max_tokens=10)
+    messages = make_turns(3, tool_output="From deep-work (page 40): " + "focus " * 200)
+
+    update = manager({"messages": messages})
+
+    trimmed = [m for m in update["messages"] if isinstance(m, ToolMessage)]
+    assert {m.id for m in trimmed} == {"t0", "t1"}
+    assert all(m.content.endswith("[truncated]") for m in trimmed)
+    # The current turn's tool output is left alone
+    assert update["llm_input_messages"][-2].content == messages[-2].content
+
+
+def test_long_history_is_folded_into_summary():
+    manager = HistoryManager(FakeChatModel(answer="The user asked many questions."), keep_turns=2, max_history_tokens=300)
+    messages = make_turns(10)
+
+    update = asyncio.run(manager.acall({"messages": messages, "summary": ""}))
+
+    removed = {m.id for m in update["messages"]}
+    assert removed == {m.id for m in messages[:16]}
+    assert update["summary"].startswith("The user asked many questions.")
+    llm_input = update["llm_input_messages"]
+    assert isinstance(llm_input[0], SystemMessage)
+    assert "Summary of the earlier conversation" in llm_input[0].content
+    assert llm_input[1:] == messages[16:]
+
+
+def test_failed_summary_keeps_state():
+    class BrokenModel(FakeChatModel):
+        def _generate(self, *args, **kwargs):
+            raise RuntimeError("vertex unavailable")
+
+    manager = HistoryManager(BrokenModel(), keep_turns=2, max_history_tokens=300)
+    messages = make_turns(10)
+
+    update = manager({"messages": messages})
+
+    assert "messages" not in update
+    assert update["llm_input_messages"] == messages[16:]
+
+
+def test_model_input_stays_bounded_over_long_thread(monkeypatch):
+    monkeypatch.setenv("AUTH_TOKEN", "test-token")
+    monkeypatch.setenv("HISTORY_MAX_TOKENS", "800")
+    monkeypatch.setenv("HISTORY_KEEP_TURNS", "2")
+
+    with StubSearchServer() as server:
+        service = make_agent_service(server.url, search_query="creative blocks")
+
+        async def conversation():
+            sizes = []
+            for i in range(30):
+                await service.achat(f"Turn {i}: " + "tell me more " * 10, "thread-long")
+                state = await service.agent.aget_state({"configurable": {"thread_id": "thread-long"}})
+                sizes.append(count_tokens_approximately(state.values["llm_input_messages"]))
+            return sizes
+
+        sizes = asyncio.run(conversation())
+
+    state = service._checkpointer.get_tuple({"configurable": {"thread_id": "thread-long"}}).checkpoint
+    assert state["channel_values"]["summary"]
+    assert len(state["channel_values"]["messages"]) < 20
+    # History plus the summary message never grows past the budget and the summary cap
+    assert max(sizes) < 800 + 500 + 20
@@ -0,0 +1,131 @@
+import asyncio
+import os
+import random
+
+import numpy as np
+
+from knowledge_index import HashingEmbedder, KnowledgeIndex
+from tests.fakes import StubSearchServer, passage_query, synthetic_corpus
+from tool_search import SearchClient, create_search_tool
+
+CORPUS = synthetic_corpus(200, seed=1)
+
+
+def test_top_k_matches_brute_force():
+    embed = HashingEmbedder()
+    index = KnowledgeIndex(embed=embed, min_score=0.0, load_rows=lambda: CORPUS)
+    index.refresh()
+    weights = embed.idf([p["content"] for p in CORPUS])
+    matrix = embed([p["content"] for p in CORPUS], weights)
+    rng = random.Random(2)
+    found = 0
+
+    for passage in rng.sample(CORPUS, 20):
+        query = passage_query(passage, rng)
+        query_vector = embed([query], weights)[0]
+        scores = [float(np.dot(row, query_vector)) for row in matrix]
+        expected = sorted(scores, reverse=True)[:3]
+
+        results = index.search(query, limit=3)
+        assert np.allclose([scores[CORPUS.index(hit)] for hit in results], expected, atol=1e-5)
+        found += results[0] == passage
+
+    assert found >= 18
+
+
+def test_low_confidence_falls_back():
+    index = KnowledgeIndex(load_rows=lambda: CORPUS)
+    assert index.search("creative blocks") is None
+
+    index.refresh()
+    rng = random.Random(3)
+
+    assert index.search(passage_query(CORPUS[5], rng)) is not None
+    assert index.search("how do I get past creative blocks") is None
+    stats = index.get_stats()
+    assert stats["local_hits"] == 1 and stats["low_confidence"] == 1
+
+
+def test_only_confident_passages_are_returned():
+    embed = HashingEmbedder()
+    index = KnowledgeIndex(embed=embed, min_score=0.9, load_rows=lambda: CORPUS)
+    index.refresh()
+    weights = embed.idf([p["content"] for p in CORPUS])
+    rng = random.Random(5)
+    searches = [(query, index.search(query, limit=3)) for query in (passage_query(p, rng) for p in CORPUS[:20])]
+    answered = [(query, results) for query, results in searches if results is not None]
+
+    assert answered
+    for query, results in answered:
+        query_vector = embed([query], weights)[0]
+        passage_vectors = embed([hit["content"] for hit in results], weights)
+        assert all(HashingEmbedder.confidence(query_vector, v) >= 0.9 for v in passage_vectors)
+    # A few words of one passage rarely all appear in two others
+    assert sum(len(results) for _, results in answered) < 3 * len(answered)
+
+
+def test_most_hit_passages_are_answered_locally(monkeypatch):
+    monkeypatch.setenv("AUTH_TOKEN", "test-token")
+    rng = random.Random(4)
+    passage = CORPUS[7]
+    query = passage_query(passage, rng)
+    index = KnowledgeIndex(refresh_interval=3600)
+
+    with StubSearchServer(results=[passage, CORPUS[8]]) as server:
+        tool = create_search_tool(server.url, SearchClient(server.url), knowledge_index=index)
+        remote = asyncio.run(tool.ainvoke({"query": query}))
+        index.refresh()
+        local = asyncio.run(tool.ainvoke({"query": query}))
+        sync_local = tool.invoke({"query": query})
+        # Nothing in the snapshot is like this one: the service answers
+        asyncio.run(tool.ainvoke({"query": "an unrelated question"}))
+
+    assert server.request_count == 2
+    assert passage["content"] in remote
+    assert local.startswith(f"From {passage['book_id']} (page {passage['page_number']})")
+    assert sync_local == local
+    assert index.get_stats()["passages"] == 2
+
+
+def test_snapshot_is_shared_through_path(tmp_path):
+    path = str(tmp_path / "index")
+    writer = KnowledgeIndex(embed=HashingEmbedder(64), load_rows=lambda: CORPUS[:8], path=path)
+    writer.refresh()
+    writer.refresh()
+    writer.refresh()
+
+    reader = KnowledgeIndex(embed=HashingEmbedder(64), load_rows=lambda: [], path=path)
+
+    assert isinstance(reader._snapshot.matrix, np.memmap)
+    assert reader._snapshot.version == writer._snapshot.version
+    # The current snapshot and the one before it
+    assert len([n for n in os.listdir(path) if n != "CURRENT"]) == 2
+
+
+def test_snapshot_of_another_embedder_is_not_loaded(tmp_path):
+    path = str(tmp_path / "index")
+    KnowledgeIndex(embed=HashingEmbedder(64), load_rows=lambda: CORPUS[:8], path=path).refresh()
+
+    reader = KnowledgeIndex(load_rows=lambda: CORPUS, path=path)
+    assert reader._snapshot is None
+
+    # It builds its own instead; a precomputed embedding column doesn't replace its embedder
+    rows = [dict(p, embedding=[1.0] * 8) for p in CORPUS]
+    reader.load_rows = lambda: rows
+    reader.refresh()
+    assert reader._snapshot.matrix.shape == (len(CORPUS), 1024)
+    assert reader.get_stats()["embedder"] == "hashing-1024"
+    assert reader.search(passage_query(CORPUS[5], random.Random(3))) is not None
+
+
+def test_background_refresh_when_due():
+    index = KnowledgeIndex(min_score=0.0, refresh_interval=0.0, load_rows=lambda: CORPUS)
+
+    assert index.search("anything") is None
+    for _ in range(100):
+        if index.get_stats()["passages"]:
+            break
+        asyncio.run(asyncio.sleep(0.01))
+
+    assert index.get_stats()["passages"] == len(CORPUS)
+    assert index.search("anything") is not None
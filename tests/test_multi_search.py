@@ -0,0 +1,92 @@
+import asyncio
+import time
+
+from resilience import turn_deadline, turn_time_left
+from tests.fakes import StubSearchServer, make_agent_service
+from tool_search import SearchClient, collect_queries, create_search_tool, merge_results
+
+
+def hits_for(query: str) -> list:
+    shared = {"book_id": "deep-work", "page_number": 40, "content": "Focus is a skill that compounds."}
+    own = {"book_id": f"book-{query}", "page_number": 1, "content": f"About {query}."}
+    return [own, shared]
+
+
+def test_merge_results_dedups_and_ranks_agreement_first():
+    shared = {"book_id": "deep-work", "page_number": 40, "content": "Focus"}
+    a = {"book_id": "a", "page_number": 1, "content": "A"}
+    b = {"book_id": "b", "page_number": 2, "content": "B"}
+
+    merged = merge_results([[a, shared], [b, shared]], max_results=5)
+
+    assert merged == [shared, a, b]
+    assert merge_results([[a, shared], [b, shared]], max_results=2) == [shared, a]
+
+
+def test_collect_queries_dedups_only_equivalent_queries():
+    queries = collect_queries("Что такое цифровой суверенитет", ["创意障碍", "リーダーシップ", "What is it?", "创意障碍"], 5)
+    assert queries == ["Что такое цифровой суверенитет", "创意障碍", "リーダーシップ", "What is it?"]
+
+    assert collect_queries("creative blocks", ["The creative blocks", "", "  ", "habits"], 5) == [
+        "creative blocks", "habits"
+    ]
+
+
+def test_async_tool_fans_out_queries(monkeypatch):
+    monkeypatch.setenv("AUTH_TOKEN", "test-token")
+
+    with StubSearchServer(latency=0.2, results=hits_for) as server:
+        tool = create_search_tool(server.url)
+        start = time.perf_counter()
+        result = asyncio.run(tool.ainvoke({"queries": ["focus", "habits", "Focus"]}))
+        elapsed = time.perf_counter() - start
+
+    assert sorted(server.queries) == ["focus", "habits"]
+    assert elapsed < 0.35
+    assert result.count("From deep-work (page 40)") == 1
+    assert result.index("deep-work") < result.index("book-focus")
+
+
+def test_sync_tool_fans_out_queries(monkeypatch):
+    monkeypatch.setenv("AUTH_TOKEN", "test-token")
+
+    with StubSearchServer(latency=0.2, results=hits_for) as server:
+        tool = create_search_tool(server.url)
+        start = time.perf_counter()
+        result = tool.invoke({"query": "focus", "queries": ["habits", "rest"]})
+        elapsed = time.perf_counter() - start
+
+    assert sorted(server.queries) == ["focus", "habits", "rest"]
+    assert elapsed < 0.5
+    assert result.count("From deep-work (page 40)") == 1
+
+
+def test_sync_fan_out_keeps_the_turns_deadline(monkeypatch):
+    monkeypatch.setenv("AUTH_TOKEN", "test-token")
+    time_left = []
+    search = SearchClient.search
+
+    def timed_search(self, query, limit=3):
+        time_left.append(turn_time_left())
+        return search(self, query, limit)
+
+    monkeypatch.setattr(SearchClient, "search", timed_search)
+    with StubSearchServer(results=hits_for) as server:
+        tool = create_search_tool(server.url)
+        with turn_deadline(30):
+            tool.invoke({"queries": ["focus", "habits", "rest"]})
+
+    assert len(time_left) == 3 and all(t is not None and t <= 30 for t in time_left)
+
+
+def test_multi_query_turn_takes_one_search_iteration(monkeypatch):
+    monkeypatch.setenv("AUTH_TOKEN", "test-token")
+    monkeypatch.setenv("SEARCH_CACHE_ENABLED", "false")
+
+    with StubSearchServer(results=hits_for) as server:
+        service = make_agent_service(server.url, search_queries=["focus", "habits", "rest"])
+        response = asyncio.run(service.achat("How do I get more done?", "thread-multi"))
+
+    assert "(with knowledge)" in response
+    assert service.llm.call_count == 2
+    assert server.request_count == 3
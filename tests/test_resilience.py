@@ -0,0 +1,172 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from google.api_core.exceptions import ServiceUnavailable
+from langchain_core.messages import ToolMessage
+
+import main
+from resilience import CircuitBreaker, CircuitOpenError, DeadlineExceeded, OutboundPolicy, turn_deadline
+from tests.fakes import StubSearchServer, make_agent_service
+from tool_search import NO_KNOWLEDGE_MESSAGE, SearchClient, create_search_tool
+
+
+def fast_policy(**kwargs) -> OutboundPolicy:
+    kwargs.setdefault("backoff", 0.01)
+    return OutboundPolicy("search", **kwargs)
+
+
+def test_transient_errors_are_retried(monkeypatch):
+    monkeypatch.setenv("AUTH_TOKEN", "test-token")
+    with StubSearchServer(fail_first=2) as server:
+        client = SearchClient(server.url, policy=fast_policy(max_attempts=3))
+        results = asyncio.run(client.asearch("creative blocks"))
+        sync_results = SearchClient(server.url, policy=fast_policy()).search("creative blocks")
+
+    assert results and sync_results
+    assert server.request_count == 4
+    assert client.policy.get_stats()["retries"] == 2
+
+
+def test_client_errors_are_not_retried(monkeypatch):
+    monkeypatch.setenv("AUTH_TOKEN", "test-token")
+    with StubSearchServer(fail_first=5, error_status=400) as server:
+        client = SearchClient(server.url, policy=fast_policy(max_attempts=3))
+        with pytest.raises(httpx.HTTPStatusError):
+            asyncio.run(client.asearch("creative blocks"))
+
+    assert server.request_count == 1
+    assert client.policy.breaker is None or client.policy.breaker.state == "closed"
+
+
+def test_attempts_are_cut_to_the_budget(monkeypatch):
+    monkeypatch.setenv("AUTH_TOKEN", "test-token")
+    with StubSearchServer(latency=2.0) as server:
+        client = SearchClient(server.url, policy=fast_policy(budget=0.5, attempt_timeout=0.2, max_attempts=5))
+        tool = create_search_tool(server.url, client)
+
+        start = time.perf_counter()
+        result = asyncio.run(tool.ainvoke({"query": "creative blocks"}))
+        elapsed = time.perf_counter() - start
+
+        # The turn's deadline wins over a larger budget of the call's own
+        client = SearchClient(server.url, policy=fast_policy(budget=10.0, attempt_timeout=5.0))
+
+        async def within_turn():
+            with turn_deadline(0.3):
+                await client.asearch("creative blocks")
+
+        start = time.perf_counter()
+        with pytest.raises((asyncio.TimeoutError, httpx.TimeoutException, DeadlineExceeded)):
+            asyncio.run(within_turn())
+        turn_elapsed = time.perf_counter() - start
+
+    assert result == NO_KNOWLEDGE_MESSAGE
+    assert elapsed < 0.8
+    assert turn_elapsed < 0.6
+
+
+def test_slow_request_is_hedged(monkeypatch):
+    monkeypatch.setenv("AUTH_TOKEN", "test-token")
+    with StubSearchServer(slow_first=1, slow_latency=1.0) as server:
+        client = SearchClient(server.url, policy=fast_policy(hedge_after=0.05))
+
+        start = time.perf_counter()
+        results = asyncio.run(client.asearch("creative blocks"))
+        elapsed = time.perf_counter() - start
+
+    assert results
+    assert elapsed < 0.5
+    stats = client.policy.get_stats()
+    assert stats["hedges"] == 1 and stats["hedge_wins"] == 1
+
+
+def test_circuit_breaker_opens_and_recovers():
+    breaker = CircuitBreaker("search", failure_threshold=2, reset_timeout=0.1)
+    breaker.record_failure()
+    breaker.check()
+    breaker.record_failure()
+
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+
+    time.sleep(0.1)
+    assert breaker.check() is True
+    # Only one probe at a time
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.get_stats()["circuit_opened"] == 1
+
+
+def test_search_outage_falls_back_to_answers_without_knowledge(monkeypatch):
+    monkeypatch.setenv("AUTH_TOKEN", "test-token")
+    monkeypatch.setenv("SEARCH_CACHE_ENABLED", "false")
+    monkeypatch.setenv("SEARCH_MAX_ATTEMPTS", "1")
+    monkeypatch.setenv("SEARCH_BREAKER_FAILURES", "2")
+    monkeypatch.setenv("SEARCH_BREAKER_RESET", "0.3")
+
+    with StubSearchServer(error_rate=1.0) as server:
+        service = make_agent_service(server.url, search_query="{message}")
+
+        async def turns(count: int, thread_id: str):
+            return [await service.achat(f"Question {i}", f"{thread_id}-{i}") for i in range(count)]
+
+        asyncio.run(turns(2, "failing"))
+        state = asyncio.run(service.agent.aget_state({"configurable": {"thread_id": "failing-0"}}))
+        tool_results = [m.content for m in state.values["messages"] if isinstance(m, ToolMessage)]
+        assert tool_results == [NO_KNOWLEDGE_MESSAGE]
+
+        # Open: turns skip the tool and answer in one model call
+        calls_before = service.llm.call_count
+        responses = asyncio.run(turns(3, "open"))
+        assert server.request_count == 2
+        assert service.llm.call_count - calls_before == 3
+        assert all("(with knowledge)" not in r for r in responses)
+
+        server.error_rate = 0.0
+        time.sleep(0.3)
+        responses = asyncio.run(turns(2, "recovered"))
+
+    assert all("(with knowledge)" in r for r in responses)
+    stats = service.get_stats()["search_calls"]
+    assert stats["circuit_state"] == "closed" and stats["circuit_opened"] == 1
+
+
+def test_failing_model_opens_circuit_and_returns_503(monkeypatch):
+    monkeypatch.setenv("LLM_BREAKER_FAILURES", "2")
+    service = make_agent_service(error=ServiceUnavailable("model overloaded"))
+    monkeypatch.setattr(main, "agent_service", service)
+
+    client = TestClient(main.app)
+    statuses = [
+        client.post("/chat", json={"message": "Hello!", "thread_id": f"thread-{i}"}).status_code
+        for i in range(2)
+    ]
+    response = client.post("/chat", json={"message": "Hello!", "thread_id": "thread-3"})
+
+    assert statuses == [500, 500]
+    assert response.status_code == 503
+    assert int(response.headers["Retry-After"]) >= 1
+    assert service.llm.call_count == 2
+    assert service.get_stats()["llm_circuit"]["circuit_open"] == 1
+
+
+def test_hung_model_call_is_cut_to_the_turn_budget(monkeypatch):
+    monkeypatch.setenv("TURN_BUDGET", "0.3")
+    service = make_agent_service(latency=5.0)
+
+    async def stream():
+        return [event async for event in service.astream_chat("Hello!", "thread-stream")]
+
+    started_at = time.perf_counter()
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(service.achat("Hello!", "thread-hung"))
+    events = asyncio.run(stream())
+    elapsed = time.perf_counter() - started_at
+
+    assert elapsed < 1.5
+    assert events[-1]["event"] == "error" and isinstance(events[-1]["error"], DeadlineExceeded)
@@ -0,0 +1,112 @@
+import asyncio
+import time
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from response_cache import ResponseCache, model_fingerprint
+from tests.fakes import FakeChatModel, StubSearchServer, make_agent_service
+
+
+def test_response_cache_is_opt_in():
+    assert make_agent_service().response_cache is None
+
+
+def test_first_turn_served_from_cache(monkeypatch):
+    monkeypatch.setenv("AUTH_TOKEN", "test-token")
+    monkeypatch.setenv("RESPONSE_CACHE_ENABLED", "true")
+
+    with StubSearchServer() as server:
+        service = make_agent_service(server.url, latency=0.2, search_query="digital sovereignty")
+
+        first = asyncio.run(service.achat("What is digital sovereignty?", "thread-1"))
+        calls_after_first = service.llm.call_count
+
+        start = time.perf_counter()
+        second = asyncio.run(service.achat("what is  Digital Sovereignty", "thread-2"))
+        elapsed = time.perf_counter() - start
+
+        assert second == first
+        assert service.llm.call_count == calls_after_first
+        assert server.request_count == 1
+        assert elapsed < 0.2
+
+            # The cached exchange is in the new thread, under this user's wording, so follow-ups have context
+        asyncio.run(service.achat("Tell me more", "thread-2"))
+
+    contents = [m.content for m in service.llm.last_messages]
+    assert "what is  Digital Sovereignty" in contents
+    assert any("(with knowledge)" in c for c in contents)
+
+    stats = service.get_stats()["response_cache"]
+    assert stats["hits"] == 1
+    assert stats["saved_seconds"] > 0.2
+
+
+def test_only_first_turns_use_the_cache(monkeypatch):
+    monkeypatch.setenv("RESPONSE_CACHE_ENABLED", "true")
+    service = make_agent_service()
+
+    asyncio.run(service.achat("Hello", "thread-1"))
+    asyncio.run(service.achat("What is focus?", "thread-1"))
+    asyncio.run(service.achat("What is focus?", "thread-2"))
+
+    # The second-turn question was never cached, so thread-2 ran the model
+    assert service.llm.call_count == 3
+    assert service.response_cache.get_stats()["entries"] == 2
+
+
+def test_key_includes_prompt_and_model_config():
+    llm = FakeChatModel()
+    assert model_fingerprint("prompt", llm) != model_fingerprint("other prompt", llm)
+
+    cache = ResponseCache(model_fingerprint("prompt", llm))
+    other = ResponseCache(model_fingerprint("other prompt", llm))
+    assert cache.key("What is focus?") == cache.key("what is FOCUS")
+    assert cache.key("What is focus?") != other.key("What is focus?")
+
+
+def test_entries_expire_and_evict():
+    exchange = [HumanMessage(content="Hi", id="h1"), AIMessage(content="Hello!", id="a1")]
+
+    cache = ResponseCache("fingerprint", max_entries=2, ttl=60)
+    for message in ("one", "two", "three"):
+        cache.set(message, exchange, "Hello!", 1.0)
+    assert cache.get("one") is None
+    assert cache.get("three").messages[0].id is None
+    assert cache.get_stats()["evictions"] == 1
+
+    expiring = ResponseCache("fingerprint", ttl=0)
+    expiring.set("one", exchange, "Hello!", 1.0)
+    assert expiring.get("one") is None
+    assert expiring.get_stats()["expirations"] == 1
+
+
+def test_answers_without_knowledge_are_not_cached(monkeypatch):
+    monkeypatch.setenv("AUTH_TOKEN", "test-token")
+    monkeypatch.setenv("RESPONSE_CACHE_ENABLED", "true")
+    monkeypatch.setenv("SEARCH_CACHE_ENABLED", "false")
+    monkeypatch.setenv("SEARCH_MAX_ATTEMPTS", "1")
+    monkeypatch.setenv("SEARCH_BREAKER_FAILURES", "2")
+    monkeypatch.setenv("SEARCH_BREAKER_RESET", "0.3")
+
+    with StubSearchServer(error_rate=1.0) as server:
+        service = make_agent_service(server.url, search_query="{message}")
+
+        # The search fails: the tool tells the model to answer without knowledge
+        asyncio.run(service.achat("What is focus?", "thread-failed-1"))
+        asyncio.run(service.achat("What is focus?", "thread-failed-2"))
+        assert service.response_cache.get_stats()["entries"] == 0
+
+        # The circuit is open: the turn runs on the graph without the search tool
+        response = asyncio.run(service.achat("What is focus?", "thread-open"))
+        assert "(with knowledge)" not in response
+        assert server.request_count == 2
+        assert service.response_cache.get_stats()["entries"] == 0
+
+        server.error_rate = 0.0
+        time.sleep(0.3)
+        # Search is back: a new thread gets an answer with knowledge, and that one is cached
+        response = asyncio.run(service.achat("What is focus?", "thread-recovered"))
+
+    assert "(with knowledge)" in response
+    assert service.response_cache.get_stats()["entries"] == 1
@@ -0,0 +1,135 @@
+import asyncio
+import time
+import uuid
+
+from fastapi.testclient import TestClient
+
+import main
+from search_cache import PostgresSearchCacheBackend, SearchCache, SearchCacheBackend, normalize_query
+from tests.fakes import StubSearchServer, make_agent_service
+from tests.test_compaction import DATABASE_URL, count_rows, drop_tables, requires_postgres
+from tool_search import SearchClient, create_search_tool
+
+RESULTS = [{"book_id": "deep-work", "page_number": 40, "content": "Focus is a skill that compounds."}]
+
+
+class DictBackend(SearchCacheBackend):
+    def __init__(self):
+        self.store = {}
+
+    def get(self, key):
+        return self.store.get(key)
+
+    def set(self, key, results, ttl):
+        self.store[key] = results
+
+
+def test_normalize_query():
+    assert normalize_query("Creative blocks, problem solving & motivation") == \
+        normalize_query("motivation for problem solving and the creative blocks")
+    assert normalize_query("What is digital sovereignty?") == "digital sovereignty"
+
+
+def test_normalize_query_never_collapses_distinct_queries_to_one_key():
+    queries = ["Что такое цифровой суверенитет", "Цифровой суверенитет", "创意障碍", "リーダーシップ",
+               "What is it?", "Who are they?", "?!"]
+    keys = [normalize_query(q) for q in queries]
+
+    assert keys[0] == normalize_query("цифровой суверенитет, что такое") == "суверенитет такое цифровой что"
+    assert all(keys) and len(set(keys)) == len(queries)
+    assert normalize_query("  What   IS it? ") == "what is it?"
+
+    cache = SearchCache()
+    cache.set("创意障碍", RESULTS)
+    assert cache.get("リーダーシップ") is None
+    assert cache.get("What is it?") is None
+
+
+def test_lru_eviction_by_entries():
+    cache = SearchCache(max_entries=2)
+    cache.set("alpha", RESULTS)
+    cache.set("beta", RESULTS)
+    cache.get("alpha")
+    cache.set("gamma", RESULTS)
+
+    assert cache.get("beta") is None
+    assert cache.get("alpha") == RESULTS
+    assert cache.get_stats()["evictions"] == 1
+
+
+def test_eviction_by_bytes():
+    cache = SearchCache(max_bytes=200)
+    for query in ["one", "two", "three", "four"]:
+        cache.set(query, RESULTS)
+
+    stats = cache.get_stats()
+    assert stats["bytes"] <= 200
+    assert stats["evictions"] >= 2
+
+
+def test_ttl_expiry():
+    cache = SearchCache(ttl=0.05)
+    cache.set("digital sovereignty", RESULTS)
+    assert cache.get("digital sovereignty") == RESULTS
+
+    time.sleep(0.1)
+    assert cache.get("digital sovereignty") is None
+    assert cache.get_stats()["expirations"] == 1
+
+
+def test_shared_backend_fills_local_cache():
+    backend = DictBackend()
+    SearchCache(backend=backend).set("digital sovereignty", RESULTS)
+
+    other_instance = SearchCache(backend=backend)
+    assert asyncio.run(other_instance.aget("sovereignty, digital")) == RESULTS
+    assert other_instance.get_stats()["backend_hits"] == 1
+
+
+def test_search_tool_uses_cache(monkeypatch):
+    monkeypatch.setenv("AUTH_TOKEN", "test-token")
+    cache = SearchCache()
+
+    with StubSearchServer() as server:
+        tool = create_search_tool(server.url, SearchClient(server.url), cache)
+        tool.invoke({"query": "creative blocks problem solving motivation"})
+        asyncio.run(tool.ainvoke({"query": "Motivation: creative blocks & problem solving"}))
+
+    assert server.request_count == 1
+    assert cache.get_stats()["hits"] == 1
+
+
+def test_stats_endpoint(monkeypatch):
+    monkeypatch.setattr(main, "agent_service", make_agent_service())
+
+    response = TestClient(main.app).get("/stats")
+
+    assert response.status_code == 200
+    assert response.json()["search_cache"]["misses"] == 0
+
+
+@requires_postgres
+def test_postgres_backend_leaves_the_ddl_to_init():
+    from langchain_google_cloud_sql_pg import PostgresEngine
+
+    table_name = f"search_cache_{uuid.uuid4().hex[:8]}"
+
+    async def run():
+        engine = PostgresEngine.from_engine_args(DATABASE_URL)
+        backend = PostgresSearchCacheBackend(engine, table_name=table_name)
+        try:
+            # No table yet: reads and writes fail soft instead of creating it on the request path
+            await backend.aset("deep work", RESULTS, ttl=60)
+            before = await backend.aget("deep work")
+
+            await backend.ainit_table()
+            await backend.aset("deep work", RESULTS, ttl=60)
+            return before, await backend.aget("deep work"), await count_rows(engine, table_name)
+        finally:
+            await drop_tables(engine, table_name)
+
+    before, after, rows = asyncio.run(run())
+
+    assert before is None
+    assert after == RESULTS
+    assert rows == 1
@@ -0,0 +1,112 @@
+import asyncio
+import base64
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from auth import IdTokenCache
+from tests.fakes import StubSearchServer
+from tool_search import SearchClient, create_search_tool
+
+
+def make_token(expires_in: float) -> str:
+    def encode(data: dict) -> str:
+        return base64.urlsafe_b64encode(json.dumps(data).encode()).decode().rstrip("=")
+
+    return f"{encode({'alg': 'RS256'})}.{encode({'exp': time.time() + expires_in})}.signature"
+
+
+class CountingFetcher:
+    def __init__(self, expires_in: float):
+        self.expires_in = expires_in
+        self.calls = 0
+
+    def __call__(self, audience: str) -> str:
+        self.calls += 1
+        # A metadata-server round trip
+        time.sleep(0.05)
+        return make_token(self.expires_in)
+
+
+def test_id_token_cached_per_audience(monkeypatch):
+    monkeypatch.delenv("AUTH_TOKEN", raising=False)
+    fetcher = CountingFetcher(expires_in=3600)
+    cache = IdTokenCache(fetch=fetcher)
+
+    tokens = {cache.get("https://search") for _ in range(10)}
+    cache.get("https://other")
+
+    assert len(tokens) == 1
+    assert fetcher.calls == 2
+
+
+def test_concurrent_first_requests_fetch_one_token(monkeypatch):
+    monkeypatch.delenv("AUTH_TOKEN", raising=False)
+    fetcher = CountingFetcher(expires_in=3600)
+    cache = IdTokenCache(fetch=fetcher)
+
+    with ThreadPoolExecutor(max_workers=10) as executor:
+        tokens = set(executor.map(lambda _: cache.get("https://search"), range(10)))
+
+    assert len(tokens) == 1
+    assert fetcher.calls == 1
+
+
+def test_id_token_refreshed_in_background_before_expiry(monkeypatch):
+    monkeypatch.delenv("AUTH_TOKEN", raising=False)
+    fetcher = CountingFetcher(expires_in=60)
+    cache = IdTokenCache(fetch=fetcher, refresh_margin=300)
+
+    first = cache.get("https://search")
+    # Inside the refresh margin the cached token is served while a refresh runs
+    assert cache.get("https://search") == first
+
+    deadline = time.time() + 2
+    while fetcher.calls < 2 and time.time() < deadline:
+        time.sleep(0.01)
+    assert fetcher.calls == 2
+
+
+def test_search_client_reuses_connection(monkeypatch):
+    monkeypatch.setenv("AUTH_TOKEN", "test-token")
+
+    with StubSearchServer() as server:
+        tool = create_search_tool(server.url, SearchClient(server.url))
+        for _ in range(5):
+            tool.invoke({"query": "digital sovereignty"})
+
+        async def run_async():
+            for _ in range(5):
+                await tool.ainvoke({"query": "digital sovereignty"})
+
+        asyncio.run(run_async())
+
+    assert server.request_count == 10
+    # One keep-alive connection for the sync client and one for the async client
+    assert len(server.connections) == 2
+
+
+def test_async_client_is_closed_with_its_event_loop(monkeypatch):
+    monkeypatch.setenv("AUTH_TOKEN", "test-token")
+    client = SearchClient("http://unused")
+    used = []
+
+    async def run():
+        used.append(client._get_async_client())
+        assert client._get_async_client() is used[-1]
+
+    with StubSearchServer() as server:
+        client.search_service_url = server.url
+        asyncio.run(run())
+        # The first loop is gone: its pool was closed before it was, and the next loop gets a new client
+        asyncio.run(run())
+        assert used[0].is_closed and used[0] is not used[1]
+
+        async def close():
+            await client.asearch("digital sovereignty")
+            used.append(client._async_client)
+            await client.aclose()
+            return [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+
+        assert asyncio.run(close()) == []
+    assert used[2].is_closed
@@ -0,0 +1,70 @@
+import asyncio
+import time
+
+from search_gate import AGENT, DIRECT, PREFETCH, SearchGate
+from tests.fakes import StubSearchServer, make_agent_service
+
+
+def test_gate_routes_by_message():
+    gate = SearchGate()
+
+    assert gate.route("Thank you!") == DIRECT
+    assert gate.route("Good morning! How are you?") == DIRECT
+    assert gate.route("What is my favorite programming language?") == DIRECT
+    assert gate.route("Hmm, I'm not sure about that") == AGENT
+    assert gate.route("How do I lead a remote team through a big change?") == PREFETCH
+    assert gate.get_stats()[DIRECT] == 3
+
+
+def test_topic_cues_are_configured(monkeypatch):
+    message = "Sovereignty"
+    assert SearchGate().route(message) == DIRECT
+
+    monkeypatch.setenv("SEARCH_GATE_ENABLED", "true")
+    monkeypatch.setenv("SEARCH_GATE_TOPIC_CUES", "Sovereignty, network")
+    assert SearchGate.from_env().route(message) == AGENT
+
+
+def test_gate_is_opt_in():
+    assert make_agent_service().search_gate is None
+
+
+def test_trivial_turn_skips_tools(monkeypatch):
+    monkeypatch.setenv("AUTH_TOKEN", "test-token")
+    monkeypatch.setenv("SEARCH_GATE_ENABLED", "true")
+
+    with StubSearchServer() as server:
+        # This model searches on every turn it can
+        service = make_agent_service(server.url, search_query="{message}")
+
+        asyncio.run(service.achat("What is digital sovereignty?", "thread-1"))
+        calls = service.llm.call_count
+        response = asyncio.run(service.achat("Thank you!", "thread-1"))
+
+    assert service.llm.call_count == calls + 1
+    assert server.queries == ["What is digital sovereignty?"]
+    assert response.endswith("You said: Thank you!")
+
+    # Both routes write the same thread
+    contents = [m.content for m in service.llm.last_messages]
+    assert "What is digital sovereignty?" in contents
+    assert service.get_stats()["search_gate"][DIRECT] == 1
+
+
+def test_likely_search_is_prefetched(monkeypatch):
+    monkeypatch.setenv("AUTH_TOKEN", "test-token")
+    monkeypatch.setenv("SEARCH_GATE_ENABLED", "true")
+
+    with StubSearchServer(latency=0.3) as server:
+        service = make_agent_service(server.url, latency=0.3, search_query="{message}")
+        # The first turn of a process pays for client setup
+        asyncio.run(service.achat("What is deep work?", "thread-0"))
+
+        start = time.perf_counter()
+        response = asyncio.run(service.achat("How can I focus better when working from home?", "thread-1"))
+        elapsed = time.perf_counter() - start
+
+    assert response.endswith("(with knowledge)")
+    # The model's searches joined the ones started alongside its first call
+    assert server.request_count == 2
+    assert elapsed < 0.8
@@ -0,0 +1,72 @@
+import asyncio
+import time
+
+from search_prefetch import query_overlap
+from tests.fakes import StubSearchServer, make_agent_service
+
+
+def test_query_overlap_ignores_filler_and_order():
+    assert query_overlap("What is digital sovereignty?", "sovereignty, digital") == 1.0
+    assert query_overlap("I'm feeling stuck", "creative blocks motivation") == 0.0
+
+
+def test_similar_query_claims_the_prefetch(monkeypatch):
+    monkeypatch.setenv("AUTH_TOKEN", "test-token")
+    monkeypatch.setenv("SEARCH_PREFETCH", "always")
+
+    with StubSearchServer(latency=0.3) as server:
+        service = make_agent_service(server.url, latency=0.3, search_query="{message} explained")
+        # The first turn of a process pays for client setup
+        asyncio.run(service.achat("What is deep work?", "thread-1"))
+
+        start = time.perf_counter()
+        response = asyncio.run(service.achat("What is digital sovereignty?", "thread-2"))
+        elapsed = time.perf_counter() - start
+
+    assert response.endswith("(with knowledge)")
+    assert server.queries == ["What is deep work?", "What is digital sovereignty?"]
+    # Search ran under the first model call instead of after it
+    assert elapsed < 0.8
+    stats = service.get_stats()["search_prefetch"]
+    assert stats["hits"] == 2 and stats["hit_rate"] == 1.0
+
+
+def test_unused_prefetch_is_cancelled(monkeypatch):
+    monkeypatch.setenv("AUTH_TOKEN", "test-token")
+    monkeypatch.setenv("SEARCH_PREFETCH", "always")
+
+    with StubSearchServer(latency=1.0) as server:
+        # This model answers without searching
+        service = make_agent_service(server.url, latency=0.1)
+
+        start = time.perf_counter()
+        asyncio.run(service.achat("What is digital sovereignty?", "thread-1"))
+        elapsed = time.perf_counter() - start
+
+    assert elapsed < 0.5
+    stats = service.get_stats()["search_prefetch"]
+    assert stats["wasted"] == 1 and stats["cancelled"] == 1 and stats["hits"] == 0
+
+
+def test_dissimilar_query_searches_on_its_own(monkeypatch):
+    monkeypatch.setenv("AUTH_TOKEN", "test-token")
+    monkeypatch.setenv("SEARCH_PREFETCH", "always")
+
+    with StubSearchServer() as server:
+        service = make_agent_service(server.url, latency=0.1, search_query="creative blocks motivation")
+        asyncio.run(service.achat("I'm feeling stuck on this project", "thread-1"))
+
+    assert "creative blocks motivation" in server.queries
+    assert service.get_stats()["search_prefetch"]["wasted"] == 1
+
+
+def test_short_follow_up_is_prefetched_with_context(monkeypatch):
+    monkeypatch.setenv("AUTH_TOKEN", "test-token")
+    monkeypatch.setenv("SEARCH_PREFETCH", "always")
+
+    with StubSearchServer() as server:
+        service = make_agent_service(server.url, latency=0.2)
+        asyncio.run(service.achat("What is deep work?", "thread-1"))
+        asyncio.run(service.achat("And for teams?", "thread-1"))
+
+    assert server.queries == ["What is deep work?", "What is deep work? And for teams?"]
@@ -0,0 +1,92 @@
+import asyncio
+import os
+import subprocess
+import sys
+
+from fastapi.testclient import TestClient
+
+import main
+from startup import ServiceLoader
+from tests.fakes import make_agent_service
+
+
+def use_loader(monkeypatch, factory, mode="background"):
+    monkeypatch.setenv("STARTUP_MODE", mode)
+    monkeypatch.setattr(main, "agent_service", None)
+    monkeypatch.setattr(main, "service_loader", ServiceLoader(factory))
+
+
+def test_health_answers_while_service_loads(monkeypatch):
+    release = asyncio.Event()
+
+    async def slow_factory(loader):
+        await release.wait()
+        return make_agent_service()
+
+    use_loader(monkeypatch, slow_factory)
+
+    with TestClient(main.app) as client:
+        health = client.get("/")
+        assert health.status_code == 200
+        assert health.json()["ready"] is False
+        assert client.get("/ready").status_code == 503
+
+        client.portal.call(release.set)
+        # Requests that arrive during startup wait for the service
+        response = client.post("/chat", json={"message": "Hello!", "thread_id": "thread-startup"})
+        assert response.status_code == 200
+        assert client.get("/ready").status_code == 200
+        assert client.get("/").json()["ready"] is True
+
+
+def test_blocking_mode_is_ready_before_serving(monkeypatch):
+    async def factory(loader):
+        return make_agent_service()
+
+    use_loader(monkeypatch, factory, mode="blocking")
+
+    with TestClient(main.app) as client:
+        assert client.get("/ready").status_code == 200
+
+
+def test_startup_failure_is_reported(monkeypatch):
+    async def broken_factory(loader):
+        raise RuntimeError("cloud sql unreachable")
+
+    use_loader(monkeypatch, broken_factory)
+
+    with TestClient(main.app) as client:
+        response = client.post("/chat", json={"message": "Hello!", "thread_id": "thread-broken"})
+        assert response.status_code == 503
+        assert "cloud sql unreachable" in client.get("/").json()["error"]
+
+
+def test_importing_main_defers_heavy_imports():
+    src = os.path.join(os.path.dirname(__file__), '..', 'src')
+    code = "import sys, main; print(any(m.startswith(('langchain_google', 'langgraph')) for m in sys.modules))"
+    output = subprocess.check_output([sys.executable, "-c", code], cwd=src, text=True)
+    assert output.strip() == "False"
+
+
+def test_worker_count(monkeypatch):
+    from serve import available_cpus, get_worker_count
+
+    monkeypatch.setenv("WORKERS", "auto")
+    assert get_worker_count() == available_cpus() >= 1
+    assert get_worker_count("3") == 3
+    monkeypatch.delenv("WORKERS")
+    assert get_worker_count() == 1
+
+
+def test_forked_worker_builds_its_own_service(monkeypatch):
+    monkeypatch.setattr(main, "agent_service", make_agent_service())
+    parent_loader = main.service_loader
+
+    pid = os.fork()
+    if pid == 0:
+        fresh = main.agent_service is None and main.service_loader is not parent_loader
+        os._exit(0 if fresh else 1)
+
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+    assert main.agent_service is not None
@@ -0,0 +1,69 @@
+import asyncio
+import json
+import time
+
+from fastapi.testclient import TestClient
+
+import main
+from tests.fakes import StubSearchServer, make_agent_service
+
+LONG_ANSWER = " ".join(["word"] * 40)
+
+
+async def collect(service, message, thread_id):
+    events = []
+    start = time.perf_counter()
+    async for event in service.astream_chat(message, thread_id):
+        events.append((time.perf_counter() - start, event))
+    return events
+
+
+def test_first_token_arrives_before_full_answer():
+    # ~0.05s to first token, then 40 tokens 0.05s apart: ~2s for the full answer
+    service = make_agent_service(latency=0.05, token_latency=0.05, answer=LONG_ANSWER)
+
+    events = asyncio.run(collect(service, "Tell me something long", "thread-ttfb"))
+
+    first_token_at = next(t for t, e in events if e["event"] == "token")
+    done_at = events[-1][0]
+    assert events[-1][1]["event"] == "done"
+    assert first_token_at < 0.5
+    assert done_at > 1.5
+
+
+def test_stream_reports_tool_calls_and_persists_checkpoint(monkeypatch):
+    monkeypatch.setenv("AUTH_TOKEN", "test-token")
+
+    with StubSearchServer() as server:
+        service = make_agent_service(server.url, search_query="creative blocks")
+        events = asyncio.run(collect(service, "I'm stuck on a project", "thread-stream"))
+
+    kinds = [e["event"] for _, e in events]
+    assert kinds[0] == "tool_start"
+    assert kinds[1] == "tool_end"
+    assert set(kinds[2:-1]) == {"token"}
+    assert kinds[-1] == "done"
+
+    streamed = "".join(e["data"]["content"] for _, e in events if e["event"] == "token")
+    assert streamed == events[-1][1]["data"]["response"]
+
+    state = service._checkpointer.get_tuple({"configurable": {"thread_id": "thread-stream"}})
+    messages = state.checkpoint["channel_values"]["messages"]
+    assert [m.type for m in messages] == ["human", "ai", "tool", "ai"]
+
+
+def test_chat_stream_endpoint(monkeypatch):
+    monkeypatch.setattr(main, "agent_service", make_agent_service())
+
+    client = TestClient(main.app)
+    with client.stream("POST", "/chat/stream", json={"message": "Hello!", "thread_id": "thread-sse"}) as response:
+        assert response.headers["content-type"].startswith("text/event-stream")
+        body = "".join(response.iter_text())
+
+    events = []
+    for block in body.strip().split("\n\n"):
+        event_line, data_line = block.split("\n")
+        events.append((event_line[len("event: "):], json.loads(data_line[len("data: "):])))
+
+    assert events[-1][0] == "done"
+    assert "Hello!" in events[-1][1]["response"]
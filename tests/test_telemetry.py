@@ -0,0 +1,51 @@
+import asyncio
+import json
+
+from fastapi.testclient import TestClient
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+
+import main
+from telemetry import JsonLinesSpanExporter, configure_tracing
+from tests.fakes import StubSearchServer, make_agent_service
+
+
+def test_chat_is_traced_per_phase(monkeypatch, tmp_path):
+    monkeypatch.setenv("AUTH_TOKEN", "test-token")
+    exporter = configure_tracing(InMemorySpanExporter())
+
+    with StubSearchServer() as server:
+        service = make_agent_service(server.url, search_query="creative blocks")
+        asyncio.run(service.achat("I'm stuck on a project", "thread-traced"))
+
+    spans = exporter.get_finished_spans()
+    root = next(s for s in spans if s.name == "chat" and s.attributes["chat.thread_id"] == "thread-traced")
+    turn = [s for s in spans if s.context.trace_id == root.context.trace_id]
+    names = [s.name for s in turn]
+
+    assert names.count("llm") == 2
+    assert "tool.search_knowledge" in names
+    assert "search.http" in names
+    assert "checkpoint.aget_tuple" in names
+    assert "checkpoint.aput" in names
+    assert root.attributes["react.iterations"] == 2
+    assert root.attributes["llm.input_tokens"] > 0
+    assert root.attributes["llm.output_tokens"] > 0
+
+    path = tmp_path / "traces.jsonl"
+    JsonLinesSpanExporter(str(path)).export(turn)
+    assert [json.loads(line)["name"] for line in path.read_text().splitlines()] == names
+
+
+def test_metrics_endpoint(monkeypatch):
+    monkeypatch.setattr(main, "agent_service", make_agent_service())
+
+    client = TestClient(main.app)
+    client.post("/chat", json={"message": "Hello!", "thread_id": "thread-metrics"})
+    body = client.get("/metrics").text
+
+    assert 'book_agent_chat_seconds_count{mode="achat",status="ok"}' in body
+    assert 'book_agent_phase_seconds_bucket{le="0.005",phase="llm"}' in body
+    assert 'book_agent_phase_seconds_count{phase="checkpoint_write"}' in body
+    assert 'book_agent_llm_tokens_total{kind="output"}' in body
+    assert "book_agent_react_iterations_count" in body
+    assert "book_agent_search_cache_entries" in body
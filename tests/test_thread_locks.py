@@ -0,0 +1,230 @@
+import asyncio
+import os
+import time
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+from langchain_core.messages import AIMessage, HumanMessage
+
+import main
+from thread_locks import ThreadBusyError
+from tests.fakes import make_agent_service
+
+DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+requires_postgres = pytest.mark.skipif(
+    not DATABASE_URL, reason="set TEST_DATABASE_URL to a postgresql+asyncpg:// URL"
+)
+
+
+async def turns_in_checkpoint(service, thread_id: str) -> list:
+    """(question, answer) pairs of the thread, asserting every question got exactly its own answer."""
+    state = await service.agent.aget_state({"configurable": {"thread_id": thread_id}})
+    messages = state.values["messages"]
+    pairs = []
+    for question, answer in zip(messages[::2], messages[1::2]):
+        assert isinstance(question, HumanMessage) and isinstance(answer, AIMessage)
+        assert answer.content.endswith(f"You said: {question.content}")
+        pairs.append((question.content, answer.content))
+    assert len(messages) == 2 * len(pairs)
+    return pairs
+
+
+def test_same_thread_turns_run_one_at_a_time():
+    service = make_agent_service(latency=0.1)
+
+    async def run():
+        return await asyncio.gather(*[service.achat(f"Message {i}", "thread-1") for i in range(5)])
+
+    start = time.perf_counter()
+    responses = asyncio.run(run())
+    elapsed = time.perf_counter() - start
+
+    assert elapsed >= 0.5
+    assert [r.split("You said: ")[1] for r in responses] == [f"Message {i}" for i in range(5)]
+    assert len(asyncio.run(turns_in_checkpoint(service, "thread-1"))) == 5
+    assert service.get_stats()["thread_locks"]["contended"] == 4
+
+
+def test_sync_and_async_turns_on_a_thread_run_one_at_a_time():
+    service = make_agent_service(latency=0.2)
+
+    async def run():
+        sync_turn = asyncio.to_thread(service.chat, "Sync message", "thread-mixed")
+        await asyncio.sleep(0.05)
+        return await asyncio.gather(sync_turn, service.achat("Async message", "thread-mixed"))
+
+    start = time.perf_counter()
+    asyncio.run(run())
+    elapsed = time.perf_counter() - start
+
+    assert elapsed >= 0.4
+    assert [q for q, _ in asyncio.run(turns_in_checkpoint(service, "thread-mixed"))] == [
+        "Sync message", "Async message"
+    ]
+
+
+def test_different_threads_run_in_parallel():
+    service = make_agent_service(latency=0.2)
+
+    async def run():
+        await asyncio.gather(*[service.achat("Hello", f"thread-{i}") for i in range(10)])
+
+    start = time.perf_counter()
+    asyncio.run(run())
+    assert time.perf_counter() - start < 0.5
+    assert service.get_stats()["thread_locks"]["active_threads"] == 0
+
+
+def test_queue_per_thread_is_bounded(monkeypatch):
+    monkeypatch.setenv("THREAD_LOCK_MAX_WAITING", "1")
+    service = make_agent_service(latency=0.3)
+
+    async def run():
+        return await asyncio.gather(
+            *[service.achat(f"Message {i}", "thread-1") for i in range(3)], return_exceptions=True
+        )
+
+    # One turn runs, one waits, the third is turned away
+    outcomes = asyncio.run(run())
+    assert sum(isinstance(o, ThreadBusyError) for o in outcomes) == 1
+    assert service.get_stats()["thread_locks"]["rejected"] == 1
+
+
+def test_busy_thread_returns_429(monkeypatch):
+    service = make_agent_service()
+
+    async def busy(message, thread_id):
+        raise ThreadBusyError(thread_id, "1 turns already waiting")
+
+    monkeypatch.setattr(service, "achat", busy)
+    monkeypatch.setattr(main, "agent_service", service)
+
+    client = TestClient(main.app)
+    response = client.post("/chat", json={"message": "Hello!", "thread_id": "thread-http"})
+
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "1"
+
+
+def test_back_to_back_messages_are_coalesced(monkeypatch):
+    monkeypatch.setenv("THREAD_COALESCE", "true")
+    service = make_agent_service(latency=0.2)
+
+    async def run():
+        first = asyncio.ensure_future(service.achat("I have a question", "thread-1"))
+        await asyncio.sleep(0.05)
+        # Both arrive while the first turn runs: they become one turn
+        rest = await asyncio.gather(service.achat("about habits", "thread-1"), service.achat("and focus", "thread-1"))
+        return [await first, *rest]
+
+    first, second, third = asyncio.run(run())
+
+    assert service.llm.call_count == 2
+    assert second == third
+    assert second.endswith("You said: and focus")
+    state = asyncio.run(service.agent.aget_state({"configurable": {"thread_id": "thread-1"}}))
+    assert [type(m).__name__ for m in state.values["messages"]] == [
+        "HumanMessage", "AIMessage", "HumanMessage", "HumanMessage", "AIMessage"
+    ]
+    assert service.get_stats()["thread_locks"]["coalesced"] == 1
+
+
+def test_checkpoints_stay_consistent_under_contention(monkeypatch):
+    monkeypatch.setenv("THREAD_LOCK_MAX_WAITING", "50")
+    service = make_agent_service(latency=0.01)
+
+    async def run():
+        await asyncio.gather(*[
+            service.achat(f"Message {i} for thread {t}", f"thread-{t}")
+            for i in range(20) for t in range(10)
+        ])
+        return [await turns_in_checkpoint(service, f"thread-{t}") for t in range(10)]
+
+    for pairs in asyncio.run(run()):
+        assert len(pairs) == 20
+
+
+@requires_postgres
+def test_advisory_locks_serialize_across_instances():
+    from langchain_google_cloud_sql_pg import PostgresEngine, PostgresSaver
+    from agent_service import AgentService
+    from tests.fakes import FakeChatModel
+
+    table_name = f"checkpoints_{uuid.uuid4().hex[:8]}"
+    thread_id = f"thread-{uuid.uuid4().hex[:8]}"
+
+    async def make_instance(init: bool):
+        engine = PostgresEngine.from_engine_args(DATABASE_URL)
+        if init:
+            await engine.ainit_checkpoint_table(table_name=table_name)
+        checkpointer = await PostgresSaver.create(engine, table_name=table_name)
+        return AgentService(
+            project_id="test-project",
+            search_service_url="http://127.0.0.1:9",
+            llm=FakeChatModel(latency=0.05),
+            checkpointer=checkpointer,
+            engine=engine,
+        )
+
+    async def run():
+        # Two services with their own engines stand in for two Cloud Run instances
+        first = await make_instance(init=True)
+        second = await make_instance(init=False)
+        try:
+            await asyncio.gather(*[
+                (first if i % 2 else second).achat(f"Message {i}", thread_id) for i in range(12)
+            ])
+            return await turns_in_checkpoint(first, thread_id)
+        finally:
+            from tests.test_compaction import drop_tables
+            await second.engine.close()
+            await drop_tables(first.engine, table_name)
+
+    assert len(asyncio.run(run())) == 12
+
+
+@requires_postgres
+def test_advisory_locks_survive_cancelled_statements_and_lost_sessions():
+    from langchain_google_cloud_sql_pg import PostgresEngine
+    from sqlalchemy import text
+    from thread_locks import PostgresAdvisoryLocks
+
+    async def run():
+        ours = PostgresAdvisoryLocks(PostgresEngine.from_engine_args(DATABASE_URL))
+        theirs = PostgresAdvisoryLocks(PostgresEngine.from_engine_args(DATABASE_URL))
+        held, contended = f"held-{uuid.uuid4().hex[:8]}", f"contended-{uuid.uuid4().hex[:8]}"
+        try:
+            assert await ours.acquire(held, 1.0)
+            assert await theirs.acquire(contended, 1.0)
+
+            # A turn giving up while polling for another thread doesn't cost `held` its lock
+            waiting = asyncio.ensure_future(ours.acquire(contended, 5.0))
+            await asyncio.sleep(0.2)
+            waiting.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await waiting
+            assert not await theirs.acquire(held, 0.0)
+
+            # Losing the session takes the locks with it; they are taken again for the running turn
+            async def terminate_session():
+                pid = (await ours._conn.execute(text("SELECT pg_backend_pid()"))).scalar()
+                await ours._conn.commit()
+                async with theirs.engine._pool.connect() as conn:
+                    await conn.execute(text("SELECT pg_terminate_backend(:pid)"), {"pid": pid})
+
+            await ours.engine._run_as_async(terminate_session())
+            await theirs.release(contended)
+            with pytest.raises(Exception):
+                await ours.acquire(contended, 1.0)
+            assert not await theirs.acquire(held, 0.0)
+            assert ours.get_stats() == {"held": 1, "sessions_lost": 1, "locks_lost": 0}
+
+            await ours.release(held)
+            assert await theirs.acquire(held, 1.0)
+            await theirs.release(held)
+        finally:
+            await ours.engine.close()
+            await theirs.engine.close()
+
+    asyncio.run(run())